@@ -0,0 +1,181 @@
+import csv
+import os
+import time
+
+import numpy as np
+
+from src.config import compression_choices_config, posting_block_size, default_index_title, \
+    output_codec_benchmark_file
+from src.modules.compression import encode_numbers, decode_numbers, decode_posting_blocks, first_previous_docid, \
+    bit_level_codecs
+from src.modules.InvertedIndex import load_from_disk
+from src.modules.Lexicon import load_lexicon
+from src.modules.utils import print_log
+
+'''
+benchmark of the integer codecs used to compress the posting lists.
+each codec of compression_choices_config is run on the same data: synthetic posting lists (docid gaps with a Zipfian
+distribution, and small frequencies) and real posting lists read from an index on disk.
+like in the index files, each list is encoded in blocks of posting_block_size numbers.
+the results are written as a csv table (one row for each dataset and codec) in output_codec_benchmark_file:
+    dataset, codec, lists, integers, bytes, bits_per_int, encode_mints_s, decode_mints_s,
+    decode_ms_p50, decode_ms_p95, decode_ms_max, round_trip
+throughput is measured in millions of integers per second, latency is the time to decode one whole posting list.
+'''
+
+# synthetic datasets: name, Zipf exponent, number of lists
+synthetic_datasets = [("zipf_gaps_1.2", 1.2, 100), ("zipf_gaps_1.5", 1.5, 100), ("zipf_gaps_2.0", 2.0, 100),
+                      ("zipf_freqs_3.0", 3.0, 100)]
+# real datasets: lists read from the index (the longest ones and the shortest ones)
+real_lists_count = 100
+benchmark_index_name = default_index_title
+# unary code of a number n takes n bits: datasets with bigger numbers are skipped for unary
+unary_max_value = 4096
+# each measure is repeated and the fastest run is kept
+benchmark_repetitions = 3
+benchmark_seed = 42
+
+
+def synthetic_lists(exponent, lists_count, seed=benchmark_seed):
+    # posting lists of different lengths (from a few numbers to some thousands), with Zipfian numbers
+    # @ return : list of numpy arrays
+    generator = np.random.default_rng(seed)
+    lengths = np.minimum(generator.zipf(1.3, lists_count) * 16, 20000)
+    return [np.minimum(generator.zipf(exponent, length), 2 ** 31).astype(np.uint64) for length in lengths]
+
+
+def index_lists(index_name=benchmark_index_name, lists_count=real_lists_count):
+    # posting lists of an index on disk, as docids and frequencies
+    # the lists are chosen from the doc freqs of the lexicon: only the selected ones are read and decoded
+    # @ return : list of docids arrays, list of freqs arrays (empty if the index is not available)
+    index = load_from_disk(index_name)
+    if index is None or not index.is_ready() or index.block_size == 0 or not os.path.exists(index.index_file_path):
+        print_log("benchmark: index " + str(index_name) + " not available, real posting lists skipped", 1)
+        return [], []
+    lexicon = load_lexicon(index.lexicon_path, index.index_file_path)
+    positions = np.argsort(np.asarray(lexicon.doc_freqs, dtype=np.int64), kind="stable")
+    # the longest lists (the most expensive ones at query time) and the shortest ones (the most common)
+    if len(positions) > lists_count:
+        positions = np.concatenate((positions[:lists_count // 2],
+                                    positions[len(positions) - (lists_count - lists_count // 2):]))
+    postings = []
+    with open(index.index_file_path, "rb") as index_file:
+        for position in positions.tolist():
+            index_file.seek(lexicon.offsets[position])
+            encoded = index_file.read(lexicon.offsets[position + 1] - lexicon.offsets[position])
+            postings.append(decode_posting_blocks(encoded, index.compression))
+    return [docids for docids, _ in postings], [freqs.astype(np.uint64) for _, freqs in postings]
+
+
+def docid_gaps(docids, codec):
+    # gaps written in the index with codec: the first one is counted from first_previous_docid (docid + 1 for the
+    # bit-level codes, they cannot encode zero)
+    # @ return : numpy array of integers (uint64)
+    return np.diff(docids.astype(np.int64), prepend=first_previous_docid(codec)).astype(np.uint64)
+
+
+def split_blocks(numbers):
+    # @ return : list of lists of integers, posting_block_size numbers each (like the blocks of the index)
+    values = numbers.tolist()
+    return [values[start:start + posting_block_size] for start in range(0, len(values), posting_block_size)]
+
+
+def decode_list(list_blocks, codec):
+    # decode all the blocks of a list, like a whole posting list is decoded at query time
+    # the blocks of the byte-aligned codecs are joined and decoded in one call (pfor: one vectorized pass over all the
+    # frames), the bit streams are padded at the end of each block and are decoded one block at a time
+    if not list_blocks:
+        return np.zeros(0, dtype=np.uint32)
+    if codec == "no":
+        return decode_numbers(b",".join(list_blocks), codec)
+    if codec in ("vbyte", "pfor"):
+        return decode_numbers(b"".join(list_blocks), codec)
+    return np.concatenate([decode_numbers(block, codec) for block in list_blocks])
+
+
+def can_encode(codec, lists):
+    # unary, gamma and delta cannot encode zero, and the unary code of a number n takes n bits
+    if codec in bit_level_codecs and any(len(numbers) > 0 and int(numbers.min()) == 0 for numbers in lists):
+        return False
+    if codec == "unary":
+        return all(len(numbers) == 0 or int(numbers.max()) <= unary_max_value for numbers in lists)
+    return True
+
+
+def benchmark_codec(codec, lists):
+    # @ param lists : list of numpy arrays of integers
+    # @ return : dictionary with the measures (one row of the table)
+    blocks = [split_blocks(numbers) for numbers in lists]
+    integers = sum(len(numbers) for numbers in lists)
+
+    encode_time = float("inf")
+    encoded = []
+    for _ in range(benchmark_repetitions):
+        tic = time.perf_counter()
+        encoded = [[encode_numbers(block, codec) for block in list_blocks] for list_blocks in blocks]
+        encode_time = min(encode_time, time.perf_counter() - tic)
+
+    latencies = np.full(len(lists), float("inf"))
+    round_trip = True
+    for _ in range(benchmark_repetitions):
+        for i, list_blocks in enumerate(encoded):
+            tic = time.perf_counter()
+            decoded = decode_list(list_blocks, codec)
+            latencies[i] = min(latencies[i], time.perf_counter() - tic)
+            if round_trip:
+                round_trip = np.array_equal(decoded, lists[i])
+    decode_time = float(latencies.sum())
+
+    encoded_bytes = sum(len(block) for list_blocks in encoded for block in list_blocks)
+    return {"codec": codec, "lists": len(lists), "integers": integers, "bytes": encoded_bytes,
+            "bits_per_int": round(8 * encoded_bytes / max(integers, 1), 3),
+            "encode_mints_s": round(integers / encode_time / 1e6, 3) if encode_time > 0 else 0,
+            "decode_mints_s": round(integers / decode_time / 1e6, 3) if decode_time > 0 else 0,
+            "decode_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 4),
+            "decode_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 4),
+            "decode_ms_max": round(float(latencies.max()) * 1000, 4),
+            "round_trip": round_trip}
+
+
+def run_benchmark(codecs=None, output_path=output_codec_benchmark_file, index_name=benchmark_index_name):
+    # @ param codecs : names of the codecs (default: all the ones in compression_choices_config)
+    # @ return : list of rows (dictionaries)
+    if codecs is None:
+        codecs = compression_choices_config
+    # datasets: name, lists, True if the lists are docids (each codec encodes the gaps it would write in the index)
+    datasets = [(name, synthetic_lists(exponent, lists_count), False)
+                for name, exponent, lists_count in synthetic_datasets]
+    real_docids, real_freqs = index_lists(index_name)
+    if real_docids:
+        datasets.append(("index_gaps_" + str(index_name), real_docids, True))
+        datasets.append(("index_freqs_" + str(index_name), real_freqs, False))
+
+    rows = []
+    for dataset_name, dataset_lists, docids in datasets:
+        for codec in codecs:
+            lists = [docid_gaps(numbers, codec) for numbers in dataset_lists] if docids else dataset_lists
+            if not can_encode(codec, lists):
+                print_log(f"benchmark: {codec} skipped on {dataset_name} (numbers out of the range of the codec)", 2)
+                continue
+            row = {"dataset": dataset_name}
+            row.update(benchmark_codec(codec, lists))
+            print_log(f"benchmark: {dataset_name} {codec} {row['bits_per_int']} bits/int, "
+                      f"decode {row['decode_mints_s']} M int/s", 2)
+            rows.append(row)
+
+    if output_path and rows:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", newline="") as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print_log("benchmark results written in " + output_path, 1)
+    return rows
+
+
+if __name__ == "__main__":
+    results = run_benchmark()
+    if results:
+        print(",".join(results[0].keys()))
+        for result in results:
+            print(",".join(map(str, result.values())))
@@ -0,0 +1,6 @@
+from src.config import collection_path_config
+from src.modules.SeekableCollection import build_seekable_collection
+
+# one-time conversion of the compressed collection in independent gzip blocks (see SeekableCollection.py)
+if __name__ == "__main__":
+    build_seekable_collection(collection_path_config)
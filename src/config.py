@@ -12,6 +12,9 @@ root_directory = "D:/Repositories/mircv/dataset/"  # path lorenzo
 
 '''index folder: this folder is going to contain all the files to work with inverted indexes'''
 index_config_path = root_directory + "index_info_"  # file name is going to be added at the end
+# the files of each index (stats, index, lexicon, block directory, and the chunk files written while scanning the
+# collection) are in root_directory + index name + "/", the folder created by add_document_to_index.
+# index_folder_path is not used by the modules
 index_folder_path = root_directory + "index"  # folder is going to contain several files for each index
 
 # qrel 2019
@@ -25,6 +28,8 @@ evaluation_trec_queries_2020_path = root_directory + "trec/msmarco-test2020-quer
 
 # EVALUATION OUTPUT FILE
 output_query_trec_evaluation_file = root_directory + "evaluation/output.csv"
+# COMPRESSION BENCHMARK OUTPUT FILE (see benchmark_compression.py)
+output_codec_benchmark_file = root_directory + "evaluation/codec_benchmark.csv"
 
 # INPUT FILES
 full_collection_compressed = root_directory + "collection.tar.gz"
@@ -50,7 +55,9 @@ must be the minimum data set you should be able to index.
 # options available for k
 k_returned_results_config = [10, 20]
 # options available for query processing
-query_processing_algorithm_config = ["conjunctive", "disjunctive"]
+query_processing_algorithm_config = ["conjunctive", "disjunctive", "maxscore", "wand", "block_max_wand"]
+# disjunctive algorithms with dynamic pruning (same results of "disjunctive", using the score upper bounds)
+dynamic_pruning_algorithms = ["maxscore", "wand", "block_max_wand"]
 # options available for scoring function
 scoring_function_config = ["BM11", "BM15", "BM25", "TFIDF"]
 '''
@@ -72,6 +79,7 @@ TREC DL 2020 queries and TREC DL 2020 qrels.
 STRING FORMAT CONFIG: list of useful variables to easily remember string separators
 """
 file_format = ".txt"
+binary_file_format = ".bin"
 file_blank_tag = "missing"
 member_blank_tag = "not set"
 collection_separator = ","
@@ -115,12 +123,75 @@ default_index_title = 'default_index'
 '''
 CHUNK SIZE FOR INDEXING
 instead of writing index files frequently, add them in memory and write only when the buffer is full.
-size is counted in number of lines (one line is one posting list).
+size is measured in bytes (estimated memory held by the posting lists in the buffer).
 DISABLE CHUNK SPLIT: if this variable is -1, there is no splitting in chunks and all the data is loaded into memory 
 '''
 # EDIT HERE
 # index_chunk_size = -1
-index_chunk_size = 100000
+index_chunk_size = 256 * 1024 * 1024  # 256 MB
+'''
+PARALLEL INDEXING
+the collection is read once, and batches of rows are indexed by a pool of worker processes (see multiprocessing.py).
+each worker has a posting buffer of index_chunk_size / workers bytes. 0 workers: one for each core.
+the reader checks that the workers are alive every indexing_poll_interval seconds while it waits on the queues.
+'''
+# EDIT HERE
+indexing_workers_config = 0
+indexing_batch_rows = 2000
+indexing_poll_interval = 5
+'''
+PARTITIONS FOR MULTIPROCESS INDEXING
+the collection is split in partitions of the same size, each one indexed by a process (see partitioning.py).
+the partition plan is saved in the manifest, used by the processes and by merge_indexes.py.
+compressed collections need a line offset index (built once): one entry every partition_offsets_step lines.
+'''
+partition_manifest_path = root_directory + "partitions" + file_format
+partition_offsets_step = 10000
+'''
+SEEKABLE COLLECTION
+copy of the compressed collection made of independent gzip blocks of seekable_block_size bytes (uncompressed), with
+the position of each document (see SeekableCollection.py). if available, it's used to fetch single documents and to
+start reading the partitions without decompressing the collection from the beginning.
+'''
+seekable_block_size = 1024 * 1024  # 1 MB
+seekable_cached_blocks = 16  # decompressed blocks kept in memory for document fetches
+'''
+CHUNK FILE FORMAT
+chunks are the intermediate files written when the posting buffer is full, and merged at the end of the scan.
+"binary" : length-prefixed runs of token bytes and packed docids/frequencies (fast to write and to merge)
+"text" : one row for each token, like token:docid|freq;docid|freq (human readable, useful for debugging)
+'''
+chunk_format_choices_config = ["binary", "text"]
+# EDIT HERE
+chunk_format_config = chunk_format_choices_config[0]
+'''
+WRITE BUFFER FOR MERGING
+size in bytes of the file buffers used when merging chunks and partitions into the final index files.
+bigger buffers mean less (and larger) writes on disk.
+'''
+merge_write_buffer_size = 8 * 1024 * 1024  # 8 MB
+'''
+PARALLEL ENCODING FOR MERGING
+when merging partitions, the posting lists are encoded by a pool of processes (0: one for each core), in batches of
+encode_batch_size posting lists.
+'''
+merge_processes_config = 0
+encode_batch_size = 1000
+'''
+POSTING BLOCKS
+posting lists are split in blocks of fixed size. in the index file, each block has a header (last docid, size of the
+docids and of the frequencies): the query handler decodes only the blocks reached by the cursors.
+for each block, the block directory (blocks.bin) stores the last docid and the maximum score of the block, used by
+Block-Max WAND to skip whole blocks.
+the block size is saved in the index config and in the block directory, so changing it affects only new indexes.
+'''
+posting_block_size = 128
+'''
+COLLECTION STATISTICS BUFFER
+while indexing, the statistics of the documents (stats.txt and its binary document table) are buffered in memory and
+written in blocks of this number of rows, and when a chunk is written.
+'''
+stats_buffer_rows = 65536
 '''
 BM 25 PARAMETERS
 k_one in [1.2,2]
@@ -132,33 +203,41 @@ BM25_b = 0.75
 
 '''
 COMPRESSION OPTIONS 
+"no" : numbers written as text
+"unary", "gamma", "delta" : bit-level codes (delta is Elias delta: shorter than gamma for big numbers)
+"vbyte" : variable byte code, 7 bits of the number in each byte (byte aligned: fast to decode, can encode zero)
+"pfor" : patched frame of reference, frames of 128 numbers packed with the same bit width, plus exceptions
+         (decoded with numpy, a whole frame at a time)
 '''
-compression_choices_config = ["no", "unary", "gamma"]
+compression_choices_config = ["no", "unary", "gamma", "vbyte", "delta", "pfor"]
 '''
 QUERY PARAMETERS
 '''
 # options for search algoritms
-search_into_file_algorithms = ["ternary", "skipping"]
+# in_memory: the lexicon is loaded once (binary sidecar of lexicon.txt) and searched with bisect
+search_into_file_algorithms = ["ternary", "skipping", "in_memory"]
 
 # EDIT HERE
 search_chunk_size_config = 10000  # skipping search: this is the default step size
 
 """
-Query caching: document size is a row of stats.txt. 
-if each docsize is required more than once, it's going to take a lot of time for useless memory accesses
+Lexicon caching
+Useful only for evaluation. Make a cache for lexicon files: the posting lists already read are kept in memory. 
+It is measured in bytes of the decoded postings (docids and frequencies arrays), the least recently used ones are
+evicted when it is full.
+If using multiple indexes at once (evaluation phase), each index has a separate cache.
+If the size is 0, the cache is disabled.
 """
 # EDIT HERE
-allow_doc_size_caching = True  # True (use memory) or False (do not use memory)
-# EDIT HERE
-flush_doc_size_cache_after_query = False  # True (cache lasts only 1 query)
-# or False (memory will eventually hold the whole stats.txt)
-
+lexicon_cache_size = 64 * 1024 * 1024  # 64 MB
 """
-Lexicon caching
-Useful only for evaluation. Make a cache for lexicon files. 
-It is measured in rows read, and one rows contains a token, its frequency, and its positing list. 
-If using multiple indexes at once (evaluation phase), each index has a separate cache.
+Query result caching
+The top k results of the last queries are kept in memory: a repeated query (same preprocessed words, on the same index
+with the same algorithm, scoring function and k) skips the whole query processing.
+Size is measured in number of queries, entries expire after the time to live (in seconds, 0 means no expiration).
+If the size is 0, the cache is disabled.
 """
 # EDIT HERE
-lexicon_cache_size = 1000
+query_result_cache_size = 10000
+query_result_cache_ttl = 3600
 #
@@ -1,8 +1,31 @@
-from src.config import query_processing_algorithm_config, scoring_function_config, limit_input_rows_config
-from src.modules.multiprocessing import open_dataset_multiprocess, add_document_to_index
+from src.config import query_processing_algorithm_config, scoring_function_config, limit_input_rows_config, \
+    indexing_workers_config
+from src.modules.InvertedIndex import index_setup
+from src.modules.multiprocessing import scan_dataset_parallel
 
+'''
+build one index with the parallel indexing pipeline (see scan_dataset_parallel in multiprocessing.py).
+this is the entry point to create the indexes: the partitioned build (open_dataset_multiprocess + merge_indexes.py) is
+needed only to index the collection in separate runs.
+the name of the index follows the one used by evaluate_indexes.py, e.g. indexes_full_no_stemming_keep_stopwords_vbyte
+'''
+
+# [rows limit, algorithm, scoring function, k, skip stemming, allow stop words, compression]
 config = [limit_input_rows_config, query_processing_algorithm_config[1], scoring_function_config[0], 4, True, True,
-          "No"]
+          "no"]
+
+
+def make_index_name(flags):
+    # @ param flags : same format of config
+    rows = "full" if flags[0] <= 0 else str(flags[0])
+    stemming = "no_stemming" if flags[4] else "do_stemming"
+    stop_words = "keep_stopwords" if flags[5] else "no_stopwords"
+    compression = "uncompressed" if flags[6] == "no" else flags[6]
+    return "_".join(["indexes", rows, stemming, stop_words, compression])
+
+
 if __name__ == "__main__":
-    open_dataset_multiprocess(config, add_document_to_index, delete_chunks=False, delete_after_compression=False,
-                              parts=5)
+    # the collection is read once, and indexed by a pool of worker processes
+    index = index_setup(make_index_name(config), stemming_flag=config[4], stop_words_flag=config[5],
+                        compression_flag=config[6], k=config[3], join_algorithm=config[1], scoring_f=config[2])
+    scan_dataset_parallel(index, workers=indexing_workers_config, count_limit=config[0])
@@ -20,8 +20,8 @@ trec_eval = load("trec_eval")
 
 indexes_to_evaluate = ["indexes_full_do_stemming_keep_stopwords", "indexes_full_do_stemming_no_stopwords",
                        "indexes_full_no_stemming_keep_stopwords", "indexes_full_no_stemming_no_stopwords"]
-compression_sets = ["_uncompressed", "_gamma"]  # skipped: unary (unfeasible disk size)
-search_eval_file_algorithms = ["ternary", "skipping"]
+compression_sets = ["_uncompressed", "_gamma", "_vbyte"]  # skipped: unary (unfeasible disk size)
+search_eval_file_algorithms = ["ternary", "skipping", "in_memory"]
 config_set = []
 
 index_limit = -1  # test purposes. put -1 to have no limits
@@ -81,7 +81,8 @@ while True:
                     handler.index.topk) + " " + handler.index.algorithm + " " + algorithm, next_qid):
                 continue
             tic = time.perf_counter()
-            result = handler.query(next_query, algorithm)
+            # the query result cache is bypassed: each run must measure the search algorithm and the query processing
+            result = handler.query(next_query, algorithm, use_cache=False)
             # result have this structure [(docid, score),....(docid, score)]
             # example: [('116', 5.891602731662223), ('38', 0), ('221', 0), ('297', 0)]
             run_dict = create_run_dict(next_qid, handler.index.name, result)
@@ -99,6 +100,12 @@ while True:
 
             toc = time.perf_counter()
             trec_score_dict["exec_time_s"] = toc - tic
+            trec_score_dict["cached"] = handler.last_query_cached
+            # dynamic pruning: postings scored and skipped by the query processor (0 for the exhaustive algorithms)
+            # results served by the query result cache have no counters
+            if not handler.last_query_cached:
+                trec_score_dict["postings_evaluated"] = handler.pruning_counters.evaluated
+                trec_score_dict["postings_skipped"] = handler.pruning_counters.skipped()
             trec_score_dicts_list.append(trec_score_dict)
             timer += toc - tic
 
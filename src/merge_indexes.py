@@ -1,288 +1,188 @@
+import heapq
 import os
 import time
-from src.config import index_folder_path, collection_separator, element_separator, index_config_path, file_format, \
-    compression_choices_config
-from src.modules.InvertedIndex import make_posting_list, index_setup, add_document_to_index, close_chunk, \
-    load_from_disk, merge_chunks
-from src.modules.document_processing import fetch_data_row_from_collection
-from src.modules.utils import read_file_to_dict, find_missing_contents
+from array import array
+from multiprocessing import get_context
+
+import numpy as np
+
+from src.config import collection_separator, compression_choices_config, partition_manifest_path, \
+    merge_processes_config, merge_write_buffer_size
+from src.modules.InvertedIndex import index_setup, load_from_disk, write_posting_lists, read_index_file
+from src.modules.document_processing import fetch_n_data_rows_from_collection
+from src.modules.DocumentTable import DocumentTable, doc_table_path
+from src.modules.multiprocessing import merge_runs
+from src.modules.partitioning import load_manifest
+from src.modules.PostingBuffer import PostingBuffer
+from src.modules.preprocessing import preprocess_text, count_token_occurrences
+from src.modules.utils import print_log, find_missing_contents, merge_ranges
 
 '''
 merge two (or more) indexes in one. this program is used to merge portions made with multiprocessing.
+the partitions are listed in the manifest written by open_dataset_multiprocess (see partitioning.py).
+work flow:
+1 - documents of the collection not found in any partition are indexed together in one more index (missing documents)
+2 - the stats.txt files are merged in a single pass, in docno order: the merged docids are the positions in the output,
+    and each partition gets an array that converts its local docids to the merged ones
+3 - the posting lists are read with a heap over all the partitions (lowest token first), their docids are converted
+    with the arrays, and the posting lists of the same token are joined
+4 - the posting lists are encoded by a process pool, and written with the lexicon of the merged index
 '''
-tic = time.perf_counter()
-# path lorenzo
-source_folder = index_folder_path.replace("index", "multiprocessing")
 
-# MANUALLY input the target file
-target_folder = "indexes_FALSE-TRUE"
 
-# false false : do stemming, remove stopwords
-# false true : do stemming, keep stopwords
-# true false : skip stemming, remove stopwords
-# true true : skip stemming, keep stopwords
-
-# MANUALLY choose the compression system
-compression = compression_choices_config[2]
-
-# global variables
-output_lexicon_path = source_folder + "/compression_" + compression + "/" + target_folder + "_merged/lexicon.txt"
-output_stats_path = source_folder + "/compression_" + compression + "/" + target_folder + "_merged/stats.txt"
-output_index_path = source_folder + "/compression_" + compression + "/" + target_folder + "_merged/index.txt"
-
-merge_folder = source_folder + "/" + target_folder
-lexicons_list = []
-indexes_list = []
-write_stats_file_flag = True  # skip a step if it's already done
-
-index_stem = ""  # initialized as string, replaced with True/False when reading from file
-index_stopw = ""  # initialized as string, replaced with True/False when reading from file
-
-# list of dictionaries (each dict is the content of a stats.txt file)
-global_stats_list = []
-
-print("merging index files. source folder: ")
-print(source_folder)
-
-print("opening input files")
-# OPEN all input files
-global_content = []
-for f in os.scandir(merge_folder):
-    if not f.name.startswith("index"):
-        continue
-    elif f.name.endswith(".txt"):
-        with open(f.path, "rb") as cfg_file:
-            content = cfg_file.readlines()
-            local_content = content[4].decode("utf-8").strip().split(",")
-            if index_stem == "":
-                index_stem = content[1].decode("utf-8").strip() == "skip_stem"
-            if index_stopw == "":
-                index_stopw = content[2].decode("utf-8").strip() == "allow_sw"
-            global_content.append([int(local_content[0]), int(local_content[1])])
-    else:
-        lexicons_list.append(open(merge_folder + "/" + f.name + "/lexicon.txt", "r"))
-        indexes_list.append(open(merge_folder + "/" + f.name + "/index.txt", "r"))
-
-        global_stats_list.append(
-            read_file_to_dict(merge_folder + "/" + f.name + "/stats.txt", separator=collection_separator))
-
-print("checking collection integrity")
-
-missing_docids = find_missing_contents(global_content)
-
-index_name_template = f"indt_missing_"
-if index_stem == True:
-    index_name_template += "skipstem_"
-if index_stopw == True:
-    index_name_template += "allowsw_"
-count = 0
-for d in missing_docids:
-    temp_index_element = ""
-
-    # string, name for the temporary index (important: the docid is in the name to avoid confusion
-    temp_index_name = index_name_template + str(d)
-    # path on disk for the temporary index (not deleted by default, but not needed after the execution)
-    temp_index_cfg_path = index_config_path + temp_index_name + file_format
-
-    # Check if the index is already presente we can skip the decompression and load from disk directly
-    if os.path.exists(temp_index_cfg_path):
-        # load from disk takes the name of the index, so it cannot be used on the temp subfolder
-        temp_index_element = load_from_disk(temp_index_name)
-        if temp_index_element.allow_stop_words != index_stopw or temp_index_element.skip_stemming != index_stem:
-            # make sure the index found has the same config flags
-            temp_index_element = ""
-    if temp_index_element == "":
-        result_id, result_txt = fetch_data_row_from_collection(d)
-        # check if the document really exists
-        if result_txt != [] and result_id[0] == d:
-            # Create new indexes for each missing documents, to guarantee the correct order in the global index
-            temp_index_element = index_setup(temp_index_name, index_stem, index_stopw, "no", 3, 0, 0)
-            add_document_to_index(temp_index_element, [0, d, result_txt[0]])
-            close_chunk(temp_index_element)
-
-            # this is how the chunk is named from close_chunk
-            chunk_file_path = index_folder_path + temp_index_name + "/chunk_posting_" + str(count) + file_format
-            count += 1  # since i have only one document, it's impossible to have more than one chunk
-
-            merge_chunks([chunk_file_path], temp_index_element.index_file_path, temp_index_element.lexicon_path,
-                         delete_after_merge=False)
-            temp_index_element.save_on_disk()
-
-        else:
-            print("Fetch data row from collection failed")
-
-    # add the processed document to the list of files to merge
-    lexicons_list.append(open(temp_index_element.lexicon_path, "r"))
-    indexes_list.append(open(temp_index_element.index_file_path, "r"))
-    global_stats_list.append(
-        read_file_to_dict(temp_index_element.collection_statistics_path, separator=collection_separator))
-
-
-
-print("analyzing: stats files")
-# first step
-# make the global stats.txt file
-# merge of all stats (each stats.txt file is open as dictionary)
-if write_stats_file_flag:
-    written_lines = 0
-    last_written_value = -1  # initialize with a low number, lesser than any possible docid
-    finished = False
-    output_stats_file = open(output_stats_path, "w+")
-    while not finished:  # iterate once for every object in the global_stats_list
-        finished = True  # termination condition
-
-        # look for the lowest value that has not already been written
-
-        # initialize minimum search
-        candidate_value = 13553  # a random number, just to initialize the variable
-        candidate_index = -1  # partition i
-        for i in range(len(global_stats_list)):
-            # minimum search: two conditions
-            # (1) : no candidates found yet. any candidate with a bigger (=not written) value than last iteration is ok
-            # (2) : at least one candidate found. take the best one (bigger than the ones already written)
-            if (candidate_index < 0 and last_written_value < int(global_stats_list[i]["0"][0])) or (
-                    candidate_value > int(global_stats_list[i]["0"][0]) > last_written_value):
-                candidate_value = int(global_stats_list[i]["0"][0])
-                candidate_index = i
-                finished = False
-        print("Found: partition starting from docid " + str(candidate_value))
-        # if there is no value greater than the last_written_value, it's finished
-        if not finished:
-            last_written_value = candidate_value
-            # write dictionary to file
-            for name, size in global_stats_list[candidate_index].values():
-                output_line = str(written_lines) + collection_separator + str(name) + collection_separator + str(
-                    size) + "\n"
-                output_stats_file.write(output_line)
-                # update the counter
-                written_lines += 1
-
-    output_stats_file.close()
-    print("stats written successfully. documents found:")
-    print(written_lines)
-
-else:
-    print("stats loaded in memory")
-
-# initialize lexicon tops: the first line from each one
-first_element_list = []
-for lex in lexicons_list:
-    first_element_list.append(lex.readline())
-
-print("opening output files")
-# open all output files
-output_lexicon_file = open(output_lexicon_path, "w+")
-if compression != "no":
-    output_index_file = open(output_index_path, "wb+")
-else:
-    output_index_file = open(output_index_path, "w+")
-
-# work flow
-# 1 - read from lexicon files the lower (alphabetically) token
-# 2 - read the posting lists for that token (may have more than one)
-# remember: tokens may be repeated but each document appears only once
-# 3 - make the merged posting list (decode the gaps)
-# 4 - fetch the doc names from the stats document (the real docid)
-# 5 - order the d,d,d,d,d in the correct order
-# 6 - check the .tell() position, then write the posting list
-# 7 - add the token in the output lexicon
-
-written_lines = 0
-
-print(f"starting merge phase for {len(lexicons_list)} partitions")
-while True:
-    next_chunk_index = []
-    # i have to compare every element of firstelemlist
-
-    i = 0  # counter at partition's index in the input files list
-
-    output_key = ""  # token as string
-
-    # no more needed: i'll read the index file in the same order of the lexicon
-    # key_offset_list = ""  # where to retrieve the posting lists
-
-    # look at each first element, search the lowest
-    for element in first_element_list:
-        # make sure the list is not empty
-        if element != "empty":
-            element = element.replace(" \n", "")
-            element_splitted = element.split(sep=element_separator)
-            # "lowest" is in alphabetical order
-            if output_key == "" or element_splitted[0] < output_key:
-                output_key = element_splitted[0]  # set current token
-                # element_splitted[1] is the token local frequency, and i dont need that
-                # key_offset_list = [element_splitted[2]]  # not needed: i'll read the index file in order
-                next_chunk_index = [i]  # initialize list
-            elif element_splitted[0] == output_key:
-                # token found in more than one partition (merge required)
-                next_chunk_index.append(i)
-                # key_offset_list.append(element_splitted[2]) # not needed: i'll read the index file in order
-        i += 1
-
-    if len(next_chunk_index) == 0:
-        # no minimum found: all lexicons are empty
-        break  # job finished
-    # else minimum found (might have more than one partition with the same token)
-
-    # update the first element of the lexicons of the partitions i've extracted the current elements
-    # move the list pointer to the next element
-    for i in next_chunk_index:
-        first_element_list[i] = lexicons_list[i].readline()
-        if len(first_element_list[i]) == 0:
-            first_element_list[i] = "empty"
-            print(f"partition {i} is now empty")
-
-    # next_chunk_index is the list of which partitions contain that token
-    # key_offset_list is the list of offsets to get the posting lists
-    # let's now get the posting lists
-    docid_list = []
-    freq_list = []
-    for i in next_chunk_index:
-        # lexicon and index files have the same order: one row for each token
-        line = indexes_list[i].readline()
-        gaps, freqs = line.split()
-
-        gap_list = map(int, gaps.split(","))
-        frequencies = freqs.split(",")  # keep them as strings, i dont have to make the sums because docids are unique
-
-        # Convert the gaps back to doc IDs
-        previous_doc_id = 0
-        for gap in gap_list:
-            doc_id = previous_doc_id + gap
-            # WARNING: the extracted docid is local in the partition
-            # must convert the local docid in the global one
-            docid_list.append(global_stats_list[i][str(doc_id)][0])
-            # still using the local one for the gaps conversion
-            previous_doc_id = doc_id
-            # append freq
-        for f in frequencies:
-            freq_list.append(f)
-
-    # time to prepare the output
-    index_line = make_posting_list(docid_list, freq_list, compression)
-
-    last_written_position = output_index_file.tell()
-    lexicon_line = str(
-        output_key + element_separator + str(len(docid_list)) + element_separator + str(last_written_position) + "\n")
-
-    # OUTPUT: writing one row in index file and in the lexicon
-    output_index_file.write(index_line)
-    output_lexicon_file.write(lexicon_line)
-    written_lines += 1
-
-    if written_lines % 20000 == 0:
-        print(f"total words in lexicon: {written_lines}")
-
-print(f"total words in lexicon: {written_lines}")
-# end: cleaning the things left open
-for f in lexicons_list:
-    f.close()
-for f in indexes_list:
-    f.close()
-
-output_lexicon_file.close()
-output_index_file.close()
-
-toc = time.perf_counter()
-print("compression method: " + compression)
-print(f"total execution time for merge: {toc - tic} s")
+def read_stats_rows(stats_path, source):
+    # @ return : generator of (docno, local docid, length, source), in the order of the file
+    with open(stats_path, "r", buffering=merge_write_buffer_size) as stats_file:
+        for line in stats_file:
+            content = line.strip().split(collection_separator)
+            if len(content) == 3:
+                yield int(content[1]), int(content[0]), int(content[2]), source
+
+
+# merged docid of the documents dropped by the merge (a document found in more than one partition is kept only once)
+dropped_docid = 2 ** 32 - 1
+
+
+def merge_stats(sources, output_index):
+    # single ordered pass over the stats.txt of all the sources: documents are written in docno order
+    # @ param sources : list of InvertedIndex (partitions)
+    # @ return : one array for each source, converting the local docids to the merged docids (dropped_docid for the
+    #            documents already found in a previous partition)
+    local_docids = [array('I') for _ in sources]
+    merged_docids = [array('I') for _ in sources]
+    merged_docid = 0
+    last_docno = -1
+    streams = [read_stats_rows(source.collection_statistics_path, i) for i, source in enumerate(sources)]
+    for docno, local_docid, length, source in heapq.merge(*streams):
+        local_docids[source].append(local_docid)
+        if docno == last_docno:
+            # the first occurrence is kept: the postings of this one are dropped by read_remapped_partition
+            print_log("duplicate document " + str(docno) + " in more than one partition", priority=1)
+            merged_docids[source].append(dropped_docid)
+            continue
+        output_index.add_content_id(docno)
+        output_index.add_to_collection_stats(merged_docid, docno, length)
+        merged_docids[source].append(merged_docid)
+        merged_docid += 1
+        last_docno = docno
+    output_index.close_stats_writer()
+
+    remaps = []
+    for local, merged in zip(local_docids, merged_docids):
+        local = np.frombuffer(local, dtype=np.uint32)
+        remap = np.full(int(local.max()) + 1 if len(local) else 0, dropped_docid, dtype=np.uint32)
+        remap[local] = np.frombuffer(merged, dtype=np.uint32)
+        remaps.append(remap)
+    print_log(f"stats merged: {merged_docid} documents", priority=2)
+    return remaps
+
+
+def read_remapped_partition(source, remap):
+    # read one partition, one token at a time (lexicon and index files have the same order)
+    # @ return : generator of (token, docids, freqs) where docids are the merged ones (in increasing order)
+    for token, local_docids, freqs in read_index_file(source.index_file_path, source.lexicon_path, source.compression):
+        docids = remap[local_docids]
+        kept = docids != dropped_docid
+        if not kept.all():
+            # postings of duplicate documents
+            docids, freqs = docids[kept], freqs[kept]
+            if len(docids) == 0:
+                continue
+        yield token, array('I', docids.tobytes()), array('I', freqs.astype(np.uint32).tobytes())
+
+
+def index_missing_documents(missing_docnos, name, skip_stemming, allow_stop_words):
+    # index all the documents not found in any partition, in one small index
+    # @ return : InvertedIndex, None if no document was found in the collection
+    texts = []
+    for start, stop in merge_ranges([[docno, docno] for docno in missing_docnos]):
+        # consecutive documents are fetched together
+        result_id, result_txt = fetch_n_data_rows_from_collection(start, stop + 1)
+        texts.extend(zip(result_id, result_txt))
+    if not texts:
+        return None
+    missing_index = index_setup(name, skip_stemming, allow_stop_words, "no", 3, 0, 0)
+    os.makedirs(os.path.dirname(missing_index.collection_statistics_path), exist_ok=True)
+    if os.path.exists(missing_index.collection_statistics_path):
+        missing_index.flush_collection_stats()
+    posting_buffer = PostingBuffer()
+    for local_docid, (docno, text) in enumerate(texts):
+        tokens = preprocess_text(text, skip_stemming, allow_stop_words)
+        for token_id, token_count in count_token_occurrences(tokens).items():
+            posting_buffer.add(token_id, token_count, local_docid)
+        missing_index.add_content_id(int(docno))
+        missing_index.add_to_collection_stats(local_docid, docno, len(tokens))
+    missing_index.close_stats_writer()
+    lines = write_posting_lists(posting_buffer.sorted_items(), missing_index.index_file_path,
+                                missing_index.lexicon_path)
+    missing_index.index_len = missing_index.lexicon_len = lines
+    missing_index.save_on_disk()
+    print_log(f"indexed {len(texts)} missing documents", priority=2)
+    return missing_index
+
+
+def merge_partitions(manifest=partition_manifest_path, output="merged_index", compression="no",
+                     processes=merge_processes_config):
+    # merge the partition indexes listed in a manifest in a single index
+    # @ param manifest : path of the partition manifest
+    # @ param output : name of the merged index (loaded later with load_from_disk)
+    # @ param compression : compression of the merged index
+    # @ param processes : processes used to encode the posting lists (0: one for each core)
+    # @ return : the merged InvertedIndex
+    tic = time.perf_counter()
+    collection_path, collection_rows, partitions = load_manifest(manifest)
+    sources = []
+    for partition in partitions:
+        partition_index = load_from_disk(partition.index_name)
+        if partition_index is None:
+            print_log("missing partition index: " + partition.index_name, priority=0)
+            continue
+        sources.append(partition_index)
+    if not sources:
+        print_log("no partition to merge", priority=0)
+        return None
+    skip_stemming, allow_stop_words = sources[0].skip_stemming, sources[0].allow_stop_words
+
+    # documents of the collection not found in any partition
+    contents = [interval for source in sources for interval in source.content]
+    last_docno = collection_rows - 1 if collection_rows > 0 else max(interval[1] for interval in contents)
+    missing_docnos = find_missing_contents(contents, last_docno)
+    if missing_docnos:
+        print_log(f"{len(missing_docnos)} documents missing in the partitions", priority=1)
+        missing_index = index_missing_documents(missing_docnos, output + "_missing", skip_stemming,
+                                                allow_stop_words)
+        if missing_index is not None:
+            sources.append(missing_index)
+
+    index = index_setup(output, skip_stemming, allow_stop_words, compression, sources[0].topk, sources[0].algorithm,
+                        sources[0].scoring)
+    os.makedirs(os.path.dirname(index.collection_statistics_path), exist_ok=True)
+    if os.path.exists(index.collection_statistics_path):
+        index.flush_collection_stats()
+    remaps = merge_stats(sources, index)
+
+    # document lengths of the merged collection: required for the score upper bounds saved in the lexicon
+    doc_table = DocumentTable(doc_table_path(index.collection_statistics_path))
+    streams = [read_remapped_partition(source, remap) for source, remap in zip(sources, remaps)]
+    print_log(f"starting merge phase for {len(sources)} partitions", priority=1)
+    if processes < 1:
+        processes = os.cpu_count() or 1
+    with get_context().Pool(processes) as pool:
+        # the missing documents have docids between the ones of the partitions: merge_runs sorts them
+        lines = write_posting_lists(merge_runs(streams), index.index_file_path, index.lexicon_path, compression,
+                                    doc_table, index.doc_len_average, pool)
+    doc_table.close()
+    index.index_len = index.lexicon_len = lines
+    index.save_on_disk()
+    toc = time.perf_counter()
+    print_log(f"total words in lexicon: {lines}", priority=1)
+    print_log(f"total execution time for merge: {toc - tic} s", priority=1)
+    return index
+
+
+if __name__ == "__main__":
+    # MANUALLY input the name of the merged index
+    target_index = "indexes_FALSE-TRUE"
+    # MANUALLY choose the compression system
+    target_compression = compression_choices_config[2]
+    merge_partitions(partition_manifest_path, target_index + "_" + target_compression, target_compression)
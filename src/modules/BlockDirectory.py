@@ -0,0 +1,108 @@
+import os
+import struct
+
+import numpy as np
+
+from src.config import scoring_function_config
+from src.modules.utils import print_log
+
+# header: magic string, postings in a block, score columns (one for each scoring function), number of posting lists
+block_directory_header = struct.Struct("<4sIII")
+block_directory_magic = b"BLK2"
+block_directory_name = "blocks.bin"
+
+
+def block_record_dtype(score_columns):
+    # one record for each block: last docid of the block, maximum score of the block for each scoring function
+    return np.dtype([("last_docid", "<u4"), ("max_scores", "<f8", (score_columns,))])
+
+
+def block_directory_path(index_file_path):
+    # the block directory is saved in the same folder of the index file
+    return os.path.join(os.path.dirname(index_file_path), block_directory_name)
+
+
+def blocks_count(doc_freq, block_size):
+    return (doc_freq + block_size - 1) // block_size
+
+
+class BlockDirectoryWriter:
+    def __init__(self, path, block_size):
+        # blocks are written token by token, in the same order of the lexicon
+        self.block_size = block_size
+        self.lists = 0
+        self.dtype = block_record_dtype(len(scoring_function_config))
+        self.file = open(path, "wb")
+        self.write_header()
+
+    def write_header(self):
+        self.file.write(block_directory_header.pack(block_directory_magic, self.block_size,
+                                                    len(scoring_function_config), self.lists))
+
+    def add(self, docids, block_bounds):
+        # @ param docids : docids of the posting list
+        # @ param block_bounds : matrix of the maximum scores (number of blocks x number of scoring functions)
+        records = np.empty(len(block_bounds), dtype=self.dtype)
+        last_positions = np.minimum(np.arange(1, len(block_bounds) + 1) * self.block_size, len(docids)) - 1
+        records["last_docid"] = np.asarray(docids, dtype=np.uint32)[last_positions]
+        records["max_scores"] = block_bounds
+        self.file.write(records.tobytes())
+        self.lists += 1
+
+    def close(self):
+        # the number of posting lists is known only at the end
+        self.file.seek(0)
+        self.write_header()
+        self.file.close()
+
+
+class BlockDirectory:
+    def __init__(self, path, doc_freqs, block_size):
+        # the block directory is memory mapped. the blocks of the token in position i of the lexicon start after the
+        # blocks of all the previous tokens, so the start of each token is computed from the doc frequencies
+        # @ param doc_freqs : doc frequencies of the lexicon, in the same order
+        # @ param block_size : postings in a block of the index
+        # the header must match the lexicon and the index: a file left by an older version of the index is rejected
+        with open(path, "rb") as file:
+            header = file.read(block_directory_header.size)
+        if len(header) < block_directory_header.size:
+            raise ValueError("truncated block directory: " + path)
+        magic, self.block_size, score_columns, lists = block_directory_header.unpack(header)
+        if magic != block_directory_magic or score_columns != len(scoring_function_config):
+            raise ValueError("unknown block directory format: " + path)
+        if self.block_size != block_size or lists != len(doc_freqs):
+            raise ValueError(f"block directory of another index: {path} (block size {self.block_size}, {lists} lists; "
+                             f"index: block size {block_size}, {len(doc_freqs)} lists)")
+        counts = blocks_count(np.asarray(doc_freqs, dtype=np.int64), self.block_size)
+        self.starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.starts[1:])
+        dtype = block_record_dtype(score_columns)
+        if os.path.getsize(path) != block_directory_header.size + int(self.starts[-1]) * dtype.itemsize:
+            raise ValueError("the size of the block directory does not match the lexicon: " + path)
+        self.records = np.memmap(path, dtype=dtype, mode="r", offset=block_directory_header.size,
+                                 shape=(int(self.starts[-1]),))
+
+    def blocks(self, position, scoring):
+        # @ param position : position of the token in the lexicon
+        # @ return : list of last docids, list of maximum scores (with IDF = 1) for the blocks of the token
+        records = self.records[self.starts[position]:self.starts[position + 1]]
+        column = scoring_function_config.index(scoring)
+        return records["last_docid"].tolist(), records["max_scores"][:, column].tolist()
+
+    def close(self):
+        # drop the memory map: on Windows a mapped file cannot be removed or rewritten
+        self.records = self.records[:0].copy()
+        self.starts = np.zeros(1, dtype=np.int64)
+
+
+def load_block_directory(index_file_path, lexicon, block_size):
+    # @ param block_size : postings in a block of the index
+    # @ return : BlockDirectory of the index, None if the index has been created without it (or it does not match)
+    path = block_directory_path(index_file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        return BlockDirectory(path, lexicon.doc_freqs, block_size)
+    except ValueError as error:
+        print_log("block directory rejected: " + str(error), 0)
+        return None
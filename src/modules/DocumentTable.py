@@ -0,0 +1,140 @@
+import os
+import struct
+
+import numpy as np
+
+from src.config import collection_separator, binary_file_format, chunk_line_separator, stats_buffer_rows
+from src.modules.utils import print_log
+
+# one fixed-width record for each docid: docno, document length (both uint32)
+doc_table_record = struct.Struct("<II")
+doc_table_dtype = np.dtype([("docno", "<u4"), ("length", "<u4")])
+
+
+class DocumentTable:
+    def __init__(self, path):
+        # the binary table is memory mapped: the record of a docid is at position docid, so a lookup is an array index
+        self.path = path
+        if os.path.getsize(path) > 0:
+            self.records = np.memmap(path, dtype=doc_table_dtype, mode="r")
+        else:
+            # np.memmap cannot map an empty file
+            self.records = np.zeros(0, dtype=doc_table_dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def length(self, docid):
+        # @ return : length of the document, 0 if the docid is not in the table
+        docid = int(docid)
+        if 0 <= docid < len(self.records):
+            return int(self.records["length"][docid])
+        return 0
+
+    def lengths(self, docids):
+        # vectorized lookup
+        # @ param docids : array (or list) of integer docids
+        # @ return : numpy array of lengths, 0 for the docids not in the table
+        docids = np.asarray(docids, dtype=np.int64)
+        results = np.zeros(len(docids), dtype=np.uint32)
+        valid = (docids >= 0) & (docids < len(self.records))
+        results[valid] = self.records["length"][docids[valid]]
+        return results
+
+    def docno(self, docid):
+        docid = int(docid)
+        if 0 <= docid < len(self.records):
+            return int(self.records["docno"][docid])
+        return -1
+
+    def close(self):
+        # drop the memory map: on Windows a mapped file cannot be removed or rewritten
+        # (the map is released with its last reference, so views still in use stay valid)
+        self.records = np.zeros(0, dtype=doc_table_dtype)
+
+
+def doc_table_path(collection_statistics_path):
+    # the binary table is saved next to stats.txt, with the same name
+    return os.path.splitext(collection_statistics_path)[0] + binary_file_format
+
+
+def write_doc_table_record(table_file, docid, docno, length):
+    # write the record of docid in an open binary file (opened in "r+b" or "ab" mode)
+    # docids without a document (for example duplicates) are filled with empty records
+    table_file.seek(0, os.SEEK_END)
+    records_count = table_file.tell() // doc_table_record.size
+    docid = int(docid)
+    if docid < records_count:
+        table_file.seek(docid * doc_table_record.size)
+    elif docid > records_count:
+        table_file.write(doc_table_record.pack(0, 0) * (docid - records_count))
+    table_file.write(doc_table_record.pack(int(docno), int(length)))
+
+
+class StatsWriter:
+    # buffered writer of the collection statistics, used while indexing: stats.txt (docid,docno,length) and the
+    # binary table are kept open, and the rows are written in blocks instead of one write (and one open) per document
+    def __init__(self, collection_statistics_path, buffer_rows=stats_buffer_rows):
+        self.stats_file = open(collection_statistics_path, mode="a")
+        # "r+b" (not "ab"): records of docids already in the table are rewritten in place
+        open(doc_table_path(collection_statistics_path), mode="ab").close()
+        self.table_file = open(doc_table_path(collection_statistics_path), mode="r+b")
+        self.table_file.seek(0, os.SEEK_END)
+        self.next_docid = self.table_file.tell() // doc_table_record.size  # docid of the next record of the table
+        self.buffer_rows = buffer_rows
+        self.lines = []
+        self.records = []  # (docid, docno, length)
+
+    def add(self, docid, docno, length):
+        self.lines.append(str(docid) + collection_separator + str(docno) + collection_separator + str(length))
+        self.records.append((int(docid), int(docno), int(length)))
+        if len(self.records) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        # write the buffered rows on disk
+        if not self.records:
+            return
+        self.stats_file.write(chunk_line_separator.join(self.lines) + chunk_line_separator)
+        self.stats_file.flush()
+        # records with consecutive docids are packed together, the others (gaps, rewrites) are written one at a time
+        packed = bytearray()
+        for docid, docno, length in self.records:
+            if docid == self.next_docid:
+                packed += doc_table_record.pack(docno, length)
+                self.next_docid += 1
+            else:
+                self.table_file.write(packed)
+                packed = bytearray()
+                write_doc_table_record(self.table_file, docid, docno, length)
+                self.table_file.seek(0, os.SEEK_END)
+                self.next_docid = self.table_file.tell() // doc_table_record.size
+        self.table_file.write(packed)
+        self.table_file.flush()
+        self.lines = []
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.stats_file.close()
+        self.table_file.close()
+
+
+def build_doc_table(collection_statistics_path):
+    # convert stats.txt (docid,docno,length) to the binary table, used for indexes created before the table existed
+    path = doc_table_path(collection_statistics_path)
+    with open(collection_statistics_path, "r") as stats_file, open(path, "wb") as table_file:
+        for line in stats_file:
+            content = line.strip().split(collection_separator)
+            if len(content) == 3:
+                write_doc_table_record(table_file, content[0], content[1], content[2])
+    return path
+
+
+def load_doc_table(collection_statistics_path):
+    # open the binary table, building it from stats.txt if it's missing or older than stats.txt
+    path = doc_table_path(collection_statistics_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(collection_statistics_path):
+        print_log("building binary document table from " + collection_statistics_path, 2)
+        build_doc_table(collection_statistics_path)
+    return DocumentTable(path)
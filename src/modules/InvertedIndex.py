@@ -14,16 +14,27 @@ that allows you to use ASCII format during debugging and binary format for
 performance.
 """
 from src.config import *
+import heapq
 import os
-
-from src.modules.cache import cache_flush
-from src.modules.compression import to_unary, to_gamma, bit_stream_to_bytes
+from collections import deque
+import struct
+from array import array
+from itertools import groupby
+
+from src.modules.BlockDirectory import BlockDirectoryWriter, block_directory_path
+from src.modules.cache import cache_flush, result_cache_invalidate
+from src.modules.compression import encode_posting_blocks, read_encoded_posting_list, decode_posting_blocks
 from src.modules.document_processing import open_dataset
+from src.modules.DocumentTable import DocumentTable, StatsWriter, doc_table_path
+from src.modules.Lexicon import Lexicon, lexicon_sidecar_path
+from src.modules.PostingBuffer import PostingBuffer
 from src.modules.preprocessing import preprocess_text, count_token_occurrences
+from src.modules.scoring import block_upper_bounds, score_upper_bounds
 from src.modules.utils import readline_with_strip, print_log
 
-posting_buffer = []  # memory buffer
+posting_buffer = PostingBuffer()  # memory buffer
 posting_file_list = []  # list of file names
+chunk_record_header = struct.Struct("<II")  # binary chunks: token length (bytes), number of postings
 
 
 # REMINDER STRUCTURE LEXICON
@@ -46,6 +57,14 @@ class InvertedIndex:
         self.num_doc = 0
         self.index_len = 0
         self.lexicon_len = 0
+        # collection statistics, updated for each document added to stats.txt
+        self.total_tokens = 0
+        self.doc_len_average = 0
+        self.doc_len_max = 0
+        # postings in each block of the index file (0 for indexes saved with one blob for each posting list)
+        self.block_size = posting_block_size
+        # buffered writer of stats.txt and of the binary document table, open only while indexing
+        self.stats_writer = None
         print_log("created new index", priority=2)
 
     def rename(self, name):
@@ -68,14 +87,21 @@ class InvertedIndex:
 
     def delete_from_disk(self):
         # delete function that manage safe remove
+        self.close_stats_writer()
         if self.collection_statistics_path != file_blank_tag:
             os.remove(self.collection_statistics_path)
+            if os.path.exists(doc_table_path(self.collection_statistics_path)):
+                os.remove(doc_table_path(self.collection_statistics_path))
             self.collection_statistics_path = file_blank_tag
         if self.index_file_path != file_blank_tag:
             os.remove(self.index_file_path)
+            if os.path.exists(block_directory_path(self.index_file_path)):
+                os.remove(block_directory_path(self.index_file_path))
             self.index_file_path = file_blank_tag
         if self.lexicon_path != file_blank_tag:
             os.remove(self.lexicon_path)
+            if os.path.exists(lexicon_sidecar_path(self.lexicon_path)):
+                os.remove(lexicon_sidecar_path(self.lexicon_path))
             self.lexicon_path = file_blank_tag
         if self.config_path != file_blank_tag:
             os.remove(self.config_path)
@@ -83,6 +109,8 @@ class InvertedIndex:
 
     def save_on_disk(self):
         cache_flush()
+        self.close_stats_writer()
+        result_cache_invalidate(self.name)
         # index config and options are saved on disk, generating a filename based on its name
         if self.name == member_blank_tag:
             print_log("cannot save index config without a name", priority=2)
@@ -120,11 +148,17 @@ class InvertedIndex:
             config_file.write(str(self.num_doc) + chunk_line_separator)
             config_file.write(str(self.index_len) + chunk_line_separator)
             config_file.write(str(self.lexicon_len) + chunk_line_separator)
+
+            config_file.write(str(self.total_tokens) + chunk_line_separator)
+            config_file.write(str(self.doc_len_average) + chunk_line_separator)
+            config_file.write(str(self.doc_len_max) + chunk_line_separator)
+            config_file.write(str(self.block_size) + chunk_line_separator)
             print_log("index config saved successfully", priority=3)
 
     def reload_from_disk(self):
         # function called to load a previously created index, by reading a config file from HD
         cache_flush()
+        result_cache_invalidate(self.name)
         # returns True if the loading was successful
         print_log("loading index config file", priority=3)
         if self.config_path == file_blank_tag:
@@ -170,6 +204,16 @@ class InvertedIndex:
                         self.num_doc = int(readline_with_strip(config_file))
                         self.index_len = int(readline_with_strip(config_file))
                         self.lexicon_len = int(readline_with_strip(config_file))
+
+                        # collection statistics: missing in the configs saved by older versions (left to 0)
+                        total_tokens = readline_with_strip(config_file)
+                        if total_tokens != "":
+                            self.total_tokens = int(total_tokens)
+                            self.doc_len_average = float(readline_with_strip(config_file))
+                            self.doc_len_max = int(readline_with_strip(config_file))
+                        # block layout of the index file: missing in the configs saved by older versions
+                        block_size = readline_with_strip(config_file)
+                        self.block_size = int(block_size) if block_size != "" else 0
                         print_log("index " + str(self.name) + " loaded successfully", priority=1)
                     else:
                         # this should never happen
@@ -248,8 +292,16 @@ class InvertedIndex:
 
     def flush_collection_stats(self):
         # clean all the content of the content statistics file
+        self.close_stats_writer()
         if self.collection_statistics_path != file_blank_tag:
             os.remove(self.collection_statistics_path)
+            if os.path.exists(doc_table_path(self.collection_statistics_path)):
+                os.remove(doc_table_path(self.collection_statistics_path))
+            # statistics are computed again while scanning the collection
+            self.num_doc = 0
+            self.total_tokens = 0
+            self.doc_len_average = 0
+            self.doc_len_max = 0
             print_log("flushed collection for " + self.name, priority=1)
 
     def add_to_collection_stats(self, docid, docno, stats=0):
@@ -257,33 +309,38 @@ class InvertedIndex:
         if self.collection_statistics_path == file_blank_tag:
             print_log("CRITICAL ERROR: unable to access collection statistics for " + self.name, priority=0)
             return
-        with open(self.collection_statistics_path, mode="a") as collection:
-            collection.write(str(docid) + collection_separator + str(docno) + collection_separator + str(
-                stats) + chunk_line_separator)
-            self.num_doc += 1
+        if self.stats_writer is None:
+            # stats.txt and the binary table (one record for each docid, used by the query handler) stay open until the
+            # end of the scan: rows are buffered and written in blocks
+            self.stats_writer = StatsWriter(self.collection_statistics_path)
+        self.stats_writer.add(docid, docno, stats)
+        self.num_doc += 1
+        self.total_tokens += int(stats)
+        self.doc_len_average = self.total_tokens / self.num_doc
+        self.doc_len_max = max(self.doc_len_max, int(stats))
+
+    def flush_stats_writer(self):
+        # write the buffered collection statistics on disk
+        if self.stats_writer is not None:
+            self.stats_writer.flush()
+
+    def close_stats_writer(self):
+        if self.stats_writer is not None:
+            self.stats_writer.close()
+            self.stats_writer = None
 
     def create_posting_chunk(self, filename):
         # write a chunk of posting lists to disk
         # @ param filename: output file path (complete with file format)
         global posting_buffer
-        # posting_buffer is a list where each element have this structure:
-        #     [token_id, [docid, token_count]]
+        # posting_buffer maps each token to its columns of docids and frequencies
 
         # MANDATORY: every chunk must be ordinated
-        posting_buffer_sorted = sorted(posting_buffer, key=lambda x: x[0])
-        chunk_name = index_folder_path + self.name + "/" + filename
+        posting_buffer_sorted = posting_buffer.sorted_items()
+        chunk_name = root_directory + self.name + "/" + filename
         try:
-            with open(chunk_name, "w") as file:
-                for row in posting_buffer_sorted:
-                    row_string = str(row[0]) + posting_separator
-                    for pair in row[1:]:
-                        element = str(pair[0]) + docid_separator + str(pair[1])
-                        if pair == row[-1]:
-                            row_string += element
-                        else:
-                            row_string += element + element_separator
-                    file.write(row_string + chunk_line_separator)
-            posting_buffer = []
+            write_chunk_file(chunk_name, posting_buffer_sorted)
+            posting_buffer.clear()
         except IOError:
             print(IOError)
             print_log("Writing new posting file chunk to file. dumping chunk here: ", 5)
@@ -296,25 +353,31 @@ class InvertedIndex:
         global posting_file_list
         print_log("starting dataset scan", priority=1)
 
-        posting_buffer = []  # memory buffer
+        posting_buffer = PostingBuffer()  # memory buffer
         posting_file_list = []  # list of file names
 
         print_log("scan limited to " + str(limit_row_size) + " rows", priority=4)
         open_dataset(limit_row_size, self, add_document_to_index)
         print_log("dataset scan completed", priority=3)
+        self.close_stats_writer()
 
+        # document lengths are complete: required for the score upper bounds saved in the lexicon
+        doc_table = DocumentTable(doc_table_path(self.collection_statistics_path))
         if len(posting_file_list) > 0:
             # the last chunk is not full, but it's still important to write a file
             close_chunk(self)
 
             lines = merge_chunks(posting_file_list, self.index_file_path, self.lexicon_path,
                                  compression=self.compression,
-                                 delete_after_merge=delete_chunks)
+                                 delete_after_merge=delete_chunks,
+                                 doc_table=doc_table, avg=self.doc_len_average)
         else:
             # there is only one chunk, either for the size too big, the file count too small, or chunk splitting is
             # disabled
             lines = write_output_files(self.index_file_path, self.lexicon_path,
-                                       compression=self.compression)
+                                       compression=self.compression,
+                                       doc_table=doc_table, avg=self.doc_len_average)
+        doc_table.close()
         self.index_len += lines
 
         self.lexicon_len += lines
@@ -336,41 +399,10 @@ class InvertedIndex:
 
 
 def make_posting_list(list_doc_id, list_freq, compression="no"):
-    # Step 1: Encode the number of doc IDs
-    combined = list(zip(list_doc_id, list_freq))
-    combined.sort(key=lambda x: int(x[0]))
-
-    # split combined list
-    list_doc_id_sorted, list_freq_sorted = zip(*combined)
-
-    # convert them into lists
-    list_doc_id_sorted = list(list_doc_id_sorted)
-    list_freq_sorted = list(list_freq_sorted)
-    gap_list = []
-    previous_doc_id = 0
-    for doc_id in list_doc_id_sorted:
-        gap_list.append(int(doc_id) - previous_doc_id)
-        previous_doc_id = int(doc_id)
-    if compression != "no":
-        # Step 2: Encode the doc IDs using gap encoding
-        if compression == "unary":
-            encoded_gap_list = [to_unary(gap) for gap in gap_list]
-            encoded_freq_list = [to_unary(int(freq)) for freq in list_freq_sorted]
-        elif compression == "gamma":
-            encoded_gap_list = [to_gamma(gap) for gap in gap_list]
-            encoded_freq_list = [to_gamma(int(freq)) for freq in list_freq_sorted]
-        else:
-            raise ValueError(f"Unsupported encoding type: {compression}")
-
-        # Combine the bit streams: number of doc IDs, doc IDs, and frequencies
-        bit_stream = ''.join(encoded_gap_list) + ''.join(encoded_freq_list)
-
-        # Convert the bit stream into bytes
-        compressed_bytes = bit_stream_to_bytes(bit_stream)
-        return compressed_bytes
-    else:
-        posting_string = ",".join(list(map(str, gap_list))) + " " + ",".join(list_freq_sorted) + chunk_line_separator
-        return posting_string
+    # IMPORTANT: docids must be integers, already in increasing order (chunks and partitions are merged in order)
+    # the posting list is split in blocks of posting_block_size postings, each one with its header (see compression.py)
+    # docids are encoded as gaps, and each block is encoded with the compression of the index
+    return encode_posting_blocks(list_doc_id, list_freq, compression, posting_block_size)
 
 
 def load_from_disk(name):
@@ -413,65 +445,193 @@ def index_setup(name, stemming_flag, stop_words_flag, compression_flag, k, join_
 def add_posting_list(token_id, token_count, docid):
     # add new entries in posting list.
     global posting_buffer
-    stats = [docid, token_count]
-    found_token = False
-    found_doc = False
-    for posting_list in posting_buffer:
-        if posting_list[0] == token_id:
-            found_token = True
-            for pair in posting_list[1:]:
-                if pair[0] == docid:
-                    found_doc = True
-                    pair[1] += token_count
-                    break
-            if not found_doc:
-                posting_list.append(stats)
-            break
-    if not found_token:
-        posting_buffer.append([token_id, stats])
-    if index_chunk_size < 1:  # no limit on the chunk size
-        return False
-    if len(posting_buffer) > index_chunk_size:
+    posting_buffer.add(token_id, token_count, docid)
+    if posting_buffer.is_full(index_chunk_size):
         print_log("posting memory buffer is full", priority=4)
         return True  # chunk is big, time to write it on disk
     else:
         return False  # no need to write it on disk yet
 
 
-def write_output_files(index_file_path, lexicon_path, compression="no"):
+def write_output_files(index_file_path, lexicon_path, compression="no", doc_table=None, avg=0):
+    # there is only one chunk: the memory buffer is written directly as index and lexicon
     global posting_buffer
-    written_lines = 0
-
     # MANDATORY: every chunk must be ordinated
-    posting_buffer_sorted = sorted(posting_buffer, key=lambda x: x[0])
-
-    with open(index_file_path, "w") as index_file:
-        with open(lexicon_path, "w") as lexicon_file:
-            for element in posting_buffer_sorted:
-                token = str(element[0])
-                occurrence_list = []
-                doc_list = []
-                for doc, f in element[1:]:
-                    doc_list.append(str(doc))
-                    occurrence_list.append(str(f))
-                posting_offset = index_file.tell()
-                index_file.write(make_posting_list(doc_list, occurrence_list, compression))
-                written_lines += 1
-                lexicon_file.write(token + element_separator + str(len(doc_list)) + element_separator + str(
-                    posting_offset) + chunk_line_separator)
+    return write_posting_lists(posting_buffer.sorted_items(), index_file_path, lexicon_path, compression,
+                               doc_table, avg)
 
-    return written_lines
 
+def encode_posting_batch(batch, compression="no"):
+    # @ param batch : list of (token, docids, freqs)
+    # @ return : list of encoded posting lists (bytes)
+    return [make_posting_list(docids, freqs, compression) for _, docids, freqs in batch]
 
-def merge_chunks(file_list, index_file_path, lexicon_file_path, compression="no", delete_after_merge=True):
+
+def encode_posting_lists(posting_lists, compression="no", pool=None):
+    # encode the posting lists, in a process pool if available. the order of the posting lists is kept, and only a few
+    # batches are sent to the pool at a time (the posting lists of a whole index may not fit in memory)
+    # @ return : generator of (token, docids, freqs, encoded posting list)
+    if pool is None:
+        for token, docids, freqs in posting_lists:
+            yield token, docids, freqs, make_posting_list(docids, freqs, compression)
+        return
+    pending = deque()
+
+    def next_results():
+        batch, result = pending.popleft()
+        for (token, docids, freqs), posting in zip(batch, result.get()):
+            yield token, docids, freqs, posting
+
+    batch = []
+    for posting_list in posting_lists:
+        batch.append(posting_list)
+        if len(batch) >= encode_batch_size:
+            pending.append((batch, pool.apply_async(encode_posting_batch, (batch, compression))))
+            batch = []
+            if len(pending) > 2 * (os.cpu_count() or 1):
+                yield from next_results()
+    if batch:
+        pending.append((batch, pool.apply_async(encode_posting_batch, (batch, compression))))
+    while pending:
+        yield from next_results()
+
+
+def write_posting_lists(posting_lists, index_file_path, lexicon_file_path, compression="no", doc_table=None,
+                        avg=0, pool=None):
+    # write the index file and the lexicon file, one row for each posting list
+    # @ param posting_lists : iterable of (token, docids, freqs), in alphabetical order of the tokens
+    # @ param doc_table : DocumentTable of the collection. if set, the lexicon stores the score upper bounds, and the
+    #                     block directory stores the upper bounds of each block
+    # @ param avg : average document length, required by the upper bounds of BM11 and BM25
+    # @ param pool : multiprocessing pool used to encode the posting lists (None: encoded in this process)
+    # @ return : number of rows written
     written_lines = 0
-    reader_list = []  # list of pointers to files
-    first_element_list = []  # list of the next (lowest) element taken from each file
-    for file in file_list:
-        reader = open(file, "r+")
-        reader_list.append(reader)
-        first_element_list.append(reader.readline())
+    posting_offset = 0  # bytes written in the index file (tell() would flush the buffer at each call)
+    with_max_scores = doc_table is not None and avg > 0
+    # in-memory copy of the lexicon, saved as binary sidecar for the query handlers
+    lexicon = Lexicon(len(scoring_function_config) if with_max_scores else 0)
+    block_directory = None
+    if with_max_scores:
+        block_directory = BlockDirectoryWriter(block_directory_path(index_file_path), posting_block_size)
+    # the index file is always written as bytes: offsets are the same on every platform
+    with open(index_file_path, "wb", buffering=merge_write_buffer_size) as index_file, \
+            open(lexicon_file_path, "w", buffering=merge_write_buffer_size) as lexicon_file:
+        for token, docids, freqs, posting in encode_posting_lists(posting_lists, compression, pool):
+            index_file.write(posting)
+            lexicon_line = str(token) + element_separator + str(len(docids)) + element_separator + str(posting_offset)
+            max_scores = ()
+            if with_max_scores:
+                # dynamic pruning: the highest weight of the token in each block and in any document,
+                # for each scoring function
+                block_bounds = block_upper_bounds(freqs, doc_table.lengths(docids), avg, posting_block_size)
+                block_directory.add(docids, block_bounds)
+                max_scores = score_upper_bounds(block_bounds)
+                lexicon_line += element_separator + collection_separator.join(map(str, max_scores))
+            lexicon_file.write(lexicon_line + chunk_line_separator)
+            lexicon.add(str(token), len(docids), posting_offset, max_scores)
+            posting_offset += len(posting)
+            written_lines += 1
+            if written_lines % 100000 == 0:
+                print_log("posting lists written: " + str(written_lines), priority=3)
+    if block_directory is not None:
+        block_directory.close()
+    lexicon.close(posting_offset)
+    lexicon.save(lexicon_sidecar_path(lexicon_file_path))
+    return written_lines
+
 
+def read_index_file(index_file_path, lexicon_file_path, compression="no"):
+    # read an index file (block layout) one posting list at a time: lexicon and index have the same order
+    # @ return : generator of (token, docids, freqs)
+    with open(index_file_path, "rb", buffering=merge_write_buffer_size) as index_file, \
+            open(lexicon_file_path, "r", buffering=merge_write_buffer_size) as lexicon_file:
+        for lexicon_line in lexicon_file:
+            token = lexicon_line.split(element_separator)[0]
+            docids, freqs = decode_posting_blocks(read_encoded_posting_list(index_file), compression)
+            yield token, docids, freqs
+
+
+def chunk_file_name(chunk_number):
+    # chunk files are named with their creation order, and the extension tells the chunk format
+    if chunk_format_config == "binary":
+        return "chunk_posting_" + str(chunk_number) + binary_file_format
+    return "chunk_posting_" + str(chunk_number) + file_format
+
+
+def write_chunk_file(file_path, posting_lists):
+    # write a chunk of posting lists, in the format chosen by chunk_format_config
+    # @ param posting_lists : list of (token, docids, freqs), in alphabetical order of the tokens
+    if file_path.endswith(binary_file_format):
+        # binary chunk record structure:
+        #     [token length, posting count] [token bytes] [docids as uint32] [freqs as uint32]
+        with open(file_path, "wb", buffering=merge_write_buffer_size) as file:
+            for token, docids, freqs in posting_lists:
+                token_bytes = str(token).encode("utf-8")
+                file.write(chunk_record_header.pack(len(token_bytes), len(docids)))
+                file.write(token_bytes)
+                file.write(docids.tobytes())
+                file.write(freqs.tobytes())
+    else:
+        # text chunk line structure:
+        #     token_id:docid|token_count;docid|token_count
+        with open(file_path, "w", buffering=merge_write_buffer_size) as file:
+            for token, docids, freqs in posting_lists:
+                row_string = str(token) + posting_separator + element_separator.join(
+                    [str(docid) + docid_separator + str(freq) for docid, freq in zip(docids, freqs)])
+                file.write(row_string + chunk_line_separator)
+
+
+def read_chunk_file(file_path):
+    # read a chunk file one posting list at a time, parsing it only once
+    # @ return : generator of (token, docids, freqs), in the same order of the file
+    if file_path.endswith(binary_file_format):
+        with open(file_path, "rb", buffering=merge_write_buffer_size) as chunk_file:
+            while True:
+                header = chunk_file.read(chunk_record_header.size)
+                if len(header) < chunk_record_header.size:
+                    break  # end of file
+                token_length, postings_count = chunk_record_header.unpack(header)
+                token = chunk_file.read(token_length).decode("utf-8")
+                docids = array('I')
+                freqs = array('I')
+                docids.frombytes(chunk_file.read(postings_count * docids.itemsize))
+                freqs.frombytes(chunk_file.read(postings_count * freqs.itemsize))
+                yield token, docids, freqs
+    else:
+        with open(file_path, "r", buffering=merge_write_buffer_size) as chunk_file:
+            for line in chunk_file:
+                line = line.rstrip()
+                if not line:
+                    continue
+                token, postings = line.split(posting_separator, 1)
+                docids = array('I')
+                freqs = array('I')
+                for element in postings.split(element_separator):
+                    docid, freq = element.split(docid_separator)
+                    docids.append(int(docid))
+                    freqs.append(int(freq))
+                yield token, docids, freqs
+
+
+def merge_posting_streams(streams):
+    # k-way merge of sorted streams of posting lists, using a heap to pick the lowest token
+    # @ param streams : list of iterables of (token, docids, freqs), each one in alphabetical order of the tokens
+    # IMPORTANT: heapq.merge keeps the order of the streams for equal tokens. streams must be passed in docid order
+    # (chunk 0 before chunk 1, and so on), so the docid runs of the same token are concatenated without sorting
+    # @ return : generator of (token, docids, freqs), one for each token
+    merged = heapq.merge(*streams, key=lambda element: element[0])
+    for token, group in groupby(merged, key=lambda element: element[0]):
+        docids = array('I')
+        freqs = array('I')
+        for _, run_docids, run_freqs in group:
+            # token found in more than one stream: runs are appended one after the other
+            docids.extend(run_docids)
+            freqs.extend(run_freqs)
+        yield token, docids, freqs
+
+
+def merge_chunks(file_list, index_file_path, lexicon_file_path, compression="no", delete_after_merge=True,
+                 doc_table=None, avg=0):
     if os.path.exists(index_file_path):
         # delete the file if any previous duplicate was present
         os.remove(index_file_path)
@@ -479,77 +639,24 @@ def merge_chunks(file_list, index_file_path, lexicon_file_path, compression="no"
     if os.path.exists(lexicon_file_path):
         # delete the file if any previous duplicate was present
         os.remove(lexicon_file_path)
-    if compression != "no":
-        index_file = open(index_file_path, "wb+")
-    else:
-        index_file = open(index_file_path, "w+")
-    lexicon_file = open(lexicon_file_path, "w+")
-
-    while True:
-        next_chunk_index = []
-        # i have to compare every element of firstelemlist
-        i = 0
-        output_row = ""  # list of elements for the posting list
-        # example of output row :: ["0|1" , "1|2"]
-        output_key = ""  # token as string
-        # look at each first element, search the lowest, write its index in next_index
-        for element in first_element_list:
-            # make sure the list is not empty
-            if element != "empty":
-                element = element.replace(" \n", "")
-                element_splitted = element.split(sep=posting_separator)
-                # "lowest" is in alphabetical order
-                if output_key == "" or element_splitted[0] < output_key:
-                    output_key, output_row = element_splitted[0], element_splitted[1].split(element_separator)
-                    next_chunk_index = [i]
-                elif element_splitted[0] == output_key:
-                    # example of "element_splitted[i]: token1:docid1|count;docid2|count;................docidN|count
-                    for ep in element_splitted[1].split(element_separator):
-                        output_row.append(ep)
-                    output_row = sorted(output_row,
-                                        key=lambda x: x.split(docid_separator)[0])
-                    next_chunk_index.append(i)
-
-            i += 1
-        if len(next_chunk_index) > 0:
-            # move the list pointer to the next element
-            for index in next_chunk_index:
-                first_element_list[index] = reader_list[index].readline()
-                if len(first_element_list[index]) == 0:
-                    first_element_list[index] = "empty"
-
-            # OUTPUT: writing the index file
-            line = ""
-            doc_list = []
-            occurrence_list = []
-            for e in output_row:
-                elem = e.split("|")
-                doc_list.append(elem[0])
-                occurrence_list.append(elem[1])
-            posting_offset = index_file.tell()
-            index_file.write(make_posting_list(doc_list, occurrence_list, compression))
-            written_lines += 1
-            lexicon_file.write(output_key + element_separator + str(len(doc_list)) + element_separator + str(
-                posting_offset) + chunk_line_separator)
-        else:
-            # all lists are empty
-            break
+
+    # chunks are read in the same order they were created, so docids are already ordered
+    streams = [read_chunk_file(file) for file in file_list]
+    written_lines = write_posting_lists(merge_posting_streams(streams), index_file_path, lexicon_file_path,
+                                        compression, doc_table, avg)
 
     print_log("Chunks merge finished for ", 1)
-    for file in reader_list:
-        file.close()
     if delete_after_merge:
         print_log("Deleting chunks after merge", 2)
         for file_name in file_list:
             os.remove(file_name)
-    index_file.close()
-    lexicon_file.close()
     return written_lines
 
 
 def close_chunk(index):
     global posting_file_list
-    new_chunk_post = index.create_posting_chunk("chunk_posting_" + str(len(posting_file_list)) + file_format)
+    index.flush_stats_writer()
+    new_chunk_post = index.create_posting_chunk(chunk_file_name(len(posting_file_list)))
     posting_file_list.append(new_chunk_post)
     print_log("chunks created: ", 5)
     print_log(posting_file_list, 5)
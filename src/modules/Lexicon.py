@@ -0,0 +1,129 @@
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+from src.config import element_separator, collection_separator, binary_file_format, scoring_function_config
+from src.modules.utils import print_log
+
+# binary sidecar header: magic string, number of tokens, size in bytes of the tokens block, score columns
+lexicon_header = struct.Struct("<4sIQI")
+lexicon_magic = b"LEX2"
+
+
+class Lexicon:
+    def __init__(self, score_columns=0):
+        # the whole lexicon is kept in memory as sorted columns, so a lookup is a binary search
+        self.terms = []  # tokens, in alphabetical order
+        self.doc_freqs = array('I')  # number of documents containing the token
+        self.offsets = array('Q')  # start of the posting list in the index file (one more item: end of the index)
+        # score upper bounds (IDF = 1) for each scoring function, score_columns values for each token
+        # 0 columns: the index has been created without upper bounds
+        self.score_columns = score_columns
+        self.max_scores = array('d')
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, token, doc_freq, offset, max_scores=()):
+        # tokens must be added in alphabetical order
+        self.terms.append(token)
+        self.doc_freqs.append(int(doc_freq))
+        self.offsets.append(int(offset))
+        if self.score_columns > 0:
+            self.max_scores.extend(map(float, max_scores))
+
+    def close(self, index_size):
+        # the end of the last posting list is the end of the index file
+        self.offsets.append(int(index_size))
+
+    def lookup(self, token):
+        # @ return : position of the token in the lexicon, -1 if not found
+        position = bisect_left(self.terms, token)
+        if position < len(self.terms) and self.terms[position] == token:
+            return position
+        return -1
+
+    def search(self, token):
+        # same output of search_in_lexicon
+        # @ return 1: offset interval <start,stop> of the posting list in the index file
+        # @ return 2: doc frequency: number of documents that contain the token at least once
+        position = self.lookup(token)
+        if position == -1:
+            print_log("Cannot find token " + str(token) + " in lexicon", 2)
+            return [], -1
+        return [self.offsets[position], self.offsets[position + 1]], self.doc_freqs[position]
+
+    def has_max_scores(self):
+        return self.score_columns == len(scoring_function_config)
+
+    def max_score(self, token, scoring):
+        # @ return : upper bound of the weight of the token in any document (with IDF = 1), -1 if not available
+        position = self.lookup(token)
+        if position == -1 or not self.has_max_scores():
+            return -1
+        return self.max_scores[position * self.score_columns + scoring_function_config.index(scoring)]
+
+    def save(self, path):
+        # binary sidecar structure:
+        #     [header] [tokens separated by new lines] [doc freqs as uint32] [offsets as uint64]
+        #     [score upper bounds as float64]
+        terms_block = "\n".join(self.terms).encode("utf-8")
+        with open(path, "wb") as file:
+            file.write(lexicon_header.pack(lexicon_magic, len(self.terms), len(terms_block), self.score_columns))
+            file.write(terms_block)
+            file.write(self.doc_freqs.tobytes())
+            file.write(self.offsets.tobytes())
+            file.write(self.max_scores.tobytes())
+
+    def load(self, path):
+        # @ return : True if the sidecar was read successfully
+        with open(path, "rb") as file:
+            header = file.read(lexicon_header.size)
+            if len(header) < lexicon_header.size or header[:len(lexicon_magic)] != lexicon_magic:
+                # sidecar written by an older version
+                return False
+            magic, count, terms_size, self.score_columns = lexicon_header.unpack(header)
+            terms_block = file.read(terms_size).decode("utf-8")
+            self.terms = terms_block.split("\n") if count > 0 else []
+            self.doc_freqs = array('I')
+            self.doc_freqs.frombytes(file.read(count * self.doc_freqs.itemsize))
+            self.offsets = array('Q')
+            self.offsets.frombytes(file.read((count + 1) * self.offsets.itemsize))
+            self.max_scores = array('d')
+            self.max_scores.frombytes(file.read(count * self.score_columns * self.max_scores.itemsize))
+        return len(self.terms) == count and len(self.offsets) == count + 1 and len(
+            self.max_scores) == count * self.score_columns
+
+    def read_text(self, lexicon_path, index_file_path):
+        # parse the text lexicon (token;doc_freq;offset or token;doc_freq;offset;max_scores) row by row
+        with open(lexicon_path, "r") as lexicon_file:
+            for line in lexicon_file:
+                content = line.strip().split(element_separator)
+                if len(content) >= 3:
+                    if len(self.terms) == 0 and len(content) >= 4:
+                        self.score_columns = len(content[3].split(collection_separator))
+                    max_scores = content[3].split(collection_separator) if self.score_columns > 0 else ()
+                    self.add(content[0], content[1], content[2], max_scores)
+        self.close(os.path.getsize(index_file_path))
+
+
+def lexicon_sidecar_path(lexicon_path):
+    # the binary lexicon is saved next to the text one, with the same name
+    return os.path.splitext(lexicon_path)[0] + binary_file_format
+
+
+def load_lexicon(lexicon_path, index_file_path):
+    # load the lexicon in memory, reading the binary sidecar if it's available and up to date
+    # otherwise the text lexicon is parsed once, and the sidecar is written for the next time
+    lexicon = Lexicon()
+    sidecar_path = lexicon_sidecar_path(lexicon_path)
+    if os.path.exists(sidecar_path) and os.path.getmtime(sidecar_path) >= os.path.getmtime(lexicon_path):
+        if lexicon.load(sidecar_path):
+            print_log("lexicon loaded from " + sidecar_path, 3)
+            return lexicon
+        lexicon = Lexicon()
+    print_log("building binary lexicon from " + lexicon_path, 2)
+    lexicon.read_text(lexicon_path, index_file_path)
+    lexicon.save(sidecar_path)
+    return lexicon
@@ -0,0 +1,55 @@
+from array import array
+
+# rough estimate (in bytes) of the memory used by python objects in the buffer
+# a new token costs a dict slot, the string object, the entry list and two empty arrays
+token_memory_overhead = 300
+# one posting is a docid and a frequency, both stored as 4 bytes unsigned integers
+posting_memory_size = 2 * array('I').itemsize
+
+
+class PostingBuffer:
+    def __init__(self):
+        # in-memory accumulator of posting lists, used while scanning the collection
+        # each token is mapped to two parallel columns: [array of docids, array of frequencies]
+        self.postings = {}
+        self.memory_size = 0  # estimated number of bytes held by the buffer
+        self.postings_count = 0
+
+    def __len__(self):
+        # number of tokens (one token is one line in the chunk file)
+        return len(self.postings)
+
+    def is_empty(self):
+        return len(self.postings) == 0
+
+    def add(self, token_id, token_count, docid):
+        # add one posting in O(1): documents are read in order, so a repeated docid can only be the last one
+        entry = self.postings.get(token_id)
+        if entry is None:
+            entry = [array('I'), array('I')]
+            self.postings[token_id] = entry
+            self.memory_size += token_memory_overhead + len(token_id)
+        docids, freqs = entry
+        if docids and docids[-1] == docid:
+            freqs[-1] += token_count
+        else:
+            docids.append(docid)
+            freqs.append(token_count)
+            self.memory_size += posting_memory_size
+            self.postings_count += 1
+
+    def is_full(self, memory_limit):
+        # @ param memory_limit : maximum size in bytes. if it's lower than 1, the buffer is never full
+        if memory_limit < 1:
+            return False
+        return self.memory_size >= memory_limit
+
+    def sorted_items(self):
+        # MANDATORY: every chunk must be ordinated
+        # returns a list of (token, docids, freqs), in alphabetical order of the tokens
+        return [(token, entry[0], entry[1]) for token, entry in sorted(self.postings.items())]
+
+    def clear(self):
+        self.postings = {}
+        self.memory_size = 0
+        self.postings_count = 0
@@ -1,20 +1,119 @@
+from bisect import bisect_left
+
+import numpy as np
+
+from src.config import posting_block_size
+from src.modules.compression import read_block_headers, decode_posting_block, decode_posting_blocks
+
+end_of_list = 2 ** 32  # docid returned by a cursor after the last posting (greater than any uint32 docid)
+
+
+def gallop(values, target, start):
+    # exponential search: first position (from start) of a value greater or equal than target
+    # the jumps double until they pass the target, then a binary search is done on the last interval:
+    # O(log distance), faster than a plain binary search when the target is close to the start
+    # @ param values : sorted list
+    # @ return : position in values, len(values) if every value is lower than target
+    step = 1
+    stop = start
+    while stop < len(values) and values[stop] < target:
+        start = stop + 1
+        stop += step
+        step *= 2
+    return bisect_left(values, target, start, min(stop, len(values)))
+
+
 class PostingList:
     def __init__(self, key):
         self.key = key  # token, string
-        self.current = 0  # pointer to current index, int
-        self.docids = []  # list of doc ids
-        self.freqs = []  # list of frequencies
-        self.size = -1  # len(docids) = len(freqs)
+        self.size = -1  # number of postings
+        # postings are stored in blocks, with one skip entry (last docid) for each block: the cursor jumps between
+        # skip entries with a galloping search, and decodes only the block it lands in
+        self.skip_docids = []  # last docid of each block
+        # encoded postings (block layout of the index file, see compression.py)
+        self.data = b""
+        self.compression = "no"
+        self.skip_offsets = [0]  # byte offset of each block in data (one more item: end of the last block)
+        self.freq_offsets = []  # byte offset of the frequencies of each block in data
+        # postings already decoded (indexes saved without the block layout): numpy arrays of docids and freqs
+        self.decoded_docids = None
+        self.decoded_freqs = None
+        # cursor: current block (decoded), and current position in the block
+        self.block = 0
+        self.block_docids = []
+        self.block_freqs = []
+        self.position = 0
+        # dynamic pruning: score upper bounds of the whole list and of each block of postings
+        self.max_score = 0
+        self.block_last_docids = []  # last docid of each block of the block directory
+        self.block_max_scores = []  # maximum score of each block of the block directory
+        self.current_block = 0  # pointer to the block used by the block-max functions
 
     # functions: described in the laboratory slides
-    def set_docids(self, d_list):
-        self.docids = d_list
-        self.size = min(len(self.docids), len(self.freqs))
+    def set_encoded(self, data, compression="no"):
+        # read the skip entries of an encoded posting list: blocks are decoded later, only when needed
+        # @ param data : posting list read from the index file (block layout)
+        self.size, self.skip_docids, self.skip_offsets, self.freq_offsets = read_block_headers(data)
+        self.data = data
+        self.compression = compression
+        self.decoded_docids = None
+        self.decoded_freqs = None
+        self.reset()
+
+    def set_postings(self, docids, freqs):
+        # build the skip entries of decoded postings (blocks of posting_block_size postings)
+        # @ param docids : numpy array of docids (in increasing order)
+        # @ param freqs : numpy array of frequencies
+        self.size = min(len(docids), len(freqs))
+        self.decoded_docids = np.asarray(docids)[:self.size]
+        self.decoded_freqs = np.asarray(freqs)[:self.size]
+        last_positions = np.arange(posting_block_size - 1, self.size + posting_block_size - 1, posting_block_size)
+        self.skip_docids = self.decoded_docids[np.minimum(last_positions, self.size - 1)].tolist()
+        self.reset()
+
+    def all_docids(self):
+        # decode every block
+        # @ return : numpy array of docids
+        if self.decoded_docids is not None:
+            return self.decoded_docids
+        return self.concatenate_blocks(0)
+
+    def all_freqs(self):
+        # @ return : numpy array of freqs
+        if self.decoded_freqs is not None:
+            return self.decoded_freqs
+        return self.concatenate_blocks(1)
 
-    def set_freqs(self, f_list):
-        for f in f_list:
-            self.freqs.append(int(f))
-        self.size = min(len(self.docids), len(self.freqs))
+    def concatenate_blocks(self, column):
+        if not self.skip_docids:
+            return np.zeros(0, dtype=np.uint32)
+        # the whole list is decoded in one call (one vectorized pass for pfor)
+        return decode_posting_blocks(self.data, self.compression)[column]
+
+    def decode(self, block):
+        # @ return : numpy array of docids, numpy array of freqs of the block
+        if self.decoded_docids is not None:
+            start = block * posting_block_size
+            return (self.decoded_docids[start:start + posting_block_size],
+                    self.decoded_freqs[start:start + posting_block_size])
+        previous_docid = self.skip_docids[block - 1] if block > 0 else None
+        return decode_posting_block(self.data, self.skip_offsets[block], self.freq_offsets[block],
+                                    self.skip_offsets[block + 1], previous_docid, self.compression)
+
+    def load_block(self, block):
+        # move the cursor on the first posting of a block
+        self.block = block
+        self.position = 0
+        if block < len(self.skip_docids):
+            # the cursor reads one posting at a time: python lists are faster than numpy arrays for that
+            docids, freqs = self.decode(block)
+            self.block_docids, self.block_freqs = docids.tolist(), freqs.tolist()
+        else:
+            self.block_docids, self.block_freqs = [], []
+
+    def reset(self):
+        # move the cursor on the first posting
+        self.load_block(0)
 
     def key(self):
         return self.key
@@ -23,33 +122,53 @@ class PostingList:
         return self.key
 
     def docid(self):
-        return self.docids[self.current]
+        # @ return : docid of the current posting, end_of_list if the cursor is after the last posting
+        if self.position >= len(self.block_docids):
+            return end_of_list
+        return self.block_docids[self.position]
 
     def freq(self):
-        return self.freqs[self.current]
+        return self.block_freqs[self.position]
 
     def next(self):
-        self.current += 1
-
-    def nextGEQ_posting(self, d):
-        # Theory
-        if d in self.docids:
-            geq = self.docids.index(d)
-            if geq >= self.current:
-                self.current = geq + 1
-            else:
-                print("error on posting list: cannot find nextGEQ than " + str(d))
-        else:
-            geq = self.current
-            while True:
-                if self.docids[geq] == d:
-                    self.current = geq
-                    break
-                else:
-                    geq += 1
-                    if geq >= self.size:
-                        print("error on posting list: cannot find nextGEQ than " + str(d))
-                        break
-
-    def move_cursor(self, p):
-        self.current = p
+        # move to the next posting
+        # @ return : the new current docid
+        self.position += 1
+        if self.position >= len(self.block_docids) and self.block < len(self.skip_docids):
+            self.load_block(self.block + 1)
+        return self.docid()
+
+    def nextGEQ(self, d):
+        # move to the first posting with docid greater or equal than d (never backwards)
+        # @ return : the new current docid
+        if self.docid() >= d:
+            return self.docid()
+        if d > self.skip_docids[self.block]:
+            # the docid is not in the current block: search on the skip entries of the next blocks
+            self.load_block(gallop(self.skip_docids, d, self.block + 1))
+        self.position = gallop(self.block_docids, d, self.position)
+        return self.docid()
+
+    def set_block_max_scores(self, last_docids, max_scores):
+        # @ param last_docids : last docid of each block of the block directory
+        # @ param max_scores : maximum score of each block (already multiplied by the IDF)
+        self.block_last_docids = last_docids
+        self.block_max_scores = max_scores
+        self.current_block = 0
+
+    def block_max_score(self, d):
+        # maximum score of the block that would contain the docid d, without moving the posting cursor
+        # @ return : 0 if d is after the last block
+        if self.current_block > 0 and self.block_last_docids[self.current_block - 1] >= d:
+            # d is before the block selected last time: search from the first one
+            self.current_block = 0
+        self.current_block = bisect_left(self.block_last_docids, d, self.current_block)
+        if self.current_block >= len(self.block_last_docids):
+            return 0
+        return self.block_max_scores[self.current_block]
+
+    def block_last_docid(self):
+        # last docid of the block selected by block_max_score
+        if self.current_block >= len(self.block_last_docids):
+            return end_of_list
+        return self.block_last_docids[self.current_block]
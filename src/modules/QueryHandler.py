@@ -11,48 +11,98 @@ Query Processing Efficiency. You should implement skipping in your inverted list
 you should implement the nextGEQ() operation in your posting interface, and
 you should implement a dynamic pruning algorithm.
 '''
+import heapq
 import math
 
+import numpy as np
+
 from src.config import *
-from src.modules.cache import cache_hit_or_miss, cache_get_posting_list, cache_push
-from src.modules.compression import decode_posting_list
+from src.modules.cache import cache_hit_or_miss, cache_get_posting_list, cache_push, result_cache_key, \
+    result_cache_get, result_cache_push
+from src.modules.compression import decode_posting_list, decode_posting_blocks
+from src.modules.DocumentTable import load_doc_table
+from src.modules.Lexicon import load_lexicon
 from src.modules.PostingList import PostingList
 from src.modules.preprocessing import preprocess_text
+from src.modules.BlockDirectory import load_block_directory
+from src.modules.dynamic_pruning import PruningCounters, conjunctive, maxscore, wand, block_max_wand
+from src.modules.scoring import inverse_document_frequency, term_weights, posting_weight
 from src.modules.utils import get_last_line, ternary_search, get_row_id, print_log, set_search_interval, next_GEQ_line
 import time
 
 
 def get_top_k(k, results):
-    # rearrange a list of QueryResult and cut it to k elements
+    # select the best k results, in descending order of score (ties are ordered by increasing docid)
+    # @ param results : dictionary {docid : score}, or a couple of numpy arrays (docids, scores)
+    # @ return : list of (docid, score), docids as strings
     print_log("Results list:", 5)
     print_log(results, 5)
-    result_list = []
-    if results != {}:
-        print_log("ordering the results list", 4)
-        for key, score in results.items():
-            result_list.append((key, score))
-        # order in descending order with the reverse flag
-        ordered = sorted(result_list, key=lambda x: x[1], reverse=True)
-        if len(ordered) > k:
-            print_log("extracted top k elements of relevant documents", 4)
-            return ordered[:k]
-        else:
-            print_log("relevant documents are less than k", 2)
-            return ordered
+    if isinstance(results, dict):
+        return top_k_from_dict(k, results)
+    docids, scores = results
+    return top_k_from_arrays(k, docids, scores)
+
+
+def top_k_from_dict(k, results):
+    # bounded heap of k elements: O(n log k) instead of sorting the whole dictionary
+    if not results:
+        return []
+    if len(results) <= k:
+        print_log("relevant documents are less than k", 2)
+    print_log("extracted top k elements of relevant documents", 4)
+    best = heapq.nsmallest(k, results.items(), key=lambda x: (-x[1], int(x[0])))
+    return [(str(docid), score) for docid, score in best]
+
+
+def top_k_from_arrays(k, docids, scores):
+    # partial selection with argpartition: O(n), then only the selected elements are sorted
+    if len(scores) == 0:
+        return []
+    if len(scores) > k:
+        print_log("extracted top k elements of relevant documents", 4)
+        # k-th best score: every document scored above it is in the top k, the ones equal to it are ties
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        selected = np.flatnonzero(scores >= kth_score)
     else:
-        return result_list
+        print_log("relevant documents are less than k", 2)
+        selected = np.arange(len(scores))
+    # lexsort: the last key is the primary one
+    order = selected[np.lexsort((docids[selected], -scores[selected]))][:k]
+    return list(zip(map(str, docids[order].tolist()), scores[order].tolist()))
 
 
 class QueryHandler:
 
     def __init__(self, index_file):
         self.index = index_file
+        self.open_index_files()
+        # postings evaluated and skipped by the last query with dynamic pruning
+        self.pruning_counters = PruningCounters()
+        # True if the results of the last query came from the query result cache (pruning counters not updated)
+        self.last_query_cached = False
+
+    def open_index_files(self):
+        # (re)load the files of the index: called again after the collection is scanned again
+        index_file = self.index
         # file stats.txt: doc_id,doc_no,doc_length
-        self.doc_lengths = 0  # read from stats.txt
-        self.doc_ids = 0  # read from stats.txt
         self.num_docs = index_file.num_doc
-        self.doc_len_average = self.compute_docs_average(index_file.num_doc)  # len (stats.txt)
-        self.doc_stats_cache = {}
+        # binary copy of stats.txt, memory mapped: the length of a document is one array index
+        self.doc_table = load_doc_table(index_file.collection_statistics_path)
+        # collection statistics are saved in the index config at indexing time
+        self.doc_len_average = index_file.doc_len_average
+        if index_file.total_tokens == 0:
+            self.doc_len_average = self.compute_docs_average(index_file.num_doc)
+        # the lexicon is loaded only once: lookups are binary searches in memory
+        self.lexicon = load_lexicon(index_file.lexicon_path, index_file.index_file_path)
+        # per-block score upper bounds, used by block_max_wand (None for indexes created without them)
+        self.block_directory = load_block_directory(index_file.index_file_path, self.lexicon, index_file.block_size)
+
+    def close(self):
+        # release the memory mapped files of the index (stats.bin, blocks.bin): required before removing or rewriting
+        # them, for example when the index is flushed and the collection is scanned again
+        self.doc_table.close()
+        if self.block_directory is not None:
+            self.block_directory.close()
 
     def prepare_query(self, query_raw):
         # takes a query (string, in natural language) and apply the same preprocessing steps applied to the dataset
@@ -61,20 +111,19 @@ class QueryHandler:
 
     def compute_docs_average(self, docs_count):
         # required for some scoring functions
-        total_length_doc = 0
-        with open(self.index.collection_statistics_path, 'rb') as f:
-            while True:
-                content = f.readline()
-                if len(content) == 0:
-                    break
-                content = content.decode("utf-8").strip().split(collection_separator)
-                total_length_doc += int(content[2])
+        # used only for indexes whose config has no collection statistics (created by older versions)
+        print_log("collection statistics not found in the index config: reading the document table", 2)
+        total_length_doc = int(self.doc_table.records["length"].sum(dtype=np.uint64))
         avg_length = total_length_doc / docs_count
         return avg_length
 
-    def query(self, query_string, search_file_algorithms):
+    def query(self, query_string, search_file_algorithms, use_cache=True):
         # executes a whole query, starting from natural language and outputting the top k results
+        # @ param use_cache : False to always execute the query (evaluation and benchmarks: the key of the query
+        #                     result cache does not include the search algorithm)
         print_log("received query", 3)
+        self.pruning_counters = PruningCounters()
+        self.last_query_cached = False
 
         # preprocessing for the query string
         tic = time.perf_counter()
@@ -84,6 +133,24 @@ class QueryHandler:
         toc = time.perf_counter()
         print("prepare_query created in " + str(toc - tic))
 
+        if not use_cache:
+            return self.execute_query(query_terms, search_file_algorithms)
+
+        # repeated query: the results are already in the query result cache
+        cache_key = result_cache_key(self.index, query_terms)
+        results = result_cache_get(cache_key)
+        if results is not None:
+            print_log("query result cache hit", 3)
+            self.last_query_cached = True
+            return results
+        results = self.execute_query(query_terms, search_file_algorithms)
+        result_cache_push(cache_key, results)
+        return results
+
+    def execute_query(self, query_terms, search_file_algorithms):
+        # query processing on the preprocessed query terms
+        # @ return : top k results, list of (docid, score)
+
         # access the lexicon, then the index
         tic = time.perf_counter()
         raw_posting_lists = self.fetch_posting_lists(query_terms, search_file_algorithms)
@@ -95,12 +162,28 @@ class QueryHandler:
         # conjunction/disjunction
         tic = time.perf_counter()
 
-        posting_lists = make_posting_candidates(query_terms, raw_posting_lists)
+        posting_lists = make_posting_candidates(query_terms, raw_posting_lists, self.index.compression)
         toc = time.perf_counter()
         print(" make posting candidates created in " + str(toc - tic))
         print_log("calculating relevance with algorithm: " + self.index.algorithm, 4)
         tic = time.perf_counter()
 
+        if self.index.algorithm == "conjunctive":
+            # document at a time: the documents are scored while the lists are intersected
+            scores = self.compute_pruned_scores(posting_lists)
+            toc = time.perf_counter()
+            print_log("compute conjunctive scoring created in " + str(toc - tic), 3)
+            return get_top_k(self.index.topk, scores)
+
+        if self.index.algorithm in dynamic_pruning_algorithms:
+            if self.lexicon.has_max_scores():
+                # document at a time: related documents and scores are computed together
+                scores = self.compute_pruned_scores(posting_lists)
+                toc = time.perf_counter()
+                print_log("compute scoring with dynamic pruning created in " + str(toc - tic), 3)
+                return get_top_k(self.index.topk, scores)
+            print_log("the lexicon has no score upper bounds: dynamic pruning not available", 1)
+
         related_documents = self.detect_related_documents(posting_lists)
         toc = time.perf_counter()
         print_log("detect related document, created in " + str(toc - tic), 3)
@@ -109,12 +192,9 @@ class QueryHandler:
         print_log("calculating scores for related documents", 2)
         tic = time.perf_counter()
 
-        scores = self.compute_scoring_function(posting_lists, related_documents, search_file_algorithms)
+        scores = self.compute_scoring_function(posting_lists, related_documents)
         toc = time.perf_counter()
         print_log("compute scoring created in " + str(toc - tic), 3)
-        # cache usage: memory holds stats.txt to optimize hdd usage (saves time)
-        if flush_doc_size_cache_after_query:
-            self.doc_stats_cache = {}
 
         return get_top_k(self.index.topk, scores)
 
@@ -140,7 +220,7 @@ class QueryHandler:
 
         # required to open both lexicon and inverted index
         print_log("opening file " + str(self.index.index_file_path), 4)
-        if self.index.compression != "no":
+        if self.index.compression != "no" or self.index.block_size > 0:
             index_file = open(self.index.index_file_path, "rb")
         else:
             index_file = open(self.index.index_file_path, "r+")
@@ -152,194 +232,181 @@ class QueryHandler:
 
                 if cache_hit == -1:  # cache missed: search it on hdd
                     # search in lexicon for the offsets (start and finish in the inv.index file)
-                    res_offset_interval, doc_freq = search_in_lexicon(f, token, search_algorithm)
+                    if search_algorithm == "in_memory":
+                        res_offset_interval, doc_freq = self.lexicon.search(token)
+                    else:
+                        res_offset_interval, doc_freq = search_in_lexicon(f, token, search_algorithm)
                     if doc_freq == -1:
                         # token not found in lexicon
                         res.append("")
                     else:
                         # fetch the posting list from inv. index file
-                        res_posting_string = search_in_index(index_file, res_offset_interval, self.index.compression)
+                        res_posting_string = search_in_index(index_file, res_offset_interval, self.index.compression,
+                                                             self.index.block_size > 0)
+                        if isinstance(res_posting_string, bytes):
+                            # the cache holds decoded postings: a hit is not decoded again
+                            res_posting_string = decode_posting_blocks(res_posting_string, self.index.compression)
                         # store the posting list for each word
                         res.append(res_posting_string)
 
                         # cache update: add the new element
                         cache_push(self.index.lexicon_path, token, doc_freq, res_posting_string)
 
-                else:  # cache hit
+                else:  # cache hit: (docids, freqs) arrays, ready for PostingList.set_postings
                     res_posting_string = cache_get_posting_list(self.index.lexicon_path, cache_hit)
                     res.append(res_posting_string)
         # we stored the docfreq but it's not returned because it's not used really frequently
         # and it's easier to use len(posting_list)
         return res
 
-    def fetch_documents_size(self, keys, search_file_algorithms):
-        # get the document size for each docids
-        # @ param keys : list of docids (as strings)
-        # @ param search_file_algorithms : algorithm to perform search in the documents statistics file
-        # @ return : dictionary of {docids : size}
-
-        #    expected row from the collection statistics file:
-        #    docid + collection_separator + docno + collection_separator + size + chunk_line_separator
-        checkpoint = 0
-        results = {}
-        last_docid_read = -1
-        jobs_counter = 0
-        with open(self.index.collection_statistics_path, "r+") as doc_stats_file:
-            for docid in keys:
-                jobs_counter += 1
-                if jobs_counter % 20000 == 0:
-                    print_log(f"document sizes left to fetch: {len(keys) - jobs_counter}")
-                size = 0
-                if docid in self.doc_stats_cache.keys():
-                    # cache usage: if the document has already been retrieved, it's in memory already
-                    results[docid] = self.doc_stats_cache[docid]
-                elif (last_docid_read != -1) and (int(docid) == last_docid_read + 1):
-                    # consecutive read: skip the search phase
-                    checkpoint, line = next_GEQ_line(doc_stats_file, checkpoint + 1)
-                    # line is a string like "docid,docno,doc_size"
-                    content = line.strip().split(",")
-                    if len(content) == 3:
-                        size = content[2].strip()
-                    else:
-                        print_log("reading empty line in stats.txt", 3)
-                else:
-                    size, checkpoint = search_in_doc_stats_file(doc_stats_file, int(docid), search_file_algorithms,
-                                                                checkpoint)
-
-                if int(size) > 0:
-                    last_docid_read = int(docid)
-                    results[docid] = int(size)
-                    if allow_doc_size_caching:
-                        # cache is used when a docid is asked more than once
-                        self.doc_stats_cache[docid] = int(size)
-        return results
-
     def detect_related_documents(self, posting_lists):
         # take all the token_keys from the first element
         if len(posting_lists) < 1:
             print_log("no posting list found: ", 3)
             print_log(posting_lists, 3)
             return []
-        # initialize the candidates with the keys of the first posting list
-        candidates = set(posting_lists[next(iter(posting_lists))].docids)
+        # initialize the candidates with the docids of the first posting list
+        candidates = np.asarray(posting_lists[next(iter(posting_lists))].all_docids(), dtype=np.int64)
         print_log(f"first set of candidates: {len(candidates)} elements", 4)
         print_log(candidates, 5)
-        for term in posting_lists:  # the first one could be skipped, since it's a copy
-            if self.index.algorithm == "conjunctive":
+        if self.index.algorithm == "conjunctive":
+            for term in posting_lists:  # the first one could be skipped, since it's a copy
                 # intersection
-                candidates &= set(posting_lists[term].docids)
+                candidates = np.intersect1d(candidates, posting_lists[term].all_docids(), assume_unique=True)
                 print_log("conjunctive candidates", 5)
                 print_log(candidates, 5)
-            elif self.index.algorithm == "disjunctive":
-                # union
-                print_log("disjunctive candidates", 5)
-                print_log(candidates, 5)
-                for new_token_doc_ids in posting_lists[term].docids:
-                    candidates.add(new_token_doc_ids)
-            else:
-                print_log("CRITICAL ERROR: query algorithm not set", 0)
-                print_log(self.index.algorithm, 0)
-                return []
-        # returns a list of related docids
+        elif self.index.algorithm == "disjunctive" or self.index.algorithm in dynamic_pruning_algorithms:
+            # union (sorted)
+            candidates = np.unique(np.concatenate(
+                [np.asarray(posting_list.all_docids(), dtype=np.int64) for posting_list in posting_lists.values()]))
+            print_log("disjunctive candidates", 5)
+            print_log(candidates, 5)
+        else:
+            print_log("CRITICAL ERROR: query algorithm not set", 0)
+            print_log(self.index.algorithm, 0)
+            return []
+        # returns a sorted array of related docids
         print_log(f"related documents: {len(candidates)}", 4)
 
-        return sorted(list(candidates), key=lambda x: int(x))
+        return candidates
 
-    def compute_scoring_function(self, posting_lists, related_documents, search_file_algorithms):
-        # return the scored list of the relevant documents {docid,score} as a dictionary
-        scores = {}
-        if not related_documents:
+    def compute_scoring_function(self, posting_lists, related_documents):
+        # return the scores of the relevant documents as two aligned arrays (docids, scores)
+        if len(related_documents) == 0:
             print_log("Cannot compute scores, no relevant document detected", 1)
             return {}
 
+        # related documents are the rows of the accumulator: one score for each of them (sorted docids)
+        candidates = np.asarray(related_documents, dtype=np.int64)
+        scores = np.zeros(len(candidates), dtype=np.float64)
+
         # fetch doc size if necessary
-        doc_size = {}
+        doc_lengths = None
         if self.index.scoring in ["BM11", "BM25"]:
             tic = time.perf_counter()
-
-            doc_size = self.fetch_documents_size(related_documents, search_file_algorithms)
+            doc_lengths = self.doc_table.lengths(candidates)
             toc = time.perf_counter()
             print_log("fetch document size in scoring created in " + str(toc - tic), 3)
-            # WARNING : we know this might load in memory millions of numbers
-            # it's cheaper for our hardware to use the memory than accessing the disk at each number required
-            # worst case: load the whole stats.txt file (180mb)
         tic = time.perf_counter()
 
         for token_key, postingListObj in posting_lists.items():
-            # log ( N of docs in the collection / N of relevant docs )
-
             if postingListObj.size > 0:
-                idf = math.log(self.num_docs / len(postingListObj.docids))
+                idf = inverse_document_frequency(self.num_docs, postingListObj.size)
                 print_log("calculated IDF : " + str(idf), 4)
-                tic1 = time.perf_counter()
-                index_for_tic1 = 0
-                # read posting list, extract doc_ids from posting list
-                for i in range(len(postingListObj.docids)):
-                    index_for_tic1 += 1
-                    if index_for_tic1 % 25000 == 0:
-                        toc1 = time.perf_counter()
-                        print_log("25000 doc scored in " + str(toc1 - tic1), 3)
-                        tic1 = time.perf_counter()
-                    # WARNING: we know that sometimes this is going to loop through millions of scoring functions
-                    # it's cheaper for our hardware to store the numbers as a very long list than keeping only the top k
-                    # because of the comparison/ordering time
-
-                    if postingListObj.docids[i] not in related_documents:
-                        # check if document is flagged as related (at least one occurrence of token_key)
-                        scores[postingListObj.docids[i]] = 0
-                        print_log("discarded not relevant document : " + str(postingListObj.docids[i]), 5)
-                        continue
-
-                    # weigth of the token for the document relevance
-                    w_t_d = 0
-
-                    if self.index.scoring == "TFIDF":
-                        w_t_d = weight_tfidf(idf, term_freq=postingListObj.freqs[i])
-                    elif self.index.scoring == "BM11":
-                        doc_len = doc_size[postingListObj.docids[i]]
-                        w_t_d = weight_bm11(idf, term_freq=postingListObj.freqs[i], avg=self.doc_len_average,
-                                            doc_len=doc_len)
-                    elif self.index.scoring == "BM15":
-                        w_t_d = weight_bm15(idf, term_freq=postingListObj.freqs[i])
-                    elif self.index.scoring == "BM25":
-                        doc_len = doc_size[postingListObj.docids[i]]
-                        w_t_d = weight_bm25(idf, term_freq=postingListObj.freqs[i], avg=self.doc_len_average,
-                                            doc_len=doc_len)
-                    if postingListObj.docids[i] in scores.keys():
-                        # add the weight to the document's score
-                        scores[postingListObj.docids[i]] += w_t_d
-                    else:
-                        # new relevant document, initialize its score
-                        scores[postingListObj.docids[i]] = w_t_d
+                docids = np.asarray(postingListObj.all_docids(), dtype=np.int64)
+                freqs = np.asarray(postingListObj.all_freqs(), dtype=np.int64)
+
+                # position of each posting in the accumulator (candidates are sorted)
+                positions = np.searchsorted(candidates, docids)
+                positions[positions == len(candidates)] = 0
+                # check if document is flagged as related (conjunctive queries discard some documents)
+                related = candidates[positions] == docids
+                positions = positions[related]
+
+                lengths = doc_lengths[positions] if doc_lengths is not None else None
+                weights = term_weights(self.index.scoring, idf, freqs[related], lengths, self.doc_len_average)
+                # a docid appears only once in a posting list, so the positions are all different
+                scores[positions] += weights
             toc = time.perf_counter()
             print_log("token <" + str(token_key) + "> scored in " + str(toc - tic), 2)
             tic = time.perf_counter()
         print_log("scores for related documents:", 5)
         print_log(scores, 5)  # very verbose
+        return candidates, scores
+
+
+    def compute_pruned_scores(self, posting_lists):
+        # return the scores of the top k documents {docid,score} as a dictionary, with a document at a time algorithm
+        # (conjunctive intersection or dynamic pruning)
+        algorithm = self.index.algorithm
+        if algorithm == "conjunctive" and any(pl.size <= 0 for pl in posting_lists.values()):
+            # a query term is not in the collection: no document contains all of them
+            return {}
+        if algorithm == "block_max_wand" and self.block_directory is None:
+            print_log("the index has no block directory: using wand instead of block_max_wand", 1)
+            algorithm = "wand"
+        cursors = []  # posting lists in query order, used as cursors
+        idfs = []
+        for token_key, postingListObj in posting_lists.items():
+            if postingListObj.size > 0:
+                idf = inverse_document_frequency(self.num_docs, postingListObj.size)
+                if algorithm in dynamic_pruning_algorithms:
+                    # upper bounds are saved in the lexicon with IDF = 1
+                    postingListObj.max_score = idf * self.lexicon.max_score(token_key, self.index.scoring)
+                    print_log("upper bound of <" + str(token_key) + "> : " + str(postingListObj.max_score), 4)
+                if algorithm == "block_max_wand":
+                    last_docids, max_scores = self.block_directory.blocks(self.lexicon.lookup(token_key),
+                                                                          self.index.scoring)
+                    postingListObj.set_block_max_scores(last_docids, [idf * max_score for max_score in max_scores])
+                postingListObj.reset()
+                cursors.append(postingListObj)
+                idfs.append(idf)
+                self.pruning_counters.postings += postingListObj.size
+
+        scoring = self.index.scoring
+        use_doc_size = scoring in ["BM11", "BM25"]
+
+        def weight(term, docid, freq):
+            doc_len = self.doc_table.length(docid) if use_doc_size else 0
+            return posting_weight(scoring, idfs[term], freq, doc_len, self.doc_len_average)
+
+        if algorithm == "conjunctive":
+            scores = conjunctive(cursors, self.index.topk, weight, self.pruning_counters)
+        elif algorithm == "maxscore":
+            scores = maxscore(cursors, self.index.topk, weight, self.pruning_counters)
+        elif algorithm == "wand":
+            scores = wand(cursors, self.index.topk, weight, self.pruning_counters)
+        else:
+            scores = block_max_wand(cursors, self.index.topk, weight, self.pruning_counters)
+        print_log(f"postings evaluated: {self.pruning_counters.evaluated}, "
+                  f"skipped: {self.pruning_counters.skipped()}", 3)
         return scores
 
 
-def make_posting_candidates(tokens, raw_posting_lists):
-    # make a dictionary of posting lists {token_key : posting_list_dictionary}
-    # where each posting_list_dictionary is a { docid: term_freq}
+def make_posting_candidates(tokens, raw_posting_lists, compression="no"):
+    # make a dictionary of posting lists {token_key : PostingList}
     res = {}
-    # each pl is a string representing a posting list
+    # each pl is the couple of decoded (docids, freqs) arrays returned by fetch_posting_lists, "" for missing tokens
     for i in range(len(raw_posting_lists)):
         token_key = tokens[i]
-        posting_list = create_posting_list_object(token_key, raw_posting_lists[i])
+        posting_list = create_posting_list_object(token_key, raw_posting_lists[i], compression)
         res[token_key] = posting_list
     return res
 
 
-def search_in_index(index_file, res_offset, compression):
+def search_in_index(index_file, res_offset, compression, posting_blocks=True):
     # extract one posting list from the index file, given the position (offset = [start,stop])
+    # @ param posting_blocks : True if the index has the block layout
+    # @ return : the encoded posting list (decoded lazily, one block at a time, by the PostingList)
+    #            or the decoded (docids, freqs) arrays for the indexes saved without blocks
     offset_start = int(res_offset[0])
     offset_stop = int(res_offset[1])
     nbytes = offset_stop - offset_start
     index_file.seek(offset_start)
     compressed_bytes = index_file.read(nbytes)
-    decoded_posting_list_string = decode_posting_list(compressed_bytes, compression)
-    return decoded_posting_list_string
+    if posting_blocks:
+        return compressed_bytes
+    return decode_posting_list(compressed_bytes, compression)
 
 
 def search_in_lexicon(lexicon, token, search_algorithm):
@@ -406,69 +473,6 @@ def search_in_lexicon(lexicon, token, search_algorithm):
     return [start_offset, stop_offset], docfreq
 
 
-def search_in_doc_stats_file(doc_stats_file, docid, search_algorithm, last_checkpoint=0):
-    '''
-    open the doc stats file given one query word, and return its entry
-    :param doc_stats_file: pointer to the doc stats file
-    :param docid: docid to look for
-    :param search_algorithm: user can choose any one search algorithm implemented
-    :param last_checkpoint: skip some content at the beginning of the file if i know it doesnt contain the docid
-    :return: size of the document, position of the cursor in the document
-    '''
-
-    results = []
-    last_read_position = last_checkpoint
-    line_pos = -1
-    line = ""
-
-    if search_algorithm == "ternary":
-        last_line_pos, last_line = get_last_line(doc_stats_file)
-        # important: stats is in cardinal order (token must be cast to integer)
-        line_pos, line = ternary_search(doc_stats_file, start_position=last_read_position, target_key=int(docid),
-                                        delimiter=collection_separator, end_position=last_line_pos,
-                                        last_key=get_row_id(last_line, collection_separator), last_row=last_line,
-                                        key_type="int")
-    elif search_algorithm == "skipping":
-        step = search_chunk_size_config
-        line_pos, high, line = set_search_interval(doc_stats_file, last_read_position, docid, collection_separator,
-                                                   step_size=step, id_is_a_String=False)
-        # skipping big chunks when reading lots of files, small chunks when search interval is smaller
-        while step >= 1:
-            step = step // 10
-            line_pos, high, line = set_search_interval(doc_stats_file, line_pos, docid, collection_separator,
-                                                       step_size=step, id_is_a_String=False)
-            if docid == get_row_id(line, collection_separator):
-                line_pos = high
-                break
-        # precision scan
-        while docid != get_row_id(line, collection_separator):
-            line_pos, line = next_GEQ_line(doc_stats_file, doc_stats_file.tell())
-            if doc_stats_file.tell() > high:
-                # termination condition: nothing found
-                line_pos = -1
-                break
-
-        if line_pos != -1:
-            # i have found the correct word
-            results.append(line.strip())
-            # since i enforced the query_terms list to be sorted, there is no need to look the same lines again
-            last_read_position = line_pos
-    else:
-        print_log("Critical error: cannot search without a search algorithm", 0)
-        return 0, last_checkpoint
-
-    # search failed: return a blank
-    if line_pos == -1:
-        print_log("Cannot find " + str(docid) + " in doc stats file", 2)
-        return 0, last_checkpoint
-
-    # search success: return offset and docfreq
-
-    doc_len = line.split(",")[2].strip()
-
-    return doc_len, line_pos
-
-
 def read_lexicon_line(line):
     # lexicon line structure:
     # token_id;doc_freq;offset_in_index
@@ -482,62 +486,14 @@ def preprocess_query_string(query_raw, stem_flag, stop_flag):
     return words
 
 
-def create_posting_list_object(token_key, posting_string):
-    # convert a line from the index file to a dictionary with the useful info
+def create_posting_list_object(token_key, posting_string, compression="no"):
+    # convert a posting list read from the index file to a PostingList object
     posting_list_obj = PostingList(token_key)
-    if posting_string != '':
-        # posting string: d,d,d,d,d,d,d f,f,f,f,f,f,f
-        doc_id_list = posting_string.split()[0].split(",")
-        freq_list = posting_string.split()[1].split(",")
-        posting_list_obj.set_docids(doc_id_list)
-        posting_list_obj.set_freqs(freq_list)
+    if isinstance(posting_string, bytes):
+        # block layout: only the block headers are read here
+        posting_list_obj.set_encoded(posting_string, compression)
+    elif posting_string != '':
+        # decoded posting list: (docids, freqs) arrays
+        posting_list_obj.set_postings(*posting_string)
     # return : postingList class object
     return posting_list_obj
-
-
-def weight_tfidf(idf, term_freq):
-    # calculate tfidf score for a query
-    # @ param idf : IDF is calculated in outer scope, since it's the same for each term
-    # @ param term_freq : frequency read from posting list
-    if term_freq == 0:
-        return 0
-    '''
-    per tfidf devo calcolare i pesi nella matrice matrice docid * queryterm, con tutti i term della query, con tutti i docid
-     delle posting list di queste 
-    per ogni parola, per ogni documento, calcolo tfidf(parola,documento)
-    se la parola ha count == 0 nel documento, il peso vale zero
-    altrimenti si calcola come:
-    1 + log ( term freq elemento letto dalla posting list) * log ( numero_documenti / numero_documenti_con_queryterm)
-    '''
-    tf = 1 + math.log(term_freq)
-    return tf * idf
-
-
-def weight_bm25(idf, term_freq, avg, doc_len):
-    # calculate bm25 score for a query
-    # @ param docid : docid required to retreive the size of the document
-    # @ param idf : IDF is calculated in outer scope, since it's the same for each term
-    # @ param term_freq : frequency read from posting list
-    # @ param avg : average of the length of all the documents in the collection
-    if term_freq == 0:
-        return 0
-    if doc_len == 0:
-        return 0  # this should not happen (trying to score a document not present)
-    return idf * term_freq / (term_freq + BM_k_one * (1 - BM25_b + BM25_b * (doc_len / avg)))
-
-
-def weight_bm15(idf, term_freq):
-    # calculated like BM25 with BM25_b = 0
-    return idf * term_freq / (term_freq * BM_k_one)
-
-
-def weight_bm11(idf, term_freq, avg, doc_len):
-    # calculated like BM25 with BM25_b = 1
-    if term_freq == 0:
-        return 0
-    if doc_len == 0:
-        return 0  # this should not happen (trying to score a document not present)
-
-    top = idf * term_freq
-    bottom = (term_freq + BM_k_one * (doc_len / avg))
-    return top / bottom
@@ -0,0 +1,161 @@
+import gzip
+import os
+import zlib
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config import binary_file_format, seekable_block_size, seekable_cached_blocks
+from src.modules.utils import print_log, open_collection_bytes
+
+'''
+seekable copy of the collection, made once from collection.tar.gz (or collection.tsv).
+the lines of the collection are grouped in blocks of about seekable_block_size bytes, and each block is compressed as
+an independent gzip member: the blocks file is still a valid gzip file (gzip -dc gives back collection.tsv), but any
+block can be decompressed without reading the previous ones.
+    block table : one record for each block (offset and size in the blocks file, first row, offset of the first row in
+                  the uncompressed collection), plus a last record with the totals
+    docno table : one record for each document (docno, block, offset of the line in the uncompressed block),
+                  sorted by docno
+'''
+
+block_record_dtype = np.dtype([("compressed_offset", "<u8"), ("compressed_size", "<u8"), ("first_row", "<u8"),
+                               ("offset", "<u8")])
+docno_record_dtype = np.dtype([("docno", "<u4"), ("block", "<u4"), ("offset", "<u4")])
+
+
+def seekable_collection_paths(collection_path):
+    # @ return : paths of the blocks file, of the block table and of the docno table (next to the collection)
+    base = collection_path
+    for extension in (".gz", ".tar", ".tsv"):
+        if base.endswith(extension):
+            base = base[:-len(extension)]
+    return (base + "_blocks.gz", base + "_blocks_table" + binary_file_format,
+            base + "_docnos" + binary_file_format)
+
+
+def seekable_collection_exists(collection_path):
+    # the seekable copy is used only if it's complete and newer than the collection
+    paths = seekable_collection_paths(collection_path)
+    return all(os.path.exists(path) for path in paths) and \
+        os.path.getmtime(paths[2]) >= os.path.getmtime(collection_path)
+
+
+def build_seekable_collection(collection_path, block_size=seekable_block_size):
+    # one-time conversion: one full scan of the collection
+    print_log("building seekable collection from " + collection_path, 1)
+    blocks_path, table_path, docnos_path = seekable_collection_paths(collection_path)
+    blocks = []  # records of the block table
+    docnos, docno_blocks, docno_offsets = array('I'), array('I'), array('I')
+    lines = []
+    block_bytes = 0
+    compressed_offset = 0
+    offset = 0  # offset in the uncompressed collection
+    rows = 0
+    with open_collection_bytes(collection_path) as dataset, open(blocks_path, "wb") as blocks_file:
+
+        def write_block():
+            nonlocal compressed_offset, lines, block_bytes
+            compressed = gzip.compress(b"".join(lines), mtime=0)
+            blocks_file.write(compressed)
+            blocks.append((compressed_offset, len(compressed), rows - len(lines), offset - block_bytes))
+            compressed_offset += len(compressed)
+            lines, block_bytes = [], 0
+
+        for line in dataset:
+            docno = line.split(b"\t", 1)[0]
+            if docno.isdigit():
+                docnos.append(int(docno))
+                docno_blocks.append(len(blocks))
+                docno_offsets.append(block_bytes)
+            lines.append(line)
+            block_bytes += len(line)
+            offset += len(line)
+            rows += 1
+            if block_bytes >= block_size:
+                write_block()
+                if len(blocks) % 100 == 0:
+                    print_log("seekable collection: " + str(rows) + " rows", priority=3)
+        if lines:
+            write_block()
+    blocks.append((compressed_offset, 0, rows, offset))
+    np.array(blocks, dtype=np.uint64).view(block_record_dtype).tofile(table_path)
+
+    records = np.empty(len(docnos), dtype=docno_record_dtype)
+    records["docno"] = np.frombuffer(docnos, dtype=np.uint32)
+    records["block"] = np.frombuffer(docno_blocks, dtype=np.uint32)
+    records["offset"] = np.frombuffer(docno_offsets, dtype=np.uint32)
+    records[np.argsort(records["docno"], kind="stable")].tofile(docnos_path)
+    print_log(f"seekable collection: {rows} rows in {len(blocks) - 1} blocks", 2)
+    return SeekableCollection(collection_path)
+
+
+class SeekableCollection:
+    def __init__(self, collection_path):
+        blocks_path, table_path, docnos_path = seekable_collection_paths(collection_path)
+        self.blocks_file = open(blocks_path, "rb")
+        self.blocks = np.fromfile(table_path, dtype=block_record_dtype)
+        self.docnos = np.memmap(docnos_path, dtype=docno_record_dtype, mode="r") if os.path.getsize(docnos_path) \
+            else np.zeros(0, dtype=docno_record_dtype)
+        self.cache = OrderedDict()  # block number -> decompressed block, least recently used first
+
+    def __len__(self):
+        # number of rows
+        return int(self.blocks["first_row"][-1])
+
+    def size(self):
+        # size of the uncompressed collection
+        return int(self.blocks["offset"][-1])
+
+    def close(self):
+        self.blocks_file.close()
+
+    def read_block(self, block):
+        # @ return : uncompressed content of a block (bytes)
+        if block in self.cache:
+            self.cache.move_to_end(block)
+            return self.cache[block]
+        data = zlib.decompress(self.read_raw_block(block), 16 + zlib.MAX_WBITS)
+        self.cache[block] = data
+        if len(self.cache) > seekable_cached_blocks:
+            self.cache.popitem(last=False)
+        return data
+
+    def fetch(self, docno):
+        # @ return : text of the document, None if the docno is not in the collection
+        position = np.searchsorted(self.docnos["docno"], docno)
+        if position >= len(self.docnos) or int(self.docnos["docno"][position]) != docno:
+            return None
+        record = self.docnos[position]
+        data = self.read_block(int(record["block"]))
+        end = data.find(b"\n", int(record["offset"]))
+        line = data[int(record["offset"]):end if end >= 0 else len(data)].decode("utf-8")
+        return line.rstrip("\r").split("\t", 1)[1] if "\t" in line else ""
+
+    def line_offsets(self):
+        # row and offset of the first line of each block, plus the totals (same format of the line offset index)
+        return np.stack([self.blocks["first_row"], self.blocks["offset"]], axis=1)
+
+    def read_lines(self, start, end):
+        # lines starting in [start, end) of the uncompressed collection, decompressing only the blocks needed
+        # @ param start : offset of a line start
+        # @ return : generator of lines (bytes)
+        block = max(int(np.searchsorted(self.blocks["offset"][:-1], start, side="right")) - 1, 0)
+        position = start
+        while position < end and block < len(self.blocks) - 1:
+            block_start = int(self.blocks["offset"][block])
+            data = zlib.decompress(self.read_raw_block(block), 16 + zlib.MAX_WBITS)
+            cursor = position - block_start
+            while cursor < len(data) and position < end:
+                stop = data.find(b"\n", cursor)
+                stop = len(data) if stop < 0 else stop + 1
+                yield data[cursor:stop]
+                position += stop - cursor
+                cursor = stop
+            block += 1
+
+    def read_raw_block(self, block):
+        # compressed block (sequential reads do not use the cache)
+        self.blocks_file.seek(int(self.blocks["compressed_offset"][block]))
+        return self.blocks_file.read(int(self.blocks["compressed_size"][block]))
@@ -1,96 +1,153 @@
-from src.config import lexicon_cache_size
+import time
+from collections import OrderedDict
+
+from src.config import lexicon_cache_size, query_result_cache_size, query_result_cache_ttl
 from src.modules.utils import print_log
 
-lexicon_cache = {}
-cache_count = {}
+'''
+lexicon cache: LRU cache of the posting lists read from the index files, one for each lexicon path.
+each cache is an OrderedDict token -> (doc freq, decoded posting list, size in bytes), ordered from the least recently
+used to the most recently used: hits, pushes and evictions are O(1).
+the capacity (lexicon_cache_size) is measured in bytes of the decoded postings (numpy arrays), for each index.
+'''
+
+lexicon_cache = {}  # lexicon path -> OrderedDict
+cache_bytes = {}  # lexicon path -> bytes held by the cache
+cache_counters = {}  # lexicon path -> {"hits", "misses", "evictions"}
 
 
 def cache_check(target_path):
     # check if cache already contains target file path. initialize the structure if not ready yet.
-    global lexicon_cache, cache_count
-    if target_path in lexicon_cache.keys():
+    global lexicon_cache, cache_bytes, cache_counters
+    if target_path in lexicon_cache:
         return  # check ok
-    else:
-        # initialization
-        lexicon_cache[target_path] = []
-        cache_count[target_path] = 0
+    # initialization
+    lexicon_cache[target_path] = OrderedDict()
+    cache_bytes[target_path] = 0
+    cache_counters[target_path] = {"hits": 0, "misses": 0, "evictions": 0}
 
 
 def cache_flush():
-    # remove all the content of the cash, but keep the inizialization (path of files)
-    global lexicon_cache, cache_count
-    if lexicon_cache_size > 0:
-        for source in lexicon_cache.keys():
-            lexicon_cache[source] = []
-            cache_count[source] = 0
+    # remove all the content of the cache, but keep the initialization (path of files) and the counters
+    for source in lexicon_cache:
+        lexicon_cache[source].clear()
+        cache_bytes[source] = 0
+
+
+def posting_size(posting_list):
+    # memory held by a cached posting list
+    # @ param posting_list : tuple of numpy arrays (docids, freqs)
+    # @ return : size in bytes
+    return sum(column.nbytes for column in posting_list)
 
 
 def cache_hit_or_miss(target_path, target_key):
-    global lexicon_cache
-    # check if the element is cached or not (returns -1 or position in cache)
+    # check if the element is cached or not, and mark it as the most recently used
+    # @ return : -1 on a miss, the key of the cache entry on a hit
     cache_check(target_path)
-    if not lexicon_cache[target_path]:
-        # if I enter here it means that lexicon_cache[target_path] is empty so we have to insert the first cache entry
-        print_log(f"cache miss for {target_key} - first cache entry", 2)
-        return -1  # miss: cache empty
-    else:
-        # remember: cache is not in order
-        for line_dict in lexicon_cache[target_path]:
-            # each cache line is a dict {"key": "token freq", "posting list")
-            if target_key == line_dict["token_key"]:
-                print_log(f"cache hit for {target_key}", 2)
-                return lexicon_cache[target_path].index(line_dict)  # hit (return cache position)
-    print_log(f"cache miss for {target_key}", 2)
-    return -1  # miss: not found
+    entries = lexicon_cache[target_path]
+    if target_key in entries:
+        entries.move_to_end(target_key)
+        cache_counters[target_path]["hits"] += 1
+        print_log(f"cache hit for {target_key}", 4)
+        return target_key
+    cache_counters[target_path]["misses"] += 1
+    print_log(f"cache miss for {target_key}", 4)
+    return -1
 
 
 def cache_get_token_freq(target_path, cache_position):
-    global lexicon_cache
-    # fetch an element from the cache
+    # @ param cache_position : value returned by cache_hit_or_miss
     cache_check(target_path)
-
-    value_dict = lexicon_cache[target_path][cache_position]
-
-    # retaining policy: most recent document is on top
-    lexicon_cache[target_path].remove(value_dict)
-    lexicon_cache[target_path].append(value_dict)
-    return value_dict["token_docfreq"]
+    return lexicon_cache[target_path][cache_position][0]
 
 
 def cache_get_posting_list(target_path, cache_position):
-    global lexicon_cache
-    # fetch an element from the cache
+    # @ param cache_position : value returned by cache_hit_or_miss
     cache_check(target_path)
-
-    value_dict = lexicon_cache[target_path][cache_position]
-
-    # retaining policy: most recent document is on top
-    lexicon_cache[target_path].remove(value_dict)
-    lexicon_cache[target_path].append(value_dict)
-    return value_dict["token_posting"]
+    return lexicon_cache[target_path][cache_position][1]
 
 
 def cache_pop(target_path):
-    global lexicon_cache
-    # removes an element from the cache (returns the dict)
+    # removes the least recently used element from the cache
+    # @ return : (key, doc freq, posting list), None if the cache is empty
     cache_check(target_path)
-    if not lexicon_cache[target_path]:
+    entries = lexicon_cache[target_path]
+    if not entries:
         return None  # nothing to pop
-    else:
-        # retention: pop the oldest element
-        oldest_element = lexicon_cache[target_path][0]
-        lexicon_cache[target_path].remove(oldest_element)
-        return oldest_element
+    key, (doc_freq, posting_list, size) = entries.popitem(last=False)
+    cache_bytes[target_path] -= size
+    cache_counters[target_path]["evictions"] += 1
+    return key, doc_freq, posting_list
 
 
 def cache_push(target_path, target_key, target_docfreq, target_posting_list):
-    global lexicon_cache, cache_count
-    # adds an element to the cache
-    # WARNING: this function is called only in the case that there is a miss
-    # so we are sure that we have to only add the new element
-    new_element = {"token_key": target_key, "token_docfreq": target_docfreq, "token_posting": target_posting_list}
-    lexicon_cache[target_path].append(new_element)
-
-    if cache_count[target_path] > lexicon_cache_size:
-        # cache full
+    # adds an element to the cache (called after a miss), evicting the least recently used ones when full
+    cache_check(target_path)
+    size = posting_size(target_posting_list)
+    if size > lexicon_cache_size:
+        return  # bigger than the whole cache (or cache disabled)
+    entries = lexicon_cache[target_path]
+    if target_key in entries:
+        cache_bytes[target_path] -= entries.pop(target_key)[2]
+    while entries and cache_bytes[target_path] + size > lexicon_cache_size:
         cache_pop(target_path)
+    entries[target_key] = (target_docfreq, target_posting_list, size)
+    cache_bytes[target_path] += size
+
+
+def cache_stats(target_path):
+    # @ return : dictionary with hits, misses, evictions, number of entries and bytes held by the cache of an index
+    cache_check(target_path)
+    stats = dict(cache_counters[target_path])
+    stats["entries"] = len(lexicon_cache[target_path])
+    stats["bytes"] = cache_bytes[target_path]
+    return stats
+
+
+'''
+query result cache: LRU cache of the top k results of the queries, shared by all the indexes.
+the key is (index name, preprocessed query terms as a multiset, algorithm, scoring function, k): queries that differ
+only in the order of the words, in the case or in the punctuation share the same entry.
+entries older than query_result_cache_ttl seconds are treated as misses. the entries of an index are invalidated when
+its config is saved or reloaded (the index content may have changed).
+'''
+
+result_cache = OrderedDict()  # key -> (insertion time, list of (docid, score))
+result_cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def result_cache_key(index, query_terms):
+    # @ param index : InvertedIndex used for the query
+    # @ param query_terms : list of tokens returned by QueryHandler.prepare_query
+    return index.name, tuple(sorted(query_terms)), index.algorithm, index.scoring, index.topk
+
+
+def result_cache_get(key):
+    # @ return : list of (docid, score), None on a miss
+    entry = result_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] > query_result_cache_ttl > 0:
+        del result_cache[key]  # expired
+        entry = None
+    if entry is None:
+        result_cache_counters["misses"] += 1
+        return None
+    result_cache.move_to_end(key)
+    result_cache_counters["hits"] += 1
+    return list(entry[1])
+
+
+def result_cache_push(key, results):
+    if query_result_cache_size <= 0:
+        return  # cache disabled
+    result_cache[key] = (time.monotonic(), list(results))
+    result_cache.move_to_end(key)
+    while len(result_cache) > query_result_cache_size:
+        result_cache.popitem(last=False)
+        result_cache_counters["evictions"] += 1
+
+
+def result_cache_invalidate(index_name):
+    # remove the results of an index (all of them if index_name is None)
+    for key in [key for key in result_cache if index_name is None or key[0] == index_name]:
+        del result_cache[key]
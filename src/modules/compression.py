@@ -1,112 +1,664 @@
-from src.modules.utils import print_log
+import struct
 
+import numpy as np
 
-def to_unary(n):
-    # Unary encoding: n-1 ones followed by a final zero
-    return '1' * (n - 1) + '0'
+'''
+Block layout of a posting list in the index file:
+    [postings count, blocks count] [block header] * blocks count [block] * blocks count
+block header: last docid of the block, size in bytes of the docids, size in bytes of the frequencies
+block: docid gaps followed by frequencies, each encoded by itself with the compression of the index
+(gaps continue from the last docid of the previous block).
+the headers are the skip entries of the list: a block is decoded only when the cursor lands in it.
+'''
+posting_list_header = struct.Struct("<II")
+posting_block_header = struct.Struct("<III")
 
 
-def to_gamma(n):
-    # Compute the binary representation of n
-    binary_repr = bin(n)[2:]  # Binary representation without the '0b' prefix
+class BitWriter:
+    '''
+    Bit writer for the bit-level codes (unary, gamma, delta). bits are appended to an integer word, and the complete
+    bytes are moved to the output buffer as soon as the word holds at least 32 bits.
+    the bits are written from the most significant one, and the last byte is padded with ones.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.word = 0
+        self.bits = 0  # bits in the word, not yet moved to the buffer
+
+    def write(self, value, length):
+        # append the lowest length bits of value
+        self.word = (self.word << length) | value
+        self.bits += length
+        if self.bits >= 32:
+            spare = self.bits & 7
+            self.buffer += (self.word >> spare).to_bytes(self.bits >> 3, "big")
+            self.word &= (1 << spare) - 1
+            self.bits = spare
+
+    def write_unary(self, n):
+        # n-1 ones followed by a final zero (zero is written like one)
+        n = max(n, 1)
+        self.write((1 << n) - 2, n)
+
+    def write_gamma(self, n):
+        # unary code of the length of n in bits, followed by n without its most significant bit
+        # number 4 (100) is 110 00. zero is written like one (same behaviour of the string encoder)
+        length = max(n.bit_length(), 1)
+        self.write((((1 << (length - 1)) - 1) << length) | (n & ((1 << (length - 1)) - 1)), 2 * length - 1)
+
+    def write_delta(self, n):
+        # Elias delta: gamma code of the length of n in bits, followed by n without its most significant bit
+        # number 4 (100) is 10 1 00
+        length = max(n.bit_length(), 1)
+        self.write_gamma(length)
+        self.write(n & ((1 << (length - 1)) - 1), length - 1)
+
+    def to_bytes(self):
+        padding = (8 - self.bits % 8) % 8
+        self.write((1 << padding) - 1, padding)
+        return bytes(self.buffer + self.word.to_bytes(self.bits >> 3, "big"))
+
+
+def write_numbers(numbers, code):
+    # @ param code : "unary", "gamma" or "delta"
+    # @ return : bytes
+    writer = BitWriter()
+    write = {"unary": writer.write_unary, "gamma": writer.write_gamma, "delta": writer.write_delta}[code]
+    for n in numbers:
+        write(int(n))
+    return writer.to_bytes()
+
+
+def encode_vbyte(numbers):
+    '''
+    Variable byte encoding: each number is split in groups of 7 bits, from the least significant one.
+    each group is written in one byte, with the most significant bit set to 1 if more bytes of the same number follow.
+    number 300 (100101100) will be 10101100 00000010
+    unlike gamma, zero can be encoded (one byte 00000000)
+    :param numbers: integers (non negative)
+    :return: bytes
+    '''
+    encoded = bytearray()
+    for n in numbers:
+        n = int(n)
+        while n >= 128:
+            encoded.append((n & 127) | 128)
+            n >>= 7
+        encoded.append(n)
+    return bytes(encoded)
+
+
+def decode_vbyte(data):
+    # byte by byte decoder, used for short inputs (numpy has a fixed overhead for each call)
+    # @ return : list of integers
+    numbers = []
+    n = 0
+    shift = 0
+    for byte in memoryview(data):
+        n |= (byte & 127) << shift
+        if byte < 128:
+            numbers.append(n)
+            n = 0
+            shift = 0
+        else:
+            shift += 7
+    return numbers
+
+
+def decode_vbyte_array(data):
+    # vectorized decoder: the bytes of each number are found from the positions of the last bytes (value < 128),
+    # then the 7-bit groups are shifted in place and summed number by number
+    # @ return : numpy array of integers (uint64)
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(encoded < 128)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    encoded = encoded[:ends[-1] + 1]  # an incomplete number at the end is ignored
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # position of each byte in its number
+    positions = np.arange(len(encoded), dtype=np.int64) - np.repeat(starts, ends - starts + 1)
+    groups = (encoded & 127).astype(np.uint64) << (7 * positions).astype(np.uint64)
+    return np.add.reduceat(groups, starts)
+
+
+# inputs shorter than this (in bytes) are decoded byte by byte, longer ones with numpy
+vbyte_vectorized_threshold = 256
+
+
+'''
+Patched frame of reference (PForDelta): the numbers are split in frames of pfor_frame_size, and every number of a
+frame is written with the same bit width b. b is chosen to make the frame as short as possible: the numbers that do not
+fit in b bits are exceptions, and their higher bits are written after the frame.
+frame: [count, b, exceptions count, exceptions bit width] [lowest b bits of each number] [position of each exception]
+       [higher bits of each exception]
+bits are packed from the least significant one, so a frame can be read as little endian 64 bit words.
+'''
+pfor_frame_header = struct.Struct("<BBBB")
+pfor_frame_size = 128
+
+
+def pack_bits(values, width):
+    # @ param values : numpy array of integers lower than 2 ** width
+    # @ return : bytes, width bits for each value
+    if width == 0 or len(values) == 0:
+        return b""
+    bits = (values.astype(np.uint64)[:, None] >> np.arange(width, dtype=np.uint64)) & 1
+    return np.packbits(bits.astype(np.uint8).reshape(-1), bitorder="little").tobytes()
+
+
+# mask of the lowest bits, for each width
+bit_masks = np.array([(1 << width) - 1 for width in range(65)], dtype=np.uint64)
+
+
+def data_words(data):
+    # @ return : the bytes of data as little endian 64 bit words, followed by zero words: the packed numbers of a frame
+    #            can be read as whole words, even at the end of data
+    words = np.zeros(len(data) // 8 + pfor_frame_size + 2, dtype=np.uint64)
+    words.view(np.uint8)[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    return words
+
+
+def unpack_bits(words, bit_offsets, widths):
+    # inverse of pack_bits, for any number of values at once: each value is read from the two words it may span
+    # @ param words : array returned by data_words
+    # @ param bit_offsets : numpy array (int64) with the bit offset of each value in data
+    # @ param widths : numpy array with the bit width of each value (at most 64)
+    # @ return : numpy array of integers (uint64)
+    index = bit_offsets >> 6
+    shift = (bit_offsets & 63).astype(np.uint64)
+    # the second word is shifted in two steps: a shift of 64 bits is not defined
+    values = (words[index] >> shift) | ((words[index + 1] << np.uint64(1)) << (np.uint64(63) - shift))
+    return values & bit_masks[widths]
+
+
+pfor_frame_tables = {}  # bit width -> byte offset and shift of each number of a frame (from its first byte)
+
+
+def pfor_frame_table(width):
+    if width not in pfor_frame_tables:
+        bit_offsets = np.arange(pfor_frame_size, dtype=np.int64) * width
+        pfor_frame_tables[width] = (bit_offsets >> 3, (bit_offsets & 7).astype(np.uint64))
+    return pfor_frame_tables[width]
+
+
+def unpack_frames(words, starts, width):
+    # numbers of the frames with the same bit width: the bit positions are the same in every frame
+    # @ param words : array returned by data_words
+    # @ param starts : numpy array with the byte offset of the packed numbers of each frame
+    # @ return : matrix of integers (uint64), one row of pfor_frame_size numbers for each frame (the rows of the
+    #            frames with less numbers end with garbage)
+    if width == 0:
+        return np.zeros((len(starts), pfor_frame_size), dtype=np.uint64)
+    if width > 57:
+        # a number (plus the shift inside its first byte) may not fit in a 64 bit word
+        positions = (starts * 8)[:, None] + np.arange(pfor_frame_size, dtype=np.int64) * width
+        return unpack_bits(words, positions, np.full(positions.shape, width))
+    # the frames start at any byte: their bytes are copied in rows, one copy for each frame (plus 8 bytes, the last
+    # number is read as a whole word). each number is read as the 64 bit word starting at its first byte, from an
+    # unaligned view of the rows
+    row_bytes = pfor_frame_size * width // 8 + 8
+    windows = np.ndarray((len(words) * 8 - row_bytes + 1, row_bytes), dtype=np.uint8, buffer=words, strides=(1, 1))
+    rows = windows[starts]
+    numbers = np.ndarray((len(starts), row_bytes - 7), dtype="<u8", buffer=rows, strides=(row_bytes, 1))
+    byte_offsets, shifts = pfor_frame_table(width)
+    values = numbers[:, byte_offsets]
+    values >>= shifts
+    values &= bit_masks[width]
+    return values
+
+
+def bit_widths(values):
+    # @ return : numpy array with the number of bits of each value (0 for zero)
+    widths = np.zeros(len(values), dtype=np.int64)
+    remaining = values.astype(np.uint64)
+    while remaining.any():
+        widths += remaining > 0
+        remaining >>= np.uint64(1)
+    return widths
+
+
+def encode_pfor_frame(values):
+    # @ param values : numpy array (at most 255 numbers)
+    widths = bit_widths(values)
+    max_width = int(widths.max()) if len(values) > 0 else 0
+    # size in bytes of the frame for each bit width: packed numbers, exception positions, higher bits of exceptions
+    best_width, best_size = max_width, None
+    for width in range(max_width + 1):
+        exceptions = widths > width
+        exceptions_count = int(exceptions.sum())
+        if exceptions_count > 255:
+            continue
+        size = (len(values) * width + 7) // 8 + exceptions_count
+        size += (exceptions_count * (max_width - width) + 7) // 8
+        if best_size is None or size < best_size:
+            best_width, best_size = width, size
+    exceptions = np.flatnonzero(widths > best_width)
+    exceptions_width = max_width - best_width if len(exceptions) > 0 else 0
+    mask = np.uint64((1 << best_width) - 1)
+    return (pfor_frame_header.pack(len(values), best_width, len(exceptions), exceptions_width) +
+            pack_bits(values.astype(np.uint64) & mask, best_width) + exceptions.astype(np.uint8).tobytes() +
+            pack_bits(values[exceptions].astype(np.uint64) >> np.uint64(best_width), exceptions_width))
+
+
+def encode_pfor(numbers):
+    # @ param numbers : integers (non negative, lower than 2 ** 64)
+    # @ return : bytes
+    values = np.asarray(numbers, dtype=np.uint64)
+    return b"".join([encode_pfor_frame(values[start:start + pfor_frame_size])
+                     for start in range(0, len(values), pfor_frame_size)])
+
+
+def read_pfor_headers(data, start=0, stop=None):
+    # read the frame headers of the PFor frames in data[start:stop]
+    # @ return : numpy arrays (int64, one item for each frame) of byte offset of the frame, numbers count, bit width,
+    #            exceptions count, exceptions bit width, byte offset of the exception positions
+    stop = len(data) if stop is None else stop
+    unpack_header = pfor_frame_header.unpack_from
+    frames = []
+    position = start
+    while position + pfor_frame_header.size <= stop:
+        count, width, exceptions_count, exceptions_width = unpack_header(data, position)
+        frames.append((position, count, width, exceptions_count, exceptions_width))
+        position += pfor_frame_header.size + (count * width + 7) // 8 + exceptions_count + \
+            (exceptions_count * exceptions_width + 7) // 8
+    if not frames:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(6))
+    offsets, counts, widths, exceptions_counts, exceptions_widths = np.array(frames, dtype=np.int64).T
+    exceptions_starts = offsets + pfor_frame_header.size + (counts * widths + 7) // 8
+    return offsets, counts, widths, exceptions_counts, exceptions_widths, exceptions_starts
+
+
+# with less frames, reading the headers one at a time is faster than the vectorized read
+pfor_headers_loop_limit = 16
 
-    # First part: Unary encoding of the length of the binary representation
-    length = len(binary_repr)
-    unary_length = to_unary(length)
 
-    # Second part: Offset, i.e., the binary representation without the most significant bit
-    offset = binary_repr[1:]
+def read_pfor_headers_at(data, frame_offsets, stop=None):
+    # read the frame headers at known offsets (for example the blocks of a posting list, one frame each) all together
+    # @ param frame_offsets : byte offset of each frame
+    # @ return : same arrays of read_pfor_headers, None if the frames are not exactly the ones of data[first offset:stop]
+    stop = len(data) if stop is None else stop
+    offsets = np.asarray(frame_offsets, dtype=np.int64)
+    if len(offsets) == 0 or offsets[-1] + pfor_frame_header.size > stop:
+        return None
+    headers = np.frombuffer(data, dtype=np.uint8)[offsets[:, None] + np.arange(pfor_frame_header.size)]
+    counts, widths, exceptions_counts, exceptions_widths = headers.astype(np.int64).T
+    exceptions_starts = offsets + pfor_frame_header.size + (counts * widths + 7) // 8
+    ends = exceptions_starts + exceptions_counts + (exceptions_counts * exceptions_widths + 7) // 8
+    if not (np.array_equal(ends[:-1], offsets[1:]) and ends[-1] == stop):
+        return None  # more frames than offsets
+    return offsets, counts, widths, exceptions_counts, exceptions_widths, exceptions_starts
 
-    # Combine the two parts
-    return unary_length + offset
 
+def decode_pfor_frames(data, start=0, stop=None, frame_offsets=None):
+    # decode every frame of data[start:stop] in one vectorized pass: the frames are unpacked together, one group for
+    # each bit width, and the exceptions of all the frames are patched together
+    # @ param frame_offsets : offsets of the frames, if known (the headers are not read one at a time)
+    # @ return : numpy array of integers (uint64), byte offset of each frame, numbers count of each frame
+    headers = None
+    if frame_offsets is not None and len(frame_offsets) > pfor_headers_loop_limit:
+        headers = read_pfor_headers_at(data, frame_offsets, stop)
+    if headers is None:
+        headers = read_pfor_headers(data, start, stop)
+    offsets, counts, widths, exceptions_counts, exceptions_widths, exceptions_starts = headers
+    if int(counts.sum()) == 0:
+        return np.zeros(0, dtype=np.uint64), offsets, counts
+    words = data_words(data)
+    frame_widths = set(widths.tolist())
+    if len(frame_widths) == 1:
+        values = unpack_frames(words, offsets + pfor_frame_header.size, frame_widths.pop())
+    else:
+        values = np.empty((len(counts), pfor_frame_size), dtype=np.uint64)
+        for width in frame_widths:
+            group = np.flatnonzero(widths == width)
+            values[group] = unpack_frames(words, offsets[group] + pfor_frame_header.size, width)
+    values = values.reshape(-1)
+
+    exceptions_total = int(exceptions_counts.sum())
+    if exceptions_total > 0:
+        # exceptions: the higher bits are patched with a single assignment
+        frame = np.repeat(np.arange(len(counts)), exceptions_counts)
+        position = np.arange(exceptions_total) - (np.cumsum(exceptions_counts) - exceptions_counts)[frame]
+        targets = words.view(np.uint8)[exceptions_starts[frame] + position]
+        higher_bits_offsets = (exceptions_starts + exceptions_counts) * 8
+        higher_bits = unpack_bits(words, higher_bits_offsets[frame] + position * exceptions_widths[frame],
+                                  exceptions_widths[frame])
+        values[frame * pfor_frame_size + targets] |= higher_bits << widths[frame].astype(np.uint64)
+
+    if bool((counts[:-1] == pfor_frame_size).all()):
+        return values[:len(values) - pfor_frame_size + int(counts[-1])], offsets, counts
+    # frames with less numbers inside data (the last one of each encoded list)
+    return values[(np.arange(pfor_frame_size) < counts[:, None]).reshape(-1)], offsets, counts
+
+
+def decode_pfor(data):
+    # frame by frame decoder with python integers, used for short inputs (numpy has a fixed overhead for each call)
+    # @ return : list of integers
+    numbers = []
+    position = 0
+    while position + pfor_frame_header.size <= len(data):
+        count, width, exceptions_count, exceptions_width = pfor_frame_header.unpack_from(data, position)
+        position += pfor_frame_header.size
+        end = position + (count * width + 7) // 8
+        packed = int.from_bytes(data[position:end], "little")
+        mask = (1 << width) - 1
+        frame = [(packed >> (i * width)) & mask for i in range(count)]
+        if exceptions_count:
+            targets = data[end:end + exceptions_count]
+            position = end + exceptions_count
+            end = position + (exceptions_count * exceptions_width + 7) // 8
+            higher_bits = int.from_bytes(data[position:end], "little")
+            exceptions_mask = (1 << exceptions_width) - 1
+            for i, target in enumerate(targets):
+                frame[target] |= ((higher_bits >> (i * exceptions_width)) & exceptions_mask) << width
+        numbers.extend(frame)
+        position = end
+    return numbers
+
+
+# inputs shorter than this (in bytes) are decoded frame by frame, longer ones with numpy
+pfor_vectorized_threshold = 512
+
+
+def decode_pfor_array(data):
+    # @ return : numpy array of integers (uint64)
+    return decode_pfor_frames(data)[0]
+
+
+bit_level_codecs = ["unary", "gamma", "delta"]  # codes written with BitWriter (zero cannot be encoded)
+
+
+def encode_numbers(numbers, compression="no"):
+    # encode a list of positive integers as bytes
+    if compression == "no":
+        return ",".join(map(str, numbers)).encode("utf-8")
+    elif compression in bit_level_codecs:
+        return write_numbers(numbers, compression)
+    elif compression == "vbyte":
+        return encode_vbyte(numbers)
+    elif compression == "pfor":
+        return encode_pfor(numbers)
+    raise ValueError(f"Unsupported encoding type: {compression}")
+
+
+def decode_numbers(data, compression="no"):
+    # decode the bytes written by encode_numbers (the padding of the bit streams is ignored)
+    # @ return : numpy array of integers (uint32, like docids and frequencies)
+    if compression == "no":
+        return np.fromstring(bytes(data).decode("utf-8"), dtype=np.uint32, sep=",")
+    elif compression == "vbyte":
+        if len(data) < vbyte_vectorized_threshold:
+            return np.array(decode_vbyte(data), dtype=np.uint32)
+        return decode_vbyte_array(data).astype(np.uint32)
+    elif compression == "pfor":
+        if len(data) < pfor_vectorized_threshold:
+            return np.array(decode_pfor(data), dtype=np.uint32)
+        return decode_pfor_array(data).astype(np.uint32)
+    elif compression == "unary":
+        return decode_unary(data).astype(np.uint32)
+    elif compression == "gamma":
+        return np.array(decode_gamma(data), dtype=np.uint32)
+    elif compression == "delta":
+        return np.array(decode_delta(data), dtype=np.uint32)
+    raise ValueError(f"Unsupported encoding type: {compression}")
+
+
+def decode_segments(data, segment_offsets, compression="no"):
+    # decode consecutive segments of data, each one encoded by itself with encode_numbers (for example the docid gaps
+    # and the frequencies of the blocks of a posting list)
+    # @ param segment_offsets : byte offset of each segment in data (one more item: end of the last segment)
+    # @ return : numpy array with the numbers of all the segments (uint32), numpy array with the count of each segment
+    segments_count = len(segment_offsets) - 1
+    if segments_count <= 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    if compression == "pfor" and segment_offsets[-1] - segment_offsets[0] >= pfor_vectorized_threshold:
+        # one vectorized pass over the frames of all the segments
+        values, frame_offsets, frame_counts = decode_pfor_frames(data, segment_offsets[0], segment_offsets[-1],
+                                                                 segment_offsets[:-1])
+        if len(frame_offsets) == segments_count:
+            return values.astype(np.uint32), frame_counts  # one frame for each segment
+        segments = np.searchsorted(np.asarray(segment_offsets, dtype=np.int64), frame_offsets, side="right") - 1
+        counts = np.bincount(segments, weights=frame_counts, minlength=segments_count).astype(np.int64)
+        return values.astype(np.uint32), counts
+    decoded = [decode_numbers(data[segment_start:segment_stop], compression)
+               for segment_start, segment_stop in zip(segment_offsets[:-1], segment_offsets[1:])]
+    return np.concatenate(decoded), np.array([len(numbers) for numbers in decoded], dtype=np.int64)
+
+
+def gaps_to_docids(gaps, previous_doc_id=0):
+    # @ param gaps : numpy array of docid gaps
+    # @ param previous_doc_id : docid before the first gap (-1 for the first block of the bit-level codes)
+    # @ return : numpy array of docids (uint32)
+    docids = np.cumsum(gaps, dtype=np.uint32)
+    if previous_doc_id < 0:
+        docids -= np.uint32(-previous_doc_id)
+    else:
+        docids += np.uint32(previous_doc_id)
+    return docids
+
+
+def first_previous_docid(compression="no"):
+    # docid before the first posting of a list: the first gap is the docid itself, but unary, gamma and delta cannot
+    # encode zero (it's written like one). with these codes the first gap is docid + 1, so docid 0 can be encoded
+    return -1 if compression in bit_level_codecs else 0
+
+
+def encode_posting_blocks(docids, freqs, compression="no", block_size=128):
+    # encode a posting list with the block layout
+    # @ param docids : docids (integers, in increasing order)
+    # @ param freqs : term frequencies, aligned with docids
+    # @ return : bytes
+    headers = []
+    blocks = []
+    previous_doc_id = first_previous_docid(compression)
+    for start in range(0, len(docids), block_size):
+        block_docids = list(docids[start:start + block_size])
+        gaps = [doc_id - previous for doc_id, previous in zip(block_docids, [previous_doc_id] + block_docids[:-1])]
+        encoded_gaps = encode_numbers(gaps, compression)
+        encoded_freqs = encode_numbers(freqs[start:start + block_size], compression)
+        previous_doc_id = block_docids[-1]
+        headers.append(posting_block_header.pack(previous_doc_id, len(encoded_gaps), len(encoded_freqs)))
+        blocks.append(encoded_gaps)
+        blocks.append(encoded_freqs)
+    return posting_list_header.pack(len(docids), len(headers)) + b"".join(headers) + b"".join(blocks)
 
-def bit_stream_to_bytes(bit_stream):
-    # Pad the bit stream so that its length is a multiple of 8
-    padding_length = (8 - len(bit_stream) % 8) % 8
-    bit_stream = bit_stream + '1' * padding_length
 
-    # Convert each 8-bit chunk into a byte
-    byte_array = bytearray()
-    for i in range(0, len(bit_stream), 8):
-        byte_chunk = bit_stream[i:i + 8]
-        byte_array.append(int(byte_chunk, 2))
+def read_block_headers(data):
+    # read the headers of a posting list written with encode_posting_blocks, without decoding any block
+    # @ return : postings count, last docid of each block, byte offset of each block (one more item: end of the last
+    #            block), byte offset of the frequencies of each block
+    postings_count, blocks_count = posting_list_header.unpack_from(data, 0)
+    last_docids = []
+    block_offsets = [posting_list_header.size + blocks_count * posting_block_header.size]
+    freq_offsets = []
+    for last_docid, docids_size, freqs_size in posting_block_header.iter_unpack(
+            data[posting_list_header.size:block_offsets[0]]):
+        last_docids.append(last_docid)
+        freq_offsets.append(block_offsets[-1] + docids_size)
+        block_offsets.append(freq_offsets[-1] + freqs_size)
+    return postings_count, last_docids, block_offsets, freq_offsets
 
-    return bytes(byte_array)
+
+def read_encoded_posting_list(file):
+    # read the next posting list (block layout) from a binary file, without decoding it
+    # @ return : bytes, empty at the end of the file
+    header = file.read(posting_list_header.size)
+    if len(header) < posting_list_header.size:
+        return b""
+    _, blocks_count = posting_list_header.unpack(header)
+    block_headers = file.read(blocks_count * posting_block_header.size)
+    blocks_size = sum(docids_size + freqs_size for _, docids_size, freqs_size in
+                      posting_block_header.iter_unpack(block_headers))
+    return header + block_headers + file.read(blocks_size)
+
+
+def decode_posting_block(data, start, freqs_start, stop, previous_doc_id, compression="no"):
+    # @ param start, freqs_start, stop : byte offsets of the block, and of its frequencies
+    # @ param previous_doc_id : last docid of the previous block (None for the first block)
+    # @ return : numpy array of docids, numpy array of freqs
+    if previous_doc_id is None:
+        previous_doc_id = first_previous_docid(compression)
+    gaps = decode_numbers(data[start:freqs_start], compression)
+    freqs = decode_numbers(data[freqs_start:stop], compression)
+    return gaps_to_docids(gaps, previous_doc_id), freqs
+
+
+def split_gaps_and_freqs(values, counts):
+    # separate the gaps and the frequencies returned by decode_segments
+    # @ param counts : numbers count of each segment (gaps of the first block, freqs of the first block, ...)
+    # @ return : numpy array of gaps, numpy array of freqs
+    full_segments = len(counts) - 2
+    if bool((counts[:full_segments] == counts[0]).all()):
+        # every block but the last one has the same size: the full blocks are a matrix of gaps and freqs rows
+        block_size = int(counts[0])
+        end = full_segments * block_size
+        last_gaps = end + int(counts[-2])
+        if full_segments == 0:
+            return values[:last_gaps], values[last_gaps:]
+        blocks = values[:end].reshape(-1, 2, block_size)
+        return np.concatenate((blocks[:, 0].reshape(-1), values[end:last_gaps])), \
+            np.concatenate((blocks[:, 1].reshape(-1), values[last_gaps:]))
+    is_gap = np.repeat(np.arange(len(counts)) % 2 == 0, counts)
+    return values[is_gap], values[~is_gap]
+
+
+def decode_posting_blocks(data, compression="no"):
+    # decode a whole posting list written with encode_posting_blocks
+    # @ return : numpy array of docids, numpy array of freqs
+    _, last_docids, block_offsets, freq_offsets = read_block_headers(data)
+    if not last_docids:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    # gaps and frequencies of the blocks alternate: all the segments are decoded together, and the gaps continue from
+    # block to block, so the docids of the whole list are a single cumulative sum
+    segment_offsets = [offset for block in zip(block_offsets[:-1], freq_offsets) for offset in block]
+    values, counts = decode_segments(data, segment_offsets + [block_offsets[-1]], compression)
+    gaps, freqs = split_gaps_and_freqs(values, counts)
+    return gaps_to_docids(gaps, first_previous_docid(compression)), freqs
 
 
 def decode_posting_list(compressed_bytes, compression="no"):
     '''
-    The decode_posting_list function first reads the binary data and converts it to a string of bits.
+    The decode_posting_list function decodes a posting list saved without the block layout (one encoded blob for each
+    posting list: all the gaps, then all the frequencies).
     :param compression:
-    :param compressed_bytes:
-    :return: list_doc_id
+    :param compressed_bytes: bytes (string for the "no" compression)
+    :return: numpy array of docids, numpy array of freqs
     '''
     if compression != "no":
-        # Convert the bytes back into a bit string
-        bit_stream = ''.join(f'{byte:08b}' for byte in compressed_bytes)
-        print_log(bit_stream, 8)
-
-        # Step 2: Decode the doc IDs
-        if compression == "unary":
-            decoded_numbers = decode_unary(bit_stream)
-        elif compression == "gamma":
-            decoded_numbers = decode_gamma(bit_stream)
-        else:
-            print_log("Critical error: compression method not found")
-            return ""
+        decoded_numbers = decode_numbers(compressed_bytes, compression)
         half_doc_number = int(len(decoded_numbers) / 2)
-        decoded_doc_ids = decoded_numbers[:half_doc_number]
+        decoded_gaps = decoded_numbers[:half_doc_number]
         decoded_freqs = decoded_numbers[half_doc_number:]
     else:
+        # posting string: gap,gap,gap freq,freq,freq
         posting_list = compressed_bytes.split()
-        decoded_doc_ids = map(int, posting_list[0].split(","))
-        decoded_freqs = posting_list[1].split(",")
+        decoded_gaps = np.fromstring(posting_list[0], dtype=np.uint32, sep=",")
+        decoded_freqs = np.fromstring(posting_list[1], dtype=np.uint32, sep=",")
     # Convert the gaps back to doc IDs
-    # list_doc_id = []
-    list_doc_id_string = ""
-    previous_doc_id = 0
-    first = True
-    for gap in decoded_doc_ids:
-        doc_id = previous_doc_id + gap
-        if first:
-            list_doc_id_string += str(doc_id)
-            first = False
-        else:
-            list_doc_id_string += "," + str(doc_id)
-        previous_doc_id = doc_id
-    posting_list_string_decoded = list_doc_id_string + " "
-    first = True
-    for freq in decoded_freqs:
-        if first:
-            posting_list_string_decoded += str(freq)
-            first = False
-        else:
-            posting_list_string_decoded += "," + str(freq)
-    return posting_list_string_decoded
+    return gaps_to_docids(decoded_gaps), decoded_freqs
 
 
-def decode_unary(bit_stream):
+def decode_unary(data):
     '''
-    The decode_unary function processes the bit stream by counting consecutive 1s followed by a 0 to determine the
-    original number (gap).
-    :param bit_stream:
+    The decode_unary function counts the ones before each zero: the numbers are the distances between two zeros.
+    the padding (ones at the end, without a final zero) is ignored.
+    :param data: bytes
     :return: gaps
     '''
-    gaps = []
-    count = 0
-    i = 0
-    while i < len(bit_stream):
-        if bit_stream[i] == '1':
-            count += 1
-        elif bit_stream[i] == '0':
-            gaps.append(count + 1)
-            count = 0
-        i += 1
-    return gaps
-
-
-def decode_gamma(bit_stream):
+    zeros = np.flatnonzero(np.unpackbits(np.frombuffer(data, dtype=np.uint8)) == 0)
+    return np.diff(zeros, prepend=-1)
+
+
+# table-driven decoding: the next gamma_table_bits bits of the stream are the index of a table that gives the first
+# gamma code they contain (number, length in bits). codes longer than the window (numbers >= 256) are read bit by bit
+gamma_table_bits = 16
+
+
+def build_gamma_table():
+    # @ return : list of numbers, list of code lengths (0 if the code does not fit in the window)
+    table_numbers = [0] * (1 << gamma_table_bits)
+    table_lengths = [0] * (1 << gamma_table_bits)
+    length = 1
+    while 2 * length - 1 <= gamma_table_bits:
+        code_length = 2 * length - 1
+        for n in range(1 << (length - 1), 1 << length):
+            code = (((1 << (length - 1)) - 1) << length) | (n & ((1 << (length - 1)) - 1))
+            first = code << (gamma_table_bits - code_length)
+            for window in range(first, first + (1 << (gamma_table_bits - code_length))):
+                table_numbers[window] = n
+                table_lengths[window] = code_length
+        length += 1
+    return table_numbers, table_lengths
+
+
+gamma_table_numbers, gamma_table_lengths = build_gamma_table()
+
+
+def decode_elias(data, delta=False):
+    # table-driven decoder of gamma (or delta) codes. the stream is loaded 64 bits at a time in an integer word;
+    # the lowest "bits" bits of the word are the next bits of the stream
+    # after the last byte the stream is read as ones (like the padding): a code that does not end in the stream is
+    # the padding, and the decoding stops
+    size = len(data) * 8
+    data = bytes(data) + b"\xff" * 8
+    numbers = []
+    word = 0
+    bits = 0
+    loaded = 0  # bytes loaded in the word
+    position = 0  # bits already decoded
+    window_shift = gamma_table_bits
+    window_mask = (1 << gamma_table_bits) - 1
+    while position < size:
+        while bits < 64:
+            word = ((word & ((1 << bits) - 1)) << 64) | int.from_bytes(data[loaded:loaded + 8], "big")
+            bits += 64
+            loaded = min(loaded + 8, len(data) - 8)  # after the end, the last 8 bytes of padding are loaded again
+        window = (word >> (bits - window_shift)) & window_mask
+        code_length = gamma_table_lengths[window]
+        if code_length > 0:
+            n = gamma_table_numbers[window]
+        else:
+            # long code: count the ones of the unary part
+            unread = word & ((1 << bits) - 1)
+            ones = bits - (unread ^ ((1 << bits) - 1)).bit_length()
+            while ones == bits and position + bits < size:
+                # only ones in the word, and the stream is not finished: the unary part continues
+                word = (unread << 64) | int.from_bytes(data[loaded:loaded + 8], "big")
+                bits += 64
+                loaded = min(loaded + 8, len(data) - 8)
+                unread = word
+                ones = bits - (unread ^ ((1 << bits) - 1)).bit_length()
+            code_length = 2 * ones + 1
+            if position + code_length > size:
+                break
+            while bits < code_length:
+                word = ((word & ((1 << bits) - 1)) << 64) | int.from_bytes(data[loaded:loaded + 8], "big")
+                bits += 64
+                loaded = min(loaded + 8, len(data) - 8)
+            # the last bits of the code are the final zero of the unary part and the offset
+            n = (1 << ones) | ((word >> (bits - code_length)) & ((1 << ones) - 1))
+        if position + code_length > size:
+            break
+        bits -= code_length
+        position += code_length
+        if delta:
+            # n is the length of the number: the number follows, without its most significant bit
+            if position + n - 1 > size:
+                break
+            while bits < n - 1:
+                word = ((word & ((1 << bits) - 1)) << 64) | int.from_bytes(data[loaded:loaded + 8], "big")
+                bits += 64
+                loaded = min(loaded + 8, len(data) - 8)
+            bits -= n - 1
+            position += n - 1
+            n = (1 << (n - 1)) | ((word >> bits) & ((1 << (n - 1)) - 1))
+        numbers.append(n)
+    return numbers
+
+
+def decode_gamma(data):
     '''The decode_gamma function interprets the unary-coded length and the binary offset.
         It reconstructs the original number (gap) by combining the offset with the length.
 
@@ -117,31 +669,12 @@ def decode_gamma(bit_stream):
                      binary of number 4 is 100 so its representation without the most significant bit is 00
 
         Padding isn’t an issue because:
-            The decoder processes the bit stream in a specific pattern (e.g., identifying unary or gamma encodings).
-            The padding will only be at the end, so it doesn’t interfere with valid encodings.
-            In decode_gamma, once the bit stream is fully processed, any remaining bits (which would only be ones) are simply ignored.
+            The padding will only be at the end, and it's made of ones without the final zero of the unary part:
+            when the rest of the stream is only padding, the decoding stops.
     '''
-    gaps = []
-    i = 0
-    while i < len(bit_stream):
-        length = 0
-        padding = True
-        while i < len(bit_stream) and bit_stream[i] == '1':
-            length += 1
-            i += 1
-        if i < len(bit_stream) and bit_stream[i] == '0':
-            i += 1
-            padding = False
-        if not padding:
-            if length > 0:
-                offset = bit_stream[i:i + length]
-                i += length
-                if offset:
-                    gap = (1 << length) + int(offset, 2)
-                else:
-                    gap = 1 << length
-                gaps.append(gap)
-            else:
-                gap = 1 << length
-                gaps.append(gap)
-    return gaps
+    return decode_elias(data)
+
+
+def decode_delta(data):
+    # Elias delta: the length of each number is gamma coded, followed by the number without its most significant bit
+    return decode_elias(data, delta=True)
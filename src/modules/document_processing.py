@@ -24,7 +24,10 @@ import tarfile
 import pandas as pd
 
 from src.config import collection_path_config, limit_input_rows_config
-from src.modules.utils import print_log
+from src.modules.SeekableCollection import SeekableCollection, seekable_collection_exists
+from src.modules.utils import print_log, open_collection_bytes
+
+seekable_collection = None  # opened by get_seekable_collection
 
 
 def extract_dataset_from_tar(path):
@@ -38,6 +41,14 @@ def extract_dataset_from_tar(path):
     return io.TextIOWrapper(dataset_raw, encoding='utf-8')
 
 
+def open_collection_stream(path=collection_path_config):
+    # open the collection as a text stream, one document for each line (decompressed on the fly for .gz files)
+    if path.endswith(".gz"):
+        # closing the stream closes the tar archive too
+        return io.TextIOWrapper(open_collection_bytes(path), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
 def open_dataset(count_limit=-1, index=None, process_function=None):
     # Opens a dataset file (.tsv or .gz), reads each line, processes valid rows, and logs progress.
     if count_limit > 0 and 0 < limit_input_rows_config < count_limit:
@@ -94,7 +105,7 @@ def process_dataset_row(d_id, d_no, d_text, process_function=None, index=None):
     else:
         if d_id % 10000 == 0:
             print_log("processed " + str(d_id), priority=2)
-    if d_no:
+    if d_no is not None and d_no != "":  # docno 0 is valid (the .tsv reader gives int docnos)
         print_log("processing row " + str(d_id), priority=5)
         if d_text:
             if index is not None and process_function is not None:
@@ -108,6 +119,17 @@ def process_dataset_row(d_id, d_no, d_text, process_function=None, index=None):
     else:  # invalid doc id
         print_log("found invalid docid near row " + str(d_id), priority=3)
 
+
+def get_seekable_collection():
+    # the seekable copy of the collection is opened once, and only if it was built (see SeekableCollection.py)
+    # @ return : SeekableCollection, None if not available
+    global seekable_collection
+    if seekable_collection is None and collection_path_config.endswith(".gz") and \
+            seekable_collection_exists(collection_path_config):
+        seekable_collection = SeekableCollection(collection_path_config)
+    return seekable_collection
+
+
 def fetch_data_row_from_collection(row_index):
     # retrieve one single row from the dataset, given the docid
     # @param row_index : the id of the document in the collection
@@ -121,6 +143,17 @@ def fetch_n_data_rows_from_collection(start_row, stop_row):
     n_rows = stop_row - start_row
     result_id = []
     result_txt = []
+    collection = get_seekable_collection()
+    if collection is not None:
+        # seekable collection: only the blocks that contain the documents are decompressed
+        for target in range(start_row, stop_row):
+            text = collection.fetch(target)
+            if text is not None:
+                result_id.append(target)
+                result_txt.append(text)
+            else:
+                print_log("cannot find line " + str(target), priority=4)
+        return result_id, result_txt
     target_row = []
     for n in range(n_rows):
         target_row.append(n + start_row)
@@ -0,0 +1,225 @@
+import heapq
+
+from src.modules.PostingList import end_of_list
+
+'''
+Dynamic pruning: document-at-a-time query processing that skips the documents that cannot enter the top k.
+Each query term has an upper bound of its weight (computed at index time and saved in the lexicon):
+a document is fully scored only if the bounds of its terms are enough to beat the current k-th best score.
+The top k is the same of the exhaustive disjunctive scoring (ties are ordered by increasing docid).
+
+All the algorithms work on PostingList cursors (docid, freq, next, nextGEQ), with max_score already set.
+@ param posting_lists : list of PostingList, in query order
+@ param k : number of results
+@ param weight : function (term number, docid, freq) returning the weight of one posting
+@ param counters : PruningCounters, updated with the number of postings evaluated
+@ return : dictionary {docid : score} of the top k documents
+'''
+
+# partial scores are summed in a different order than the final ones, so they may differ in the last digits:
+# bounds are compared with a small margin, and a document that could enter the top k is never discarded
+score_tolerance = 1e-9
+
+
+def below_threshold(bound, threshold):
+    # @ return : True if a document with a score lower or equal than bound cannot enter the top k
+    return bound < threshold - score_tolerance * (1 + abs(threshold))
+
+
+class PruningCounters:
+    def __init__(self):
+        self.postings = 0  # postings in the lists of the query terms
+        self.evaluated = 0  # postings whose weight has been computed
+
+    def skipped(self):
+        # postings never scored: jumped by nextGEQ, or read but discarded by the bounds
+        return self.postings - self.evaluated
+
+
+class TopKHeap:
+    def __init__(self, k):
+        # min heap of the best k documents: the root is the worst one (lowest score, highest docid)
+        self.k = k
+        self.heap = []
+
+    def threshold(self):
+        # score to beat to enter the top k
+        if len(self.heap) < self.k:
+            return float("-inf")
+        return self.heap[0][0]
+
+    def push(self, docid, score):
+        # @ return : True if the document entered the top k
+        element = (score, -docid)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, element)
+            return True
+        if element > self.heap[0]:
+            heapq.heapreplace(self.heap, element)
+            return True
+        return False
+
+    def results(self):
+        # @ return : dictionary {docid : score}
+        return {str(-docid): score for score, docid in self.heap}
+
+
+def sum_in_query_order(weights):
+    # the final score is summed in query order, like the exhaustive scoring (same rounding)
+    score = 0
+    for term in sorted(weights):
+        score += weights[term]
+    return score
+
+
+def conjunctive(posting_lists, k, weight, counters):
+    # document-at-a-time intersection: the lists are visited by increasing document frequency. the shortest list
+    # proposes a candidate, the others jump on it with nextGEQ (galloping, so the long lists are mostly skipped).
+    # when a list lands after the candidate, that docid becomes the new candidate.
+    # a document is scored as soon as it is confirmed in all the lists: no set of docids is built
+    top_k = TopKHeap(k)
+    if k < 1 or len(posting_lists) == 0:
+        return top_k.results()
+    order = sorted(range(len(posting_lists)), key=lambda t: posting_lists[t].size)
+    shortest = posting_lists[order[0]]
+    candidate = shortest.docid()
+    while candidate != end_of_list:
+        confirmed = True
+        for t in order[1:]:
+            docid = posting_lists[t].nextGEQ(candidate)
+            if docid != candidate:
+                # candidate missing in this list: restart from the first docid that could be in all of them
+                candidate = shortest.nextGEQ(docid)
+                confirmed = False
+                break
+        if confirmed:
+            weights = {}
+            for t in order:
+                weights[t] = weight(t, candidate, posting_lists[t].freq())
+                counters.evaluated += 1
+            top_k.push(candidate, sum_in_query_order(weights))
+            candidate = shortest.next()
+    return top_k.results()
+
+
+def maxscore(posting_lists, k, weight, counters):
+    # MaxScore: the terms with the lowest upper bounds are "non essential" when the sum of their bounds is lower
+    # than the threshold. a document that contains only non essential terms cannot enter the top k, so the
+    # candidates are taken from the essential terms only, and non essential lists are read with nextGEQ
+    top_k = TopKHeap(k)
+    if k < 1 or len(posting_lists) == 0:
+        return top_k.results()
+    # terms ordered by increasing upper bound, with the cumulative sum of the bounds
+    order = sorted(range(len(posting_lists)), key=lambda t: posting_lists[t].max_score)
+    cumulative_bounds = []
+    for t in order:
+        cumulative_bounds.append((cumulative_bounds[-1] if cumulative_bounds else 0) + posting_lists[t].max_score)
+    first_essential = 0  # position in order of the first essential term
+
+    current = min(posting_list.docid() for posting_list in posting_lists)
+    while current != end_of_list and first_essential < len(order):
+        weights = {}  # term number : weight of the term in the current document
+        next_docid = end_of_list
+        # essential terms: move the cursors on the current document
+        for i in range(first_essential, len(order)):
+            t = order[i]
+            posting_list = posting_lists[t]
+            if posting_list.docid() == current:
+                weights[t] = weight(t, current, posting_list.freq())
+                counters.evaluated += 1
+                posting_list.next()
+            next_docid = min(next_docid, posting_list.docid())
+
+        # non essential terms: from the highest bound, while the document can still enter the top k
+        partial_score = sum(weights.values())
+        pruned = False
+        for i in range(first_essential - 1, -1, -1):
+            if below_threshold(partial_score + cumulative_bounds[i], top_k.threshold()):
+                pruned = True
+                break
+            t = order[i]
+            posting_list = posting_lists[t]
+            if posting_list.nextGEQ(current) == current:
+                weights[t] = weight(t, current, posting_list.freq())
+                counters.evaluated += 1
+                partial_score += weights[t]
+
+        if not pruned and top_k.push(current, sum_in_query_order(weights)):
+            # a higher threshold may turn some terms in non essential ones
+            while first_essential < len(order) and below_threshold(cumulative_bounds[first_essential],
+                                                                   top_k.threshold()):
+                first_essential += 1
+        current = next_docid
+    return top_k.results()
+
+
+def wand(posting_lists, k, weight, counters):
+    # WAND: the lists are kept ordered by current docid, and the pivot is the first list where the sum of the
+    # upper bounds reaches the threshold. documents before the pivot docid cannot enter the top k
+    return weak_and(posting_lists, k, weight, counters, block_max=False)
+
+
+def block_max_wand(posting_lists, k, weight, counters):
+    # Block-Max WAND: like WAND, but the pivot docid is checked again with the maximum scores of the blocks that
+    # contain it. if the blocks cannot reach the threshold, the lists jump to the end of the shortest block
+    # the lists must have their blocks set (see PostingList.set_block_max_scores)
+    return weak_and(posting_lists, k, weight, counters, block_max=True)
+
+
+def weak_and(posting_lists, k, weight, counters, block_max):
+    top_k = TopKHeap(k)
+    if k < 1:
+        return top_k.results()
+    terms = list(range(len(posting_lists)))  # term numbers, ordered by the current docid of their list
+    while True:
+        terms.sort(key=lambda t: posting_lists[t].docid())
+        threshold = top_k.threshold()
+
+        # pivot selection
+        pivot = -1
+        bound = 0
+        for i, t in enumerate(terms):
+            if posting_lists[t].docid() == end_of_list:
+                break
+            bound += posting_lists[t].max_score
+            if not below_threshold(bound, threshold):
+                pivot = i
+                break
+        if pivot == -1:
+            # no document left can enter the top k
+            break
+        pivot_docid = posting_lists[terms[pivot]].docid()
+        # the lists after the pivot on the same document are part of it
+        while pivot + 1 < len(terms) and posting_lists[terms[pivot + 1]].docid() == pivot_docid:
+            pivot += 1
+
+        if block_max:
+            # shallow move: the blocks that contain the pivot docid are checked without decoding any posting
+            block_bound = 0
+            for t in terms[:pivot + 1]:
+                block_bound += posting_lists[t].block_max_score(pivot_docid)
+            if below_threshold(block_bound, threshold):
+                # no document can enter the top k until the end of the first block, or the next list
+                next_docid = min(posting_lists[t].block_last_docid() for t in terms[:pivot + 1]) + 1
+                if pivot + 1 < len(terms):
+                    next_docid = min(next_docid, posting_lists[terms[pivot + 1]].docid())
+                next_docid = max(next_docid, pivot_docid + 1)
+                skipping = max(terms[:pivot + 1], key=lambda t: posting_lists[t].max_score)
+                posting_lists[skipping].nextGEQ(next_docid)
+                continue
+
+        if posting_lists[terms[0]].docid() == pivot_docid:
+            # every list up to the pivot is on the pivot document: full evaluation
+            weights = {}
+            for t in terms[:pivot + 1]:
+                posting_list = posting_lists[t]
+                weights[t] = weight(t, pivot_docid, posting_list.freq())
+                counters.evaluated += 1
+                posting_list.next()
+            top_k.push(pivot_docid, sum_in_query_order(weights))
+        else:
+            # move one of the lists before the pivot (the one with the highest bound) on the pivot document
+            skipping = max((t for t in terms[:pivot] if posting_lists[t].docid() < pivot_docid),
+                           key=lambda t: posting_lists[t].max_score)
+            posting_lists[skipping].nextGEQ(pivot_docid)
+    return top_k.results()
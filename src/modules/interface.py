@@ -26,7 +26,7 @@ skip_stemming = False
 allow_stop_words = True
 index_restart_needed = True
 first_step = 0
-search_algorithm = "ternary"
+search_algorithm = "in_memory"
 index_title = default_index_title
 
 
@@ -278,6 +278,7 @@ def user_write_parameters(main_query_handler):
         # Check for duplicates
         if os.path.exists(index_config_path + get_index_name() + file_format):
             # duplicate found, clean the files used in "append" mode
+            main_query_handler.close()  # mapped files cannot be removed while in use (Windows)
             main_query_handler.index.flush_collection_stats()
 
         # some parameters are affecting the indexing algorithm, so it's required to re-scan the collection
@@ -290,5 +291,7 @@ def user_write_parameters(main_query_handler):
         main_query_handler.index.save_on_disk()  # this overwrites the previous index_info file
 
         # reindex the collection, time intensive
+        main_query_handler.close()
         main_query_handler.index.scan_dataset(file_count, delete_chunks=True, delete_after_compression=True)
+        main_query_handler.open_index_files()
         clear_restart_needed()
@@ -1,13 +1,21 @@
 import os
-
-from src.modules.InvertedIndex import index_setup, load_from_disk
-from src.modules.compression import to_gamma, to_unary, bit_stream_to_bytes
-from src.modules.document_processing import extract_dataset_from_tar
+import queue
+from array import array
+from multiprocessing import get_context
+
+import numpy as np
+
+from src.modules.InvertedIndex import index_setup, load_from_disk, merge_chunks, write_posting_lists, chunk_file_name, \
+    write_chunk_file, read_chunk_file, merge_posting_streams
+from src.modules.document_processing import open_collection_stream
+from src.modules.DocumentTable import DocumentTable, doc_table_path
+from src.modules.partitioning import plan_partitions, save_manifest, read_partition_lines
+from src.modules.PostingBuffer import PostingBuffer
 from src.modules.preprocessing import preprocess_text, count_token_occurrences
 
 from src.config import *
 from multiprocessing import Process
-from src.modules.utils import print_log, next_GEQ_line
+from src.modules.utils import print_log
 '''
 Multiprocessing module that contains a subset of existing function that be fixed to run in a multi process way. 
 '''
@@ -16,17 +24,15 @@ stop_words = None
 stemmer = None
 
 
-def read_portion_of_dataset(collection_path, flags, start_subindex_pos, end_subindex_pos, process_function,
-                            delete_chunks,
+def read_portion_of_dataset(collection_path, flags, partition, process_function, delete_chunks,
                             delete_after_compression):
-    # function that provide a separation of the entire collection within start_subindex_pos and end_subindex_pos and others stuffs
+    # index one partition of the collection (see partitioning.py): the lines starting in [start, end)
+    # docids are local to the partition (row number in the partition), merge_indexes.py converts them
     read_rows = 0
-    dataset = extract_dataset_from_tar(collection_path)
-    start_subindex_pos, _ = next_GEQ_line(dataset, start_subindex_pos)
-    dataset.seek(start_subindex_pos)
-    posting_buffer = []  # memory buffer
+    dataset = read_partition_lines(partition, collection_path)
+    posting_buffer = PostingBuffer()  # memory buffer
     posting_file_list = []  # list of file names
-    index_name = f"indt_multiproc_stem{flags[4]}_stopword{flags[5]}_{start_subindex_pos}_{end_subindex_pos}"
+    index_name = partition.index_name
     test_index_element = load_from_disk(index_name)
     if test_index_element is None:
         test_index_element = index_setup(index_name, stemming_flag=flags[4], stop_words_flag=flags[5],
@@ -36,29 +42,26 @@ def read_portion_of_dataset(collection_path, flags, start_subindex_pos, end_subi
         if not test_index_element.content_check(int(flags[0] / 2)):
 
             print_log("scan limited to " + str(flags[0]) + " rows", priority=4)
-            while True:
-                line = dataset.readline()
-                if line:
-                    print_log("read progress: " + str(read_rows), priority=5)
-                    if 0 < flags[0] <= read_rows or dataset.tell() >= end_subindex_pos:
-                        break
-                    content = line.strip().split("\t")
-                    if len(content) == 2:
-                        posting_buffer, posting_file_list = process_dataset_row(read_rows, content[0], content[1],
-                                                                                posting_buffer, posting_file_list,
-                                                                                process_function, test_index_element)
-                    else:
-                        print_log("invalid line len at row " + str(read_rows), priority=4)
-
-                    read_rows += 1
-                else:
+            for line in dataset:
+                print_log("read progress: " + str(read_rows), priority=5)
+                if 0 < flags[0] <= read_rows:
                     break
+                content = line.strip().split("\t")
+                if len(content) == 2:
+                    posting_buffer, posting_file_list = process_dataset_row(read_rows, content[0], content[1],
+                                                                            posting_buffer, posting_file_list,
+                                                                            process_function, test_index_element)
+                else:
+                    print_log("invalid line len at row " + str(read_rows), priority=4)
+
+                read_rows += 1
+            dataset.close()
 
             print_log("dataset scan completed", priority=3)
 
             if len(posting_file_list) > 0:
                 # the last chunk is not full, but it's still important to write a file
-                posting_buffer, posting_file_list = close_chunk(test_index_element)
+                posting_buffer, posting_file_list = close_chunk(test_index_element, posting_buffer, posting_file_list)
 
                 lines = merge_chunks(posting_file_list, test_index_element.index_file_path,
                                      test_index_element.lexicon_path,
@@ -67,9 +70,9 @@ def read_portion_of_dataset(collection_path, flags, start_subindex_pos, end_subi
             else:
                 # there is only one chunk, either for the size too big, the file count too small, or chunk splitting is
                 # disabled
-                lines = write_output_files(test_index_element.index_file_path, test_index_element.lexicon_path,
-                                           posting_buffer, posting_file_list,
-                                           compression=test_index_element.compression)
+                lines = write_posting_lists(posting_buffer.sorted_items(), test_index_element.index_file_path,
+                                            test_index_element.lexicon_path,
+                                            compression=test_index_element.compression)
             test_index_element.index_len += lines
 
             test_index_element.lexicon_len += lines
@@ -77,10 +80,10 @@ def read_portion_of_dataset(collection_path, flags, start_subindex_pos, end_subi
 
             if delete_after_compression:
                 print_log("deleted uncompressed index file", priority=1)
-                for filename in os.listdir(index_folder_path + test_index_element.name):
+                for filename in os.listdir(root_directory + test_index_element.name):
                     # look for files with name starting with "chunk"
                     if filename.startswith("chunk"):
-                        file_path = os.path.join(index_folder_path + test_index_element.name, filename)
+                        file_path = os.path.join(root_directory + test_index_element.name, filename)
                         try:
                             # delete file
                             os.remove(file_path)
@@ -93,31 +96,27 @@ def read_portion_of_dataset(collection_path, flags, start_subindex_pos, end_subi
     print_log("read finished", priority=4)
 
 
-def open_dataset_multiprocess(flag, process_function, delete_chunks, delete_after_compression, parts):
+def open_dataset_multiprocess(flag, process_function, delete_chunks, delete_after_compression, parts,
+                              collection_path=collection_path_config, manifest_path=partition_manifest_path):
     # Opens a dataset file (.tsv or .gz), reads each line, processes valid rows, and logs progress in a MULTIPROCESS WAY.
-    global procs
-    # reset row counter
-    partitions_number = parts
+    # the collection is split in balanced partitions (one process each), saved in the manifest for merge_indexes.py
+    # partitioned build: scan_dataset_parallel is the entry point for a single index
     print_log("opening dataset file", priority=3)
-    interval_sub_index = [0]
-    if collection_path_config.endswith(".gz"):
-        # working with compressed file, required uncompression
-        dataset_size = 3061567853
-        subindex_size = int(dataset_size / partitions_number)
-        for index in range(partitions_number):
-            pos = index * subindex_size + subindex_size
-            interval_sub_index.append(pos)
-        for i in range(partitions_number):
-            # Spawn the process
-            proc = Process(target=read_portion_of_dataset, args=(
-                collection_path_config, flag, interval_sub_index[i],
-                interval_sub_index[i + 1], process_function, delete_chunks, delete_after_compression,))
-            procs.append(proc)
-            proc.start()
-
-        # complete the processes
-        for proc in procs:
-            proc.join()
+    partitions, rows_count = plan_partitions(parts, collection_path,
+                                             name_template=f"indt_multiproc_stem{flag[4]}_stopword{flag[5]}_")
+    save_manifest(partitions, rows_count, collection_path, manifest_path)
+    procs = []
+    for partition in partitions:
+        # Spawn the process
+        proc = Process(target=read_portion_of_dataset, args=(
+            collection_path, flag, partition, process_function, delete_chunks, delete_after_compression,))
+        procs.append(proc)
+        proc.start()
+
+    # complete the processes
+    for proc in procs:
+        proc.join()
+    return manifest_path
 
 
 def process_dataset_row(d_id, d_no, d_text, posting_buffer, posting_file_list, process_function=None, index=None):
@@ -126,7 +125,7 @@ def process_dataset_row(d_id, d_no, d_text, posting_buffer, posting_file_list, p
     else:
         if d_id % 10000 == 0:
             print_log("processed " + str(d_id), priority=2)
-    if d_no:
+    if d_no is not None and d_no != "":  # docno 0 is valid
         print_log("processing row " + str(d_id), priority=5)
         if d_text:
             if index is not None and process_function is not None:
@@ -144,8 +143,9 @@ def process_dataset_row(d_id, d_no, d_text, posting_buffer, posting_file_list, p
 
 
 def close_chunk(index, posting_buffer, posting_file_list):
-    new_chunk_post, posting_buffer, posting_file_list = create_posting_chunk(index, "chunk_posting_" + str(
-        len(posting_file_list)) + file_format, posting_buffer, posting_file_list)
+    index.flush_stats_writer()
+    new_chunk_post, posting_buffer, posting_file_list = create_posting_chunk(
+        index, chunk_file_name(len(posting_file_list)), posting_buffer, posting_file_list)
     posting_file_list.append(new_chunk_post)
     print_log("chunks created: ", 5)
     print_log(posting_file_list, 5)
@@ -155,24 +155,14 @@ def close_chunk(index, posting_buffer, posting_file_list):
 def create_posting_chunk(index, filename, posting_buffer, posting_file_list):
     # write a chunk of posting lists to disk
     # @ param filename: output file path (complete with file format)
-    # posting_buffer is a list where each element have this structure:
-    #     [token_id, [docid, token_count]]
+    # posting_buffer maps each token to its columns of docids and frequencies
 
     # MANDATORY: every chunk must be ordinated
-    posting_buffer_sorted = sorted(posting_buffer, key=lambda x: x[0])
-    chunk_name = index_folder_path + index.name + "/" + filename
+    posting_buffer_sorted = posting_buffer.sorted_items()
+    chunk_name = root_directory + index.name + "/" + filename
     try:
-        with open(chunk_name, "w") as file:
-            for row in posting_buffer_sorted:
-                row_string = str(row[0]) + posting_separator
-                for pair in row[1:]:
-                    element = str(pair[0]) + docid_separator + str(pair[1])
-                    if pair == row[-1]:
-                        row_string += element
-                    else:
-                        row_string += element + element_separator
-                file.write(row_string + chunk_line_separator)
-        posting_buffer = []
+        write_chunk_file(chunk_name, posting_buffer_sorted)
+        posting_buffer.clear()
     except IOError:
         print(IOError)
         print_log("Writing new posting file chunk to file. dumping chunk here: ", 5)
@@ -185,9 +175,9 @@ def add_document_to_index(index, args, posting_buffer, posting_file_list):
     # global lexicon_file_list  # list of file names
     if len(args) != 3:
         print_log("CRITICAL ERROR: missing arguments to add document to index : " + str(args), 0)
-        return
-    if not os.path.exists(index_folder_path + index.name):
-        os.mkdir(index_folder_path + index.name)
+        return posting_buffer, posting_file_list
+    if not os.path.exists(root_directory + index.name):
+        os.mkdir(root_directory + index.name)
         print_log("created new directory for index files", priority=3)
     docid, docno, doctext = args[0], args[1], args[2]
 
@@ -197,7 +187,7 @@ def add_document_to_index(index, args, posting_buffer, posting_file_list):
     is_duplicate = index.add_content_id(int(docno))
     if is_duplicate:
         print_log("duplicate document " + str(docno), priority=4)
-        return
+        return posting_buffer, posting_file_list
     print_log("adding row " + str(docid) + " as document " + str(docno) + " to index " + str(index.name), priority=5)
 
     tokens = preprocess_text(doctext, index.skip_stemming, index.allow_stop_words)
@@ -218,176 +208,201 @@ def add_document_to_index(index, args, posting_buffer, posting_file_list):
 def add_posting_list(token_id, token_count, docid, posting_buffer, posting_file_list):
     # add new entries in posting list.
     # print_log("adding new posting list: " + str(token_id), priority=5)
-    stats = [docid, token_count]
-    found_token = False
-    found_doc = False
-    for posting_list in posting_buffer:
-        if posting_list[0] == token_id:
-            found_token = True
-            for pair in posting_list[1:]:
-                if pair[0] == docid:
-                    found_doc = True
-                    pair[1] += token_count
-                    break
-            if not found_doc:
-                posting_list.append(stats)
-            break
-    if not found_token:
-        posting_buffer.append([token_id, stats])
-    if index_chunk_size < 1:  # no limit on the chunk size
-        return False, posting_buffer, posting_file_list
-    if len(posting_buffer) > index_chunk_size:
+    posting_buffer.add(token_id, token_count, docid)
+    if posting_buffer.is_full(index_chunk_size):
         print_log("posting memory buffer is full", priority=4)
         return True, posting_buffer, posting_file_list  # chunk is big, time to write it on disk
     else:
         return False, posting_buffer, posting_file_list  # no need to write it on disk yet
 
 
-def merge_chunks(file_list, index_file_path, lexicon_file_path, compression="no", delete_after_merge=True):
-    written_lines = 0
-    reader_list = []  # list of pointers to files
-    doc_list = []
-    occurrence_list = []
-    first_element_list = []  # list of the next (lowest) element taken from each file
-    for file in file_list:
-        reader = open(file, "r+")
-        reader_list.append(reader)
-        first_element_list.append(reader.readline())
-
-    if os.path.exists(index_file_path):
-        # delete the file if any previous duplicate was present
-        os.remove(index_file_path)
-
-    if os.path.exists(lexicon_file_path):
-        # delete the file if any previous duplicate was present
-        os.remove(lexicon_file_path)
-    if compression != "no":
-        index_file = open(index_file_path, "wb+")
-    else:
-        index_file = open(index_file_path, "w+")
-    lexicon_file = open(lexicon_file_path, "w+")
-
-    while True:
-        next_chunk_index = []
-        # i have to compare every element of firstelemlist
-        i = 0
-        output_row = ""  # list of elements for the posting list
-        # example of output row :: ["0|1" , "1|2"]
-        output_key = ""  # token as string
-        # look at each first element, search the lowest, write its index in next_index
-        for element in first_element_list:
-            # make sure the list is not empty
-            if element != "empty":
-                element = element.replace(" \n", "")
-                element_splitted = element.split(sep=posting_separator)
-                # "lowest" is in alphabetical order
-                if output_key == "" or element_splitted[0] < output_key:
-                    output_key, output_row = element_splitted[0], element_splitted[1].split(element_separator)
-                    next_chunk_index = [i]
-                elif element_splitted[0] == output_key:
-                    # example of "element_splitted[i]: token1:docid1|count;docid2|count;................docidN|count
-                    for ep in element_splitted[1].split(element_separator):
-                        output_row.append(ep)
-                    output_row = sorted(output_row,
-                                        key=lambda x: x.split(docid_separator)[0])
-                    next_chunk_index.append(i)
-
-            i += 1
-        if len(next_chunk_index) > 0:
-            # move the list pointer to the next element
-            for index in next_chunk_index:
-                first_element_list[index] = reader_list[index].readline()
-                if len(first_element_list[index]) == 0:
-                    first_element_list[index] = "empty"
-
-            # OUTPUT: writing the index file
-            line = ""
-            doc_list = []
-            occurrence_list = []
-            for e in output_row:
-                elem = e.split("|")
-                doc_list.append(elem[0])
-                occurrence_list.append(elem[1])
-            posting_offset = index_file.tell()
-            index_file.write(make_posting_list(doc_list, occurrence_list, compression))
-            written_lines += 1
-            lexicon_file.write(output_key + element_separator + str(len(doc_list)) + element_separator + str(
-                posting_offset) + chunk_line_separator)
-        else:
-            # all lists are empty
-            break
-
-    print_log("Chunks merge finished for ", 1)
-    for file in reader_list:
-        file.close()
-    if delete_after_merge:
-        print_log("Deleting chunks after merge", 2)
-        for file_name in file_list:
-            os.remove(file_name)
-    index_file.close()
-    lexicon_file.close()
-    return written_lines
-
-
-def make_posting_list(list_doc_id, list_freq, compression="no"):
-    # Step 1: Encode the number of doc IDs
-    combined = list(zip(list_doc_id, list_freq))
-    combined.sort(key=lambda x: int(x[0]))
-
-    # split combined list
-    list_doc_id_sorted, list_freq_sorted = zip(*combined)
-
-    # convert them into lists
-    list_doc_id_sorted = list(list_doc_id_sorted)
-    list_freq_sorted = list(list_freq_sorted)
-    gap_list = []
-    previous_doc_id = 0
-    for doc_id in list_doc_id_sorted:
-        gap_list.append(int(doc_id) - previous_doc_id)
-        previous_doc_id = int(doc_id)
-    if compression != "no":
-        # Step 2: Encode the doc IDs using gap encoding
-        if compression == "unary":
-            encoded_gap_list = [to_unary(gap) for gap in gap_list]
-            encoded_freq_list = [to_unary(int(freq)) for freq in list_freq_sorted]
-        elif compression == "gamma":
-            encoded_gap_list = [to_gamma(gap) for gap in gap_list]
-            encoded_freq_list = [to_gamma(int(freq)) for freq in list_freq_sorted]
-        else:
-            raise ValueError(f"Unsupported encoding type: {compression}")
-
-        # Combine the bit streams: number of doc IDs, doc IDs, and frequencies
-        bit_stream = ''.join(encoded_gap_list) + ''.join(encoded_freq_list)
-
-        # return bit_stream
+'''
+Parallel indexing pipeline (producer/consumer).
+one reader (the main process) reads and decompresses the collection only once, assigns the global docids (row
+numbers, like open_dataset) and sends batches of rows to a pool of worker processes.
+each worker tokenizes its documents and accumulates the postings in its own PostingBuffer, written as a sorted run
+(binary chunk file) when full. the lengths of the documents go back to the reader, which writes the collection
+statistics in docid order. at the end, the runs of all the workers are merged into a single index.
+this is the canonical way to build an index (see create_indexes.py). open_dataset_multiprocess builds one independent
+index for each partition instead, merged later by merge_indexes.py: it's needed only to index the collection in
+separate runs.
+'''
 
-        # Convert the bit stream into bytes
-        compressed_bytes = bit_stream_to_bytes(bit_stream)
-        return compressed_bytes
-    else:
-        posting_string = ",".join(list(map(str, gap_list))) + " " + ",".join(list_freq_sorted) + chunk_line_separator
-        return posting_string
 
+def run_file_name(run_folder, worker_number, run_number):
+    return run_folder + f"run_{worker_number}_{run_number}" + binary_file_format
 
-def write_output_files(index_file_path, lexicon_path, posting_buffer, posting_file_list, compression="no"):
-    written_lines = 0
 
-    # MANDATORY: every chunk must be ordinated
-    posting_buffer_sorted = sorted(posting_buffer, key=lambda x: x[0])
-
-    with open(index_file_path, "w") as index_file:
-        with open(lexicon_path, "w") as lexicon_file:
-            for element in posting_buffer_sorted:
-                token = str(element[0])
-                occurrence_list = []
-                doc_list = []
-                for doc, f in element[1:]:
-                    doc_list.append(str(doc))
-                    occurrence_list.append(str(f))
-                posting_offset = index_file.tell()
-                index_file.write(make_posting_list(doc_list, occurrence_list, compression))
-                written_lines += 1
-                lexicon_file.write(token + element_separator + str(len(doc_list)) + element_separator + str(
-                    posting_offset) + chunk_line_separator)
-
-    return written_lines
+def indexing_worker(worker_number, run_folder, flags, task_queue, result_queue, memory_limit):
+    # consumer: builds postings runs from the batches of the queue, until it receives None
+    # @ param run_folder : folder of the run files (passed by the reader: spawned processes reload the config)
+    # @ param flags : (skip_stemming, allow_stop_words) of the index
+    # results sent to the reader: ("batch", batch number, docids, lengths) for each batch, then ("runs", list of runs)
+    posting_buffer = PostingBuffer()
+    runs = []
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_number, rows = task
+        docids = array('I')
+        lengths = array('I')
+        for docid, doctext in rows:
+            tokens = preprocess_text(doctext, flags[0], flags[1])
+            for token_id, token_count in count_token_occurrences(tokens).items():
+                posting_buffer.add(token_id, token_count, docid)
+            docids.append(docid)
+            lengths.append(len(tokens))
+        result_queue.put(("batch", batch_number, docids, lengths))
+        if posting_buffer.is_full(memory_limit):
+            runs.append(run_file_name(run_folder, worker_number, len(runs)))
+            write_chunk_file(runs[-1], posting_buffer.sorted_items())
+            posting_buffer.clear()
+    if not posting_buffer.is_empty():
+        runs.append(run_file_name(run_folder, worker_number, len(runs)))
+        write_chunk_file(runs[-1], posting_buffer.sorted_items())
+    result_queue.put(("runs", worker_number, runs))
+
+
+def merge_runs(streams):
+    # like merge_posting_streams, but the runs of different workers have interleaved docids: the postings of a token
+    # are sorted by docid after the concatenation (docids are unique, each document is indexed by one worker)
+    for token, docids, freqs in merge_posting_streams(streams):
+        docids_array = np.frombuffer(docids, dtype=np.uint32)
+        if len(docids_array) > 1 and np.any(docids_array[1:] < docids_array[:-1]):
+            order = np.argsort(docids_array, kind="stable")
+            docids = array('I', docids_array[order].tobytes())
+            freqs = array('I', np.frombuffer(freqs, dtype=np.uint32)[order].tobytes())
+        yield token, docids, freqs
+
+
+def scan_dataset_parallel(index, workers=indexing_workers_config, count_limit=-1, delete_runs=True):
+    # build the index with a pool of worker processes, reading the collection only once
+    # @ param index : InvertedIndex already set up (see index_setup), filled from scratch
+    # @ param workers : number of worker processes (0: one for each core)
+    if workers < 1:
+        workers = os.cpu_count() or 1
+    if count_limit > 0 and 0 < limit_input_rows_config < count_limit:
+        count_limit = limit_input_rows_config
+    if not os.path.exists(root_directory + index.name):
+        os.mkdir(root_directory + index.name)
+    print_log(f"starting parallel dataset scan with {workers} workers", priority=1)
+
+    context = get_context()
+    # bounded queue: the reader cannot get too far ahead of the workers
+    task_queue = context.Queue(maxsize=2 * workers)
+    result_queue = context.Queue()
+    flags = (index.skip_stemming, index.allow_stop_words)
+    memory_limit = index_chunk_size // workers if index_chunk_size > 0 else index_chunk_size
+    procs = [context.Process(target=indexing_worker,
+                             args=(i, root_directory + index.name + "/", flags, task_queue, result_queue, memory_limit))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    # the statistics of the batches are written in docid order: batches completed early wait here
+    docnos = {}  # batch number -> docnos of the batch
+    completed = {}  # batch number -> (docids, lengths)
+    next_batch = [0]
+    runs = []
+    finished_workers = []
+
+    def handle_result(result):
+        if result[0] == "runs":
+            finished_workers.append(result[1])
+            runs.extend(result[2])
+            return
+        completed[result[1]] = (result[2], result[3])
+        while next_batch[0] in completed:
+            batch_docids, batch_lengths = completed.pop(next_batch[0])
+            for docid, docno, length in zip(batch_docids, docnos.pop(next_batch[0]), batch_lengths):
+                index.add_to_collection_stats(docid, docno, length)
+            next_batch[0] += 1
+
+    def drain_results():
+        while True:
+            try:
+                handle_result(result_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def check_workers():
+        # a worker killed or stopped by an exception never sends its results: the scan would wait forever
+        for number, proc in enumerate(procs):
+            if proc.exitcode is not None and proc.exitcode != 0:
+                for other in procs:
+                    if other.is_alive():
+                        other.terminate()
+                print_log(f"indexing worker {number} died with exit code {proc.exitcode}", priority=0)
+                raise RuntimeError(f"indexing worker {number} died with exit code {proc.exitcode}")
+
+    def put_task(task):
+        # the task queue is bounded: while it's full, results are read and the workers are checked
+        while True:
+            try:
+                task_queue.put(task, timeout=indexing_poll_interval)
+                return
+            except queue.Full:
+                drain_results()
+                check_workers()
+
+    batches = 0
+    rows = []
+    batch_docnos = []
+    read_rows = 0
+    dataset = open_collection_stream(collection_path_config)
+    for line in dataset:
+        if 0 < count_limit <= read_rows:
+            break
+        content = line.strip().split("\t")
+        if len(content) == 2 and content[0] and content[1]:
+            if index.add_content_id(int(content[0])):
+                print_log("duplicate document " + content[0], priority=4)
+            else:
+                rows.append((read_rows, content[1]))
+                batch_docnos.append(int(content[0]))
+        else:
+            print_log("invalid line at row " + str(read_rows), priority=4)
+        read_rows += 1
+        if len(rows) >= indexing_batch_rows:
+            docnos[batches] = batch_docnos
+            put_task((batches, rows))
+            batches += 1
+            rows, batch_docnos = [], []
+            drain_results()
+        if read_rows % 100000 == 0:
+            print_log("read " + str(read_rows), priority=2)
+    dataset.close()
+    if rows:
+        docnos[batches] = batch_docnos
+        put_task((batches, rows))
+        batches += 1
+    for _ in procs:
+        put_task(None)
+    print_log("dataset read: " + str(read_rows) + " rows in " + str(batches) + " batches", priority=3)
+
+    # every result must be read before joining the workers
+    while next_batch[0] < batches or len(finished_workers) < len(procs):
+        try:
+            handle_result(result_queue.get(timeout=indexing_poll_interval))
+        except queue.Empty:
+            check_workers()
+    for proc in procs:
+        proc.join()
+    index.close_stats_writer()
+    print_log("parallel scan completed: " + str(len(runs)) + " runs", priority=3)
+
+    # final merge: a single index with the global docids
+    doc_table = DocumentTable(doc_table_path(index.collection_statistics_path))
+    lines = write_posting_lists(merge_runs([read_chunk_file(run) for run in sorted(runs)]), index.index_file_path,
+                                index.lexicon_path, compression=index.compression, doc_table=doc_table,
+                                avg=index.doc_len_average)
+    doc_table.close()
+    index.index_len += lines
+    index.lexicon_len += lines
+    print_log("merged all runs", priority=1)
+    if delete_runs:
+        for run in runs:
+            os.remove(run)
+    index.save_on_disk()
+    return index
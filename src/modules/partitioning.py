@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+
+from src.config import collection_path_config, partition_manifest_path, partition_offsets_step, binary_file_format, \
+    collection_separator, chunk_line_separator
+from src.modules.SeekableCollection import SeekableCollection, seekable_collection_exists
+from src.modules.utils import print_log, open_collection_bytes
+
+'''
+partition planner for the multiprocess indexing.
+the collection is split in partitions of (about) the same size in bytes, aligned on line boundaries:
+    .tsv : the boundaries are computed from the size of the file, and moved forward to the next line start
+    .gz : the boundaries are taken from a line offset index, built once with a full scan of the uncompressed stream
+          (one entry every partition_offsets_step lines: row number and byte offset in the uncompressed collection),
+          or from the blocks of the seekable collection if available (see SeekableCollection.py)
+a partition contains the lines starting at a byte offset in [start, end): each line belongs to exactly one partition.
+the plan is saved as a manifest, read by the workers (multiprocessing.py) and by merge_indexes.py:
+    collection path
+    number of rows in the collection (-1 if unknown)
+    one line for each partition: number,start,end,first row (-1 if unknown),index name
+'''
+
+
+class Partition:
+    def __init__(self, number, start, end, first_row=-1, index_name=""):
+        self.number = number
+        self.start = start  # byte offset of the first line (uncompressed collection)
+        self.end = end  # byte offset after the last line
+        self.first_row = first_row  # row number of the first line (-1 if unknown)
+        self.index_name = index_name  # name of the index built from the partition
+
+    def to_str(self):
+        return collection_separator.join(
+            [str(self.number), str(self.start), str(self.end), str(self.first_row), self.index_name])
+
+
+def line_offsets_path(collection_path):
+    return os.path.splitext(collection_path)[0] + "_line_offsets" + binary_file_format
+
+
+def build_line_offsets(collection_path=collection_path_config, step=partition_offsets_step):
+    # one full scan of the collection: row number and byte offset of one line every step lines
+    # @ return : numpy array of (row, offset), the last entry is (number of rows, size of the collection)
+    print_log("building line offset index for " + collection_path, 2)
+    entries = []
+    offset = 0
+    rows = 0
+    with open_collection_bytes(collection_path) as dataset:
+        for line in dataset:
+            if rows % step == 0:
+                entries.append((rows, offset))
+            offset += len(line)
+            rows += 1
+    entries.append((rows, offset))
+    offsets = np.array(entries, dtype=np.uint64)
+    offsets.tofile(line_offsets_path(collection_path))
+    return offsets
+
+
+def load_line_offsets(collection_path=collection_path_config):
+    # load the line offset index, building it if it's missing or older than the collection
+    path = line_offsets_path(collection_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(collection_path):
+        return build_line_offsets(collection_path)
+    return np.fromfile(path, dtype=np.uint64).reshape(-1, 2)
+
+
+def next_line_start(dataset, position):
+    # first line start at or after position, in a binary file
+    if position == 0:
+        return 0
+    dataset.seek(position - 1)
+    dataset.readline()  # rest of the line that contains position - 1 (empty if position is a line start)
+    return dataset.tell()
+
+
+def plan_partitions(parts, collection_path=collection_path_config, name_template="partition_"):
+    # @ param parts : number of partitions
+    # @ return : list of Partition, number of rows in the collection (-1 if unknown)
+    if collection_path.endswith(".gz"):
+        if seekable_collection_exists(collection_path):
+            # partitions start on the blocks of the seekable collection: no scan required
+            collection = SeekableCollection(collection_path)
+            offsets = collection.line_offsets()
+            collection.close()
+        else:
+            offsets = load_line_offsets(collection_path)
+        rows_count, size = int(offsets[-1][0]), int(offsets[-1][1])
+        # the boundaries are the offset index entries closest to an equal split
+        targets = [size * i // parts for i in range(1, parts)]
+        positions = np.searchsorted(offsets[:, 1], np.array(targets, dtype=np.uint64))
+        bounds = [(0, 0)] + [(int(offsets[p][0]), int(offsets[p][1])) for p in positions] + [(rows_count, size)]
+    else:
+        rows_count = -1
+        size = os.path.getsize(collection_path)
+        with open(collection_path, "rb") as dataset:
+            bounds = [(-1, next_line_start(dataset, size * i // parts)) for i in range(parts)] + [(-1, size)]
+        bounds[0] = (0, 0)
+    partitions = []
+    for i in range(parts):
+        (first_row, start), (_, end) = bounds[i], bounds[i + 1]
+        if end > start:
+            # empty partitions (small collections, or long lines) are dropped
+            partitions.append(Partition(len(partitions), start, end, first_row,
+                                        name_template + str(start) + "_" + str(end)))
+    print_log(f"collection split in {len(partitions)} partitions", 2)
+    return partitions, rows_count
+
+
+def save_manifest(partitions, rows_count, collection_path=collection_path_config, path=partition_manifest_path):
+    with open(path, "w") as manifest:
+        manifest.write(collection_path + chunk_line_separator)
+        manifest.write(str(rows_count) + chunk_line_separator)
+        for partition in partitions:
+            manifest.write(partition.to_str() + chunk_line_separator)
+    return path
+
+
+def load_manifest(path=partition_manifest_path):
+    # @ return : collection path, number of rows (-1 if unknown), list of Partition
+    with open(path, "r") as manifest:
+        collection_path = manifest.readline().strip()
+        rows_count = int(manifest.readline().strip())
+        partitions = []
+        for line in manifest:
+            content = line.strip().split(collection_separator)
+            if len(content) == 5:
+                partitions.append(Partition(int(content[0]), int(content[1]), int(content[2]), int(content[3]),
+                                            content[4]))
+    return collection_path, rows_count, partitions
+
+
+def read_partition_lines(partition, collection_path=collection_path_config):
+    # read the lines of a partition
+    # @ return : generator of lines (strings, utf-8)
+    if collection_path.endswith(".gz") and seekable_collection_exists(collection_path):
+        # only the blocks of the partition are decompressed
+        collection = SeekableCollection(collection_path)
+        for line in collection.read_lines(partition.start, partition.end):
+            yield line.decode("utf-8")
+        collection.close()
+        return
+    with open_collection_bytes(collection_path) as dataset:
+        # compressed collections are decompressed up to the start of the partition
+        dataset.seek(partition.start)
+        position = partition.start
+        while position < partition.end:
+            line = dataset.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode("utf-8")
@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+
+from src.config import BM_k_one, BM25_b, scoring_function_config
+
+'''
+Vectorized scoring functions: the weights of a whole posting list are computed at once with numpy.
+Each function gives the same numbers of the scalar ones (weight_tfidf, weight_bm25, ...):
+the operations are the same and in the same order.
+'''
+
+
+def inverse_document_frequency(num_docs, doc_freq):
+    # log ( N of docs in the collection / N of relevant docs )
+    return math.log(num_docs / doc_freq)
+
+
+def log_of_frequencies(freqs):
+    # math.log is applied to the distinct frequencies only (they are few), and then spread to the whole array
+    # this keeps the same rounding of the scalar functions, that could differ by one ulp with np.log
+    values, positions = np.unique(freqs, return_inverse=True)
+    logs = np.array([math.log(value) if value > 0 else 0.0 for value in values.tolist()], dtype=np.float64)
+    return logs[positions.reshape(-1)]
+
+
+def term_weights(scoring, idf, freqs, doc_lengths=None, avg=0):
+    # weight of one token for each document of its posting list
+    # @ param scoring : scoring function name (see scoring_function_config)
+    # @ param idf : IDF of the token
+    # @ param freqs : array of term frequencies
+    # @ param doc_lengths : array of document lengths, aligned with freqs (required by BM11 and BM25)
+    # @ param avg : average of the length of all the documents in the collection
+    # @ return : numpy array of weights (float64)
+    tf = np.asarray(freqs, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if scoring == "TFIDF":
+            weights = (1 + log_of_frequencies(freqs)) * idf
+        elif scoring == "BM15":
+            weights = idf * tf / (tf * BM_k_one)
+        elif scoring == "BM11":
+            doc_len = np.asarray(doc_lengths, dtype=np.float64)
+            weights = idf * tf / (tf + BM_k_one * (doc_len / avg))
+        elif scoring == "BM25":
+            doc_len = np.asarray(doc_lengths, dtype=np.float64)
+            weights = idf * tf / (tf + BM_k_one * (1 - BM25_b + BM25_b * (doc_len / avg)))
+        else:
+            return np.zeros(len(tf), dtype=np.float64)
+    if scoring != "BM15":
+        weights[tf == 0] = 0
+    if scoring in ["BM11", "BM25"]:
+        # this should not happen (trying to score a document not present)
+        weights[doc_len == 0] = 0
+    return weights
+
+
+def block_upper_bounds(freqs, doc_lengths, avg, block_size):
+    # maximum weight in each block of a posting list, for each scoring function (same order of scoring_function_config)
+    # the bounds are computed with IDF = 1 at index time: the query handler multiplies them by the IDF
+    # @ return : numpy matrix (number of blocks x number of scoring functions)
+    block_starts = np.arange(0, len(freqs), block_size)
+    bounds = np.empty((len(block_starts), len(scoring_function_config)), dtype=np.float64)
+    for column, scoring in enumerate(scoring_function_config):
+        bounds[:, column] = np.maximum.reduceat(term_weights(scoring, 1.0, freqs, doc_lengths, avg), block_starts)
+    return bounds
+
+
+def score_upper_bounds(block_bounds):
+    # maximum weight in the whole posting list, for each scoring function
+    return block_bounds.max(axis=0).tolist()
+
+
+def posting_weight(scoring, idf, term_freq, doc_len, avg):
+    # weight of one posting, used by the document-at-a-time algorithms
+    if scoring == "TFIDF":
+        return weight_tfidf(idf, term_freq)
+    elif scoring == "BM11":
+        return weight_bm11(idf, term_freq, avg, doc_len)
+    elif scoring == "BM15":
+        return weight_bm15(idf, term_freq)
+    elif scoring == "BM25":
+        return weight_bm25(idf, term_freq, avg, doc_len)
+    return 0
+
+
+def weight_tfidf(idf, term_freq):
+    # calculate tfidf score for a query
+    # @ param idf : IDF is calculated in outer scope, since it's the same for each term
+    # @ param term_freq : frequency read from posting list
+    if term_freq == 0:
+        return 0
+    '''
+    per tfidf devo calcolare i pesi nella matrice matrice docid * queryterm, con tutti i term della query, con tutti i docid
+     delle posting list di queste 
+    per ogni parola, per ogni documento, calcolo tfidf(parola,documento)
+    se la parola ha count == 0 nel documento, il peso vale zero
+    altrimenti si calcola come:
+    1 + log ( term freq elemento letto dalla posting list) * log ( numero_documenti / numero_documenti_con_queryterm)
+    '''
+    tf = 1 + math.log(term_freq)
+    return tf * idf
+
+
+def weight_bm25(idf, term_freq, avg, doc_len):
+    # calculate bm25 score for a query
+    # @ param docid : docid required to retreive the size of the document
+    # @ param idf : IDF is calculated in outer scope, since it's the same for each term
+    # @ param term_freq : frequency read from posting list
+    # @ param avg : average of the length of all the documents in the collection
+    if term_freq == 0:
+        return 0
+    if doc_len == 0:
+        return 0  # this should not happen (trying to score a document not present)
+    return idf * term_freq / (term_freq + BM_k_one * (1 - BM25_b + BM25_b * (doc_len / avg)))
+
+
+def weight_bm15(idf, term_freq):
+    # calculated like BM25 with BM25_b = 0
+    return idf * term_freq / (term_freq * BM_k_one)
+
+
+def weight_bm11(idf, term_freq, avg, doc_len):
+    # calculated like BM25 with BM25_b = 1
+    if term_freq == 0:
+        return 0
+    if doc_len == 0:
+        return 0  # this should not happen (trying to score a document not present)
+
+    top = idf * term_freq
+    bottom = (term_freq + BM_k_one * (doc_len / avg))
+    return top / bottom
@@ -1,6 +1,7 @@
 import os
 import ast
 import re
+import tarfile
 
 
 from src.config import verbosity_config, output_query_trec_evaluation_file
@@ -17,6 +18,37 @@ def print_log(msg, priority=0):
         print(msg)
 
 
+class TarMemberFile:
+    # binary stream of a member of a tar archive: closing it also closes the archive
+    def __init__(self, tar, member_name):
+        self.tar = tar
+        self.file = tar.extractfile(tar.getmember(member_name))
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, ... of the member
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.tar.close()
+
+
+def open_collection_bytes(collection_path):
+    # open the (uncompressed) collection as a binary stream: byte offsets are the same for every reader
+    if collection_path.endswith(".gz"):
+        return TarMemberFile(tarfile.open(collection_path, "r:gz"), "collection.tsv")
+    return open(collection_path, "rb")
+
+
 def readline_with_strip(file):
     string = file.readline().strip()
     return string
@@ -316,13 +348,11 @@ def read_file_to_dict(file_path, separator=',', output_type="mix"):
     return file_data
 
 
-def find_missing_contents(ranges):
+def find_missing_contents(ranges, max_value=8841822):
+    # @ param max_value : last docid of the collection (default: MSMARCO passages)
     # Order and merge the intervals
     merged_ranges = merge_ranges(ranges)
 
-    # documents in the collection
-    max_value = 8841822 # last docid
-
     missing_numbers = []
     current = 0
 
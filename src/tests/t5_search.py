@@ -28,7 +28,8 @@ def test_search(words_list, file_search_algorithm):
 
     # TEST QUERY
 
-    res = query_handler.query(words_list, search_file_algorithms=file_search_algorithm)
+    # no query result cache: the same queries are repeated with each search algorithm
+    res = query_handler.query(words_list, search_file_algorithms=file_search_algorithm, use_cache=False)
 
     toc = time.perf_counter()
     print(" -- Query completed in " + str(toc - tic) + "ms-- ")
@@ -1,5 +1,6 @@
 from src.config import *
 import time
+from src.modules.compression import encode_posting_blocks, decode_posting_blocks
 from src.modules.InvertedIndex import index_setup, load_from_disk
 from src.modules.QueryHandler import QueryHandler
 
@@ -16,6 +17,39 @@ def test_index(index_name, flags, compression):
     return QueryHandler(test_index_element)
 
 
+def test_round_trip(name, docids, freqs, block_size=posting_block_size, compressions=compression_choices_config):
+    # encode and decode a posting list with every compression, printing the ones that don't give back the same list
+    failed = 0
+    for compression in compressions:
+        encoded = encode_posting_blocks(docids, freqs, compression, block_size)
+        decoded_docids, decoded_freqs = decode_posting_blocks(encoded, compression)
+        if decoded_docids.tolist() != list(docids) or decoded_freqs.tolist() != list(freqs):
+            print("round trip FAILED: " + name + " with " + compression)
+            print(decoded_docids[:10])
+            failed += 1
+    print("round trip " + name + ": " + ("ok" if failed == 0 else str(failed) + " errors"))
+
+
+# the first docid of the collection is 0: the first gap of the list is zero
+test_round_trip("first docid 0", [0, 3, 7], [1, 1, 1])
+test_round_trip("single docid 0", [0], [5])
+# block boundaries: one posting less, exactly one block, one posting more (the gaps continue from the previous block)
+for size in [posting_block_size - 1, posting_block_size, posting_block_size + 1, 3 * posting_block_size]:
+    test_round_trip(f"{size} postings", list(range(0, 2 * size, 2)), [1 + i % 3 for i in range(size)])
+# vbyte: numbers of 1, 2, 3, 4 and 5 bytes (7 bits each), and the biggest uint32 docid
+# unary is skipped with big numbers: the code of n is n bits long
+big_numbers_compressions = [compression for compression in compression_choices_config if compression != "unary"]
+test_round_trip("large values", [1, 127, 128, 16383, 16384, 2 ** 21, 2 ** 28, 2 ** 32 - 2],
+                [1, 127, 128, 300, 16384, 2 ** 21, 2 ** 28, 2 ** 31], compressions=big_numbers_compressions)
+# pfor: a frame of small gaps with a few big ones (exceptions), and a frame where every gap is an exception
+small_gaps = [1 + i % 4 for i in range(posting_block_size)]
+for position in [5, 60, 127]:
+    small_gaps[position] = 100000 + position
+test_round_trip("pfor exceptions", [sum(small_gaps[:i + 1]) for i in range(posting_block_size)],
+                [70000 if i % 50 == 0 else 2 for i in range(posting_block_size)], compressions=big_numbers_compressions)
+test_round_trip("pfor all exceptions", [i * 1000003 for i in range(1, 40)], [1] * 39,
+                compressions=big_numbers_compressions)
+
 # gamma compression contains unary compression, so it's like testing both at the same time
 config = [300, query_processing_algorithm_config[0], scoring_function_config[0], 15, False, True]
 